@@ -0,0 +1,87 @@
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import Blob
+from app.storage import StagedBlob, storage_client
+
+
+def reference_blob(db: Session, digest: str) -> Optional[Blob]:
+    result = db.execute(
+        update(Blob)
+        .where(Blob.sha256 == digest)
+        .values(ref_count=Blob.ref_count + 1)
+    )
+    db.commit()
+    if not result.rowcount:
+        return None
+    return db.get(Blob, digest, populate_existing=True)
+
+
+def _register_blob(db: Session, digest: str, storage_uri: str, size: int) -> Blob:
+    blob = Blob(
+        sha256=digest,
+        storage_uri=storage_uri,
+        size=size,
+        ref_count=1,
+        created_at=datetime.utcnow(),
+    )
+    db.add(blob)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        existing = reference_blob(db, digest)
+        if existing is None:
+            raise
+        return existing
+    db.refresh(blob)
+    return blob
+
+
+def store_stream(db: Session, stream: BinaryIO) -> Blob:
+    found = {}
+
+    def known(digest: str) -> bool:
+        found["blob"] = reference_blob(db, digest)
+        return found["blob"] is not None
+
+    staged = storage_client.stage(stream, known=known)
+    if staged.location is None:
+        return found["blob"]
+    return adopt_staged(db, staged)
+
+
+def adopt_staged(db: Session, staged: StagedBlob) -> Blob:
+    existing = reference_blob(db, staged.digest)
+    if existing is not None:
+        storage_client.discard(staged)
+        return existing
+    storage_uri = storage_client.commit(staged)
+    return _register_blob(db, staged.digest, storage_uri, staged.size)
+
+
+def store_staged_file(db: Session, path: Path, digest: str, size: int) -> Blob:
+    existing = reference_blob(db, digest)
+    if existing is not None:
+        path.unlink()
+        return existing
+    storage_uri = storage_client.store_file(path, digest)
+    return _register_blob(db, digest, storage_uri, size)
+
+
+def release_blob(db: Session, digest: str) -> None:
+    db.execute(
+        update(Blob).where(Blob.sha256 == digest).values(ref_count=Blob.ref_count - 1)
+    )
+    blob = db.get(Blob, digest, populate_existing=True)
+    if blob is not None and blob.ref_count <= 0:
+        # Remove the object before the row so a concurrent upload of the same
+        # digest either sees the live blob or registers a fresh one.
+        storage_client.delete(blob.storage_uri)
+        db.execute(delete(Blob).where(Blob.sha256 == digest))
+    db.commit()
@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, Optional
+
+from app.config import settings
+
+# Every uvicorn and Celery worker shares the cache directory. A fill writes
+# its own partial file as bytes arrive, so one left untouched this long was
+# abandoned by a process that died.
+STALE_PARTIAL_AGE = 3600.0
+
+
+class _Fill:
+    def __init__(self, partial_path: Path):
+        self.partial_path = partial_path
+        self.written = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+
+
+class BlobCache:
+    def __init__(self, path: str, max_bytes: int, chunk_size: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._fills: Dict[str, _Fill] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def _entries(self) -> "OrderedDict[str, int]":
+        # Scanned on first use (always under _lock) rather than at import.
+        if self._index is None:
+            self._index = self._load()
+        return self._index
+
+    def _load(self) -> "OrderedDict[str, int]":
+        entries: "OrderedDict[str, int]" = OrderedDict()
+        if not self.path.is_dir():
+            return entries
+        files = []
+        stale = time.time() - STALE_PARTIAL_AGE
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".partial"):
+                # Fills of other live workers are left alone.
+                ours = entry.name.endswith(f".{os.getpid()}.partial")
+                try:
+                    if ours or entry.stat().st_mtime < stale:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_atime, entry.name, stat.st_size))
+        for _, key, size in sorted(files):
+            entries[key] = size
+            self._bytes += size
+        return entries
+
+    def accepts(self, size: Optional[int]) -> bool:
+        return self.max_bytes > 0 and size is not None and size <= self.max_bytes
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return self._present(key)
+
+    def _present(self, key: str) -> bool:
+        # Another worker may have evicted the file behind this index.
+        size = self._entries.get(key)
+        if size is None:
+            return False
+        if (self.path / key).exists():
+            return True
+        self._forget(key, size)
+        return False
+
+    def _forget(self, key: str, size: int) -> None:
+        del self._entries[key]
+        self._bytes -= size
+
+    def _open_entry(self, key: str) -> Optional[BinaryIO]:
+        size = self._entries.get(key)
+        if size is None:
+            return None
+        try:
+            handle = open(self.path / key, "rb")
+        except FileNotFoundError:
+            # Evicted by another worker: a miss, filled again below.
+            self._forget(key, size)
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return handle
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "filling": len(self._fills),
+            }
+
+    def iter_range(
+        self,
+        key: str,
+        fetch: Callable[[], Iterable[bytes]],
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> Iterator[bytes]:
+        with self._lock:
+            handle = self._open_entry(key)
+            if handle is not None:
+                fill = None
+            else:
+                fill = self._fills.get(key)
+                if fill is not None:
+                    self.coalesced += 1
+                else:
+                    self.misses += 1
+                    fill = self._start_fill(key, fetch)
+                handle = open(fill.partial_path, "rb")
+        return self._read(handle, fill, start, end)
+
+    def warm(self, key: str, fetch: Callable[[], Iterable[bytes]]) -> None:
+        with self._lock:
+            if self._present(key) or key in self._fills:
+                return
+            self.misses += 1
+            self._start_fill(key, fetch)
+
+    def _start_fill(self, key: str, fetch: Callable[[], Iterable[bytes]]) -> _Fill:
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Named per process, so workers filling the same blob never share one.
+        fill = _Fill(self.path / f"{key}.{os.getpid()}.partial")
+        fill.partial_path.touch()
+        self._fills[key] = fill
+        thread = threading.Thread(
+            target=self._run_fill, args=(key, fetch, fill), daemon=True
+        )
+        thread.start()
+        return fill
+
+    def _run_fill(self, key: str, fetch, fill: _Fill) -> None:
+        try:
+            with fill.partial_path.open("r+b") as handle:
+                for chunk in fetch():
+                    handle.write(chunk)
+                    handle.flush()
+                    with fill.condition:
+                        fill.written += len(chunk)
+                        fill.condition.notify_all()
+            with self._lock:
+                os.replace(fill.partial_path, self.path / key)
+                self._entries[key] = fill.written
+                self._bytes += fill.written
+                del self._fills[key]
+                self._evict()
+        except BaseException as exc:
+            with self._lock:
+                self._fills.pop(key, None)
+                if fill.partial_path.exists():
+                    fill.partial_path.unlink()
+            with fill.condition:
+                fill.error = exc
+        finally:
+            with fill.condition:
+                fill.done = True
+                fill.condition.notify_all()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            try:
+                os.unlink(self.path / key)
+            except FileNotFoundError:
+                pass
+            self._bytes -= size
+            self.evictions += 1
+
+    def _read(
+        self, handle, fill: Optional[_Fill], start: int, end: Optional[int]
+    ) -> Iterator[bytes]:
+        with handle:
+            position = start
+            while end is None or position <= end:
+                if fill is None:
+                    available = None
+                else:
+                    with fill.condition:
+                        while fill.written <= position and not fill.done:
+                            fill.condition.wait()
+                        if fill.error is not None:
+                            raise RuntimeError("Cache fill failed.") from fill.error
+                        available = fill.written
+                        if fill.done and fill.written <= position:
+                            break
+                size = self.chunk_size
+                if end is not None:
+                    size = min(size, end - position + 1)
+                if available is not None:
+                    size = min(size, available - position)
+                handle.seek(position)
+                chunk = handle.read(size)
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+
+
+blob_cache = BlobCache(
+    settings.blob_cache_path, settings.blob_cache_max_bytes, settings.download_chunk_size
+)
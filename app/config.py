@@ -6,21 +6,82 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     app_env: str = "dev"
     database_url: str = "sqlite:///./image_hub.db"
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_busy_timeout_ms: int = 30000
+    sqlite_cache_size_kb: int = 64 * 1024
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_statement_timeout_ms: int = 30000
+    db_migrate_on_startup: bool = True
 
     storage_backend: str = "local"
     local_storage_path: str = "./data/images"
+    upload_chunk_size: int = 1024 * 1024
+    upload_lease_seconds: float = 300.0
+    upload_session_ttl: float = 86400.0
+    download_chunk_size: int = 4 * 1024 * 1024
+    download_max_bandwidth: int = 0
+    download_client_bandwidth: int = 0
+    download_max_concurrency: int = 0
+    download_client_concurrency: int = 0
+    blob_cache_path: str = "./data/cache"
+    blob_cache_max_bytes: int = 20 * 1024 * 1024 * 1024
 
     s3_bucket: Optional[str] = None
     s3_region: Optional[str] = None
     s3_endpoint_url: Optional[str] = None
     s3_access_key_id: Optional[str] = None
     s3_secret_access_key: Optional[str] = None
+    s3_multipart_part_size: int = 64 * 1024 * 1024
+    s3_multipart_concurrency: int = 4
+    s3_multipart_max_retries: int = 3
+    s3_presign_imports: bool = False
+    s3_presign_min_expiry: int = 900
+    s3_presign_min_bandwidth: int = 1024 * 1024
+    # Seconds before a PC that could not reach the store is offered it again.
+    s3_direct_retry_ttl: float = 86400.0
+    s3_stale_upload_age: int = 24 * 3600
 
     pc_default_username: Optional[str] = None
     pc_default_password: Optional[str] = None
     pc_validate_connection: bool = True
     pc_validate_hub_source: bool = True
     hub_base_url: str = "http://localhost:8000"
+    hub_role: str = "hub"
+    edge_upstream_url: Optional[str] = None
+    pc_request_timeout: float = 20.0
+    pc_max_connections: int = 10
+    pc_max_keepalive_connections: int = 10
+    pc_keepalive_expiry: float = 60.0
+    pc_http2: bool = True
+    pc_task_poll_min_interval: float = 1.0
+    pc_task_poll_max_interval: float = 30.0
+    pc_task_timeout: float = 3600.0
+    # Failed polls in a row before a PC's task watches give up.
+    pc_task_poll_retries: int = 5
+    # Seconds a task watch holds its job between heartbeats; a job whose watch
+    # missed it is watched again by another process.
+    pc_task_watch_lease: float = 60.0
+    pc_health_interval: float = 60.0
+    pc_health_ttl: float = 300.0
+    pc_health_concurrency: int = 8
+    pc_hub_probe_ttl: float = 86400.0
+
+    publish_parallelism: int = 16
+    publish_max_active_imports: int = 32
+    # Running imports per PC; a PC's own max_in_flight overrides it. 0 = no cap.
+    sync_pc_max_in_flight: int = 4
+    # Seconds a job may stay queued before it counts as never dispatched.
+    sync_dispatch_timeout: float = 300.0
+    job_events_poll_interval: float = 5.0
+    # Days to keep the events of finished jobs; 0 keeps them forever.
+    job_events_retention_days: int = 30
+    # Seconds between housekeeping sweeps (app/maintenance.py); 0 disables them.
+    maintenance_interval: float = 3600.0
 
     celery_broker_url: Optional[str] = None
     celery_result_backend: Optional[str] = None
@@ -1,34 +1,78 @@
-from sqlalchemy import create_engine, event, text
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from app.config import settings
+from app.metrics import count_queries
 
-connect_args = {}
-if settings.database_url.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
 
-engine = create_engine(settings.database_url, connect_args=connect_args, future=True)
+def _engine_options(url: str) -> dict:
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        return {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": settings.sqlite_busy_timeout_ms / 1000,
+            }
+        }
+    options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        # Drops connections the server or a proxy closed while idle in the pool
+        # instead of failing the next request on them.
+        "pool_pre_ping": True,
+    }
+    if backend == "postgresql" and settings.db_statement_timeout_ms > 0:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={settings.db_statement_timeout_ms}"
+        }
+    return options
+
+
+def _sqlite_pragmas(url: str) -> list:
+    pragmas = [
+        "PRAGMA foreign_keys=ON",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        # Negative cache_size is in KiB rather than pages.
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kb}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    database = make_url(url).database
+    if database and database != ":memory:":
+        # WAL lets API reads run alongside a worker's write instead of
+        # queueing behind it; the mode sticks to the database file.
+        pragmas.insert(0, f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    return pragmas
+
+
+engine = create_engine(
+    settings.database_url, future=True, **_engine_options(settings.database_url)
+)
+count_queries(engine)
+
+if engine.dialect.name == "sqlite":
+    SQLITE_PRAGMAS = _sqlite_pragmas(settings.database_url)
 
-if settings.database_url.startswith("sqlite"):
     @event.listens_for(engine, "connect")
     def _set_sqlite_pragma(dbapi_connection, _):
         cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON")
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
         cursor.close()
 
 
-def ensure_sqlite_columns():
-    if not settings.database_url.startswith("sqlite"):
-        return
-    with engine.begin() as connection:
-        result = connection.execute(text("PRAGMA table_info(prism_centrals)"))
-        columns = {row[1] for row in result}
-        if "connected" not in columns:
-            connection.execute(text("ALTER TABLE prism_centrals ADD COLUMN connected BOOLEAN"))
-        if "last_checked_at" not in columns:
-            connection.execute(
-                text("ALTER TABLE prism_centrals ADD COLUMN last_checked_at DATETIME")
-            )
+def insert_or_ignore(table):
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
+
+
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
 
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+from app.config import settings
+from app.db import SessionLocal
+from app.scheduler import next_jobs, requeue_stale_jobs
+from app.tasks import run_sync_job
+
+
+class SyncJobDispatcher:
+    def __init__(self, max_workers: int):
+        self.max_workers = max(max_workers, 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="sync-job"
+                )
+            return self._executor
+
+    def dispatch(self, job_ids: Iterable[int]) -> List[Future]:
+        # job_ids are newly queued jobs; the scheduler weighs them against the
+        # jobs already waiting and hands out only what can start now, so one
+        # PC's backlog never fills the workers.
+        db = SessionLocal()
+        try:
+            job_ids = next_jobs(db, job_ids)
+        finally:
+            db.close()
+        if not job_ids:
+            return []
+        if settings.celery_broker_url:
+            # Celery is imported only by deployments that use it.
+            from celery import group
+
+            from app.worker import run_sync_job_task
+
+            # A group publishes every message over one producer connection
+            # instead of a broker round-trip per job.
+            group(run_sync_job_task.s(job_id) for job_id in job_ids).apply_async()
+            return []
+        return [self.executor.submit(run_sync_job, job_id) for job_id in job_ids]
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+dispatcher = SyncJobDispatcher(settings.publish_parallelism)
+
+
+def recover_stale_jobs() -> int:
+    # Run at startup and by maintenance: jobs orphaned by a crash or a lost
+    # broker message are queued and scheduled again.
+    db = SessionLocal()
+    try:
+        job_ids = requeue_stale_jobs(db)
+        db.commit()
+    finally:
+        db.close()
+    if job_ids:
+        dispatcher.dispatch([])
+    return len(job_ids)
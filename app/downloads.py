@@ -0,0 +1,297 @@
+import os
+import uuid
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Receive, Scope, Send
+
+from app.cache import blob_cache
+from app.models import Image
+from app.storage import storage_client
+from app.throttle import download_scheduler
+
+MAX_RANGES = 32
+MEDIA_TYPE = "application/octet-stream"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class LocalFileResponse(Response):
+    # Servers that implement the ASGI zero-copy extension are handed the file
+    # and send it with sendfile(); elsewhere the range goes out in large
+    # pread() chunks read off the event loop.
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        length: int,
+        client_key: str,
+        image: str,
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+    ):
+        super().__init__(status_code=status_code, headers=headers, media_type=MEDIA_TYPE)
+        self.path = path
+        self.start = start
+        self.length = length
+        self.client_key = client_key
+        self.image = image
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        chunk_size = storage_client.read_size
+        transfer_slot = download_scheduler.transfer(self.client_key, self.image)
+        async with transfer_slot as transfer:
+            handle = await run_in_threadpool(open, self.path, "rb")
+            try:
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": self.status_code,
+                        "headers": self.raw_headers,
+                    }
+                )
+                offset, remaining = self.start, self.length
+                while remaining > 0:
+                    size = min(chunk_size, remaining)
+                    if zerocopy:
+                        await transfer.pace(size)
+                        await send(
+                            {
+                                "type": "http.response.zerocopysend",
+                                "file": handle,
+                                "offset": offset,
+                                "count": size,
+                                "more_body": True,
+                            }
+                        )
+                    else:
+                        chunk = await run_in_threadpool(
+                            os.pread, handle.fileno(), size, offset
+                        )
+                        if not chunk:
+                            break
+                        size = len(chunk)
+                        await transfer.pace(size)
+                        await send(
+                            {"type": "http.response.body", "body": chunk, "more_body": True}
+                        )
+                    offset += size
+                    remaining -= size
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            finally:
+                handle.close()
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges: List[Tuple[int, int]] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_text, sep, end_text = part.partition("-")
+        if not sep:
+            return None
+        start_text, end_text = start_text.strip(), end_text.strip()
+        try:
+            if not start_text:
+                suffix = int(end_text)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(start_text)
+                end = int(end_text) if end_text else max(start, size - 1)
+        except ValueError:
+            return None
+        if start < 0 or end < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def image_etag(image: Image) -> Optional[str]:
+    if not image.sha256 or image.sha256 == "pending":
+        return None
+    return f'"{image.sha256}"'
+
+
+def _etag_matches(header: str, etag: Optional[str], weak: bool) -> bool:
+    if etag is None:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if weak and candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def download_headers(image: Image, filename: str) -> dict:
+    headers = {
+        "Content-Disposition": f'attachment; filename="{image.filename or filename}"',
+        "Accept-Ranges": "bytes",
+    }
+    etag = image_etag(image)
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def check_preconditions(
+    request: Request, image: Image, headers: dict
+) -> Optional[Response]:
+    etag = image_etag(image)
+    if_match = request.headers.get("if-match")
+    if if_match and not _etag_matches(if_match, etag, weak=False):
+        return Response(status_code=412, headers=headers)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag, weak=True):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def _iter_range(
+    image: Image, size: Optional[int], start: int = 0, end: Optional[int] = None
+) -> Iterator[bytes]:
+    uri = image.storage_uri
+    if storage_client.is_remote(uri) and blob_cache.accepts(size) and image_etag(image):
+        return blob_cache.iter_range(
+            image.sha256, lambda: storage_client.iter_range(uri), start, end
+        )
+    return storage_client.iter_range(uri, start, end)
+
+
+def warm_image(image: Image) -> bool:
+    uri = image.storage_uri
+    if not storage_client.is_remote(uri) or not image_etag(image):
+        return False
+    _, size = storage_client.stat(uri)
+    if not blob_cache.accepts(size):
+        return False
+    blob_cache.warm(image.sha256, lambda: storage_client.iter_range(uri))
+    return True
+
+
+def _multipart_body(
+    image: Image, ranges: List[Tuple[int, int]], size: int, boundary: str
+) -> Iterator[bytes]:
+    for start, end in ranges:
+        yield _part_header(boundary, start, end, size)
+        yield from _iter_range(image, size, start, end)
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+def _part_header(boundary: str, start: int, end: int, size: int) -> bytes:
+    return (
+        f"--{boundary}\r\n"
+        f"Content-Type: {MEDIA_TYPE}\r\n"
+        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+    ).encode()
+
+
+def _client_key(request: Request) -> str:
+    # PCs pull from their own address, so the peer host is the per-PC key.
+    return request.client.host if request.client else "unknown"
+
+
+def build_download_response(request: Request, image: Image) -> Response:
+    filename, size = storage_client.stat(image.storage_uri)
+    headers = download_headers(image, filename)
+    not_modified = check_preconditions(request, image, headers)
+    if not_modified is not None:
+        return not_modified
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() != image_etag(image):
+        range_header = None
+
+    ranges = None
+    if range_header and size is not None:
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    local = not storage_client.is_remote(image.storage_uri)
+    key = _client_key(request)
+    if not ranges:
+        if size is not None:
+            headers["Content-Length"] = str(size)
+        if local:
+            return LocalFileResponse(
+                image.storage_uri, 0, size, key, image.sha256, headers=headers
+            )
+        return StreamingResponse(
+            download_scheduler.stream(key, _iter_range(image, size), image.sha256),
+            media_type=MEDIA_TYPE,
+            headers=headers,
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if local:
+            return LocalFileResponse(
+                image.storage_uri,
+                start,
+                end - start + 1,
+                key,
+                image.sha256,
+                status_code=206,
+                headers=headers,
+            )
+        return StreamingResponse(
+            download_scheduler.stream(
+                key, _iter_range(image, size, start, end), image.sha256
+            ),
+            status_code=206,
+            media_type=MEDIA_TYPE,
+            headers=headers,
+        )
+
+    boundary = uuid.uuid4().hex
+    length = sum(
+        len(_part_header(boundary, start, end, size)) + (end - start + 1) + 2
+        for start, end in ranges
+    ) + len(f"--{boundary}--\r\n")
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(
+        download_scheduler.stream(
+            key, _multipart_body(image, ranges, size, boundary), image.sha256
+        ),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
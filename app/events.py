@@ -0,0 +1,180 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Image, PrismCentral, SyncJob, SyncJobEvent
+
+EVENT_BATCH_SIZE = 500
+
+
+class JobEventBus:
+    # Wakes in-process streams as soon as a commit records job events. Streams
+    # still re-read the table every job_events_poll_interval so events written
+    # by Celery workers in other processes are delivered too.
+    def __init__(self):
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._lock = threading.Lock()
+
+    def notify(self) -> None:
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, wake in waiters:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass
+
+    async def wait(self, timeout: float) -> None:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+job_events = JobEventBus()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _notify_after_commit(db: Session) -> None:
+    if db.info.pop("job_events", False):
+        job_events.notify()
+
+
+def record_job_event(db: Session, job: SyncJob, progress: Optional[int] = None) -> None:
+    db.add(
+        SyncJobEvent(
+            job_id=job.id,
+            status=job.status,
+            progress=progress,
+            created_at=datetime.utcnow(),
+        )
+    )
+    db.info["job_events"] = True
+
+
+def record_job_events(db: Session, job_ids: List[int], status: str) -> None:
+    if not job_ids:
+        return
+    now = datetime.utcnow()
+    db.execute(
+        insert(SyncJobEvent.__table__),
+        [{"job_id": job_id, "status": status, "created_at": now} for job_id in job_ids],
+    )
+    db.info["job_events"] = True
+
+
+def record_job_progress(job_id: int, progress: Optional[int]) -> None:
+    db: Session = SessionLocal()
+    try:
+        job = db.query(SyncJob).filter(SyncJob.id == job_id).first()
+        if job is None or job.status != "running":
+            return
+        # Progress doubles as a heartbeat, so a long import is never taken
+        # for a stale job.
+        job.updated_at = datetime.utcnow()
+        record_job_event(db, job, progress)
+        db.commit()
+    finally:
+        db.close()
+
+
+def prune_job_events() -> int:
+    # Jobs that finished more than job_events_retention_days ago lose their
+    # events; the job row keeps its final status. Streams only replay recent
+    # ids, so nothing still reads them.
+    if settings.job_events_retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=settings.job_events_retention_days)
+    finished = select(SyncJob.id).where(
+        SyncJob.status.in_(("completed", "failed")), SyncJob.updated_at < cutoff
+    )
+    db: Session = SessionLocal()
+    try:
+        result = db.execute(
+            delete(SyncJobEvent)
+            .where(SyncJobEvent.job_id.in_(finished))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def latest_event_id(db: Session) -> int:
+    return db.query(func.max(SyncJobEvent.id)).scalar() or 0
+
+
+def fetch_job_events(after: int, limit: int = EVENT_BATCH_SIZE) -> List[dict]:
+    db: Session = SessionLocal()
+    try:
+        rows = (
+            db.query(
+                SyncJobEvent.id,
+                SyncJobEvent.job_id,
+                SyncJobEvent.status,
+                SyncJobEvent.progress,
+                SyncJobEvent.created_at,
+                SyncJob.image_id,
+                SyncJob.pc_id,
+                Image.name.label("image_name"),
+                PrismCentral.name.label("pc_name"),
+            )
+            .join(SyncJob, SyncJob.id == SyncJobEvent.job_id)
+            .outerjoin(Image, Image.id == SyncJob.image_id)
+            .outerjoin(PrismCentral, PrismCentral.id == SyncJob.pc_id)
+            .filter(SyncJobEvent.id > after)
+            .order_by(SyncJobEvent.id)
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+    return [
+        {
+            "id": row.id,
+            "job_id": row.job_id,
+            "status": row.status,
+            "progress": row.progress,
+            "image_id": row.image_id,
+            "image_name": row.image_name,
+            "pc_id": row.pc_id,
+            "pc_name": row.pc_name,
+            "at": row.created_at.isoformat() if row.created_at else None,
+        }
+        for row in rows
+    ]
+
+
+def format_event(payload: dict) -> str:
+    return f"id: {payload['id']}\nevent: job\ndata: {json.dumps(payload)}\n\n"
+
+
+async def stream_job_events(
+    after: int, disconnected, poll_interval: Optional[float] = None
+) -> AsyncIterator[str]:
+    interval = poll_interval or settings.job_events_poll_interval
+    loop = asyncio.get_running_loop()
+    yield "retry: 3000\n\n"
+    while not await disconnected():
+        events = await loop.run_in_executor(None, fetch_job_events, after)
+        for payload in events:
+            after = payload["id"]
+            yield format_event(payload)
+        if events:
+            continue
+        yield ": keepalive\n\n"
+        await job_events.wait(interval)
@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Set
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import PrismCentral
+from app.prism import AsyncPrismClient, PCTarget, PrismRuntime, prism_runtime
+
+
+class HealthProbe(NamedTuple):
+    pc_id: int
+    target: PCTarget
+    check_hub_source: bool
+
+
+class HealthMonitor:
+    # Probes run on the Prism runtime loop; database reads and writes go to the
+    # default executor so the loop never blocks on SQLite.
+    def __init__(self, runtime: PrismRuntime):
+        self.runtime = runtime
+        self.interval = settings.pc_health_interval
+        self.ttl = settings.pc_health_ttl
+        self.hub_ttl = settings.pc_hub_probe_ttl
+        self.concurrency = max(settings.pc_health_concurrency, 1)
+        self.probes = 0
+        self.hub_probes = 0
+        self._requested: Set[int] = set()
+        self._periodic = False
+        self._wake: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.runtime.submit(self._ensure_running(periodic=True))
+
+    def check_now(self, pc_id: int) -> None:
+        async def request() -> None:
+            self._requested.add(pc_id)
+            await self._ensure_running()
+
+        self.runtime.submit(request())
+
+    def stop(self) -> None:
+        async def stop() -> None:
+            self._periodic = False
+            if self._runner is not None:
+                self._runner.cancel()
+                self._runner = None
+
+        self.runtime.submit(stop()).result()
+
+    async def _ensure_running(self, periodic: bool = False) -> None:
+        self._periodic = self._periodic or periodic
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._wake.set()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            self._wake.clear()
+            requested, self._requested = self._requested, set()
+            probes = await loop.run_in_executor(
+                None, self._due_probes, requested, self._periodic
+            )
+            await asyncio.gather(*(self._probe(probe, semaphore) for probe in probes))
+            if self._requested:
+                continue
+            if not self._periodic:
+                return
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _due_probes(self, requested: Set[int], periodic: bool) -> List[HealthProbe]:
+        now = datetime.utcnow()
+        db: Session = SessionLocal()
+        try:
+            query = db.query(PrismCentral)
+            stale = or_(
+                PrismCentral.last_checked_at.is_(None),
+                PrismCentral.last_checked_at < now - timedelta(seconds=self.ttl),
+            )
+            if periodic and requested:
+                query = query.filter(or_(PrismCentral.id.in_(requested), stale))
+            elif periodic:
+                query = query.filter(stale)
+            elif requested:
+                query = query.filter(PrismCentral.id.in_(requested))
+            else:
+                return []
+            hub_cutoff = now - timedelta(seconds=self.hub_ttl)
+            return [
+                HealthProbe(
+                    pc.id,
+                    PCTarget.from_pc(pc),
+                    settings.pc_validate_hub_source
+                    and (pc.hub_checked_at is None or pc.hub_checked_at < hub_cutoff),
+                )
+                for pc in query.all()
+            ]
+        finally:
+            db.close()
+
+    async def _probe(self, probe: HealthProbe, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            self.probes += 1
+            if probe.check_hub_source:
+                self.hub_probes += 1
+            error = None
+            try:
+                await AsyncPrismClient(probe.target, self.runtime).ping(
+                    check_hub_source=probe.check_hub_source
+                )
+            except Exception as exc:
+                error = exc
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._record, probe, error)
+
+    def _record(self, probe: HealthProbe, error: Optional[BaseException]) -> None:
+        now = datetime.utcnow()
+        db: Session = SessionLocal()
+        try:
+            pc = db.query(PrismCentral).filter(PrismCentral.id == probe.pc_id).first()
+            if pc is None:
+                return
+            pc.connected = error is None
+            pc.last_checked_at = now
+            pc.health_status = "healthy" if error is None else "unreachable"
+            pc.health_detail = None if error is None else str(error)
+            if error is None and probe.check_hub_source:
+                pc.hub_checked_at = now
+            db.commit()
+        finally:
+            db.close()
+
+
+health_monitor = HealthMonitor(prism_runtime)
@@ -1,43 +1,220 @@
+from contextlib import asynccontextmanager
 from datetime import datetime
 import os
+import uuid
 from typing import List, Optional
 
-from fastapi import Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
+import httpx
+from fastapi import (
+    Depends,
+    FastAPI,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
 from fastapi.responses import PlainTextResponse
-from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+from app import metrics
+from app.blobs import release_blob, store_staged_file, store_stream
+from app.cache import blob_cache
 from app.config import settings
-from app.db import Base, engine, ensure_sqlite_columns, get_db
-from app.models import Image, PrismCentral, SyncJob
+from app.db import engine, get_db
+from app.dispatch import dispatcher, recover_stale_jobs
+from app.downloads import (
+    build_download_response,
+    check_preconditions,
+    download_headers,
+    warm_image,
+)
+from app.events import latest_event_id, stream_job_events
+from app.health import health_monitor
+from app.maintenance import maintenance
+from app.migrations import migrate
+from app.models import Blob, Image, PrismCentral, SyncJob, UploadSession
+from app.pagination import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    next_page_url,
+    paginate,
+    set_page_headers,
+)
+from app.publishing import PublishResult, create_sync_jobs
+from app.replicas import (
+    blob_image,
+    edge_replica,
+    image_replica_targets,
+    is_edge,
+    job_replica_targets,
+    warm_replicas,
+)
+from app.scheduler import queue_depths
 from app.schemas import (
+    BatchPublishRequest,
     ImageRead,
     PrismCentralCreate,
     PrismCentralRead,
+    PublishRequest,
     SyncJobRead,
+    UploadSessionCreate,
+    UploadSessionRead,
 )
 from app.storage import storage_client
-from app.tasks import run_sync_job
-from app.prism import PrismClient
-
-Base.metadata.create_all(bind=engine)
-ensure_sqlite_columns()
-
-app = FastAPI(title="Image Hub", version="0.1.0")
+from app.tasks import resume_task_watches
+from app.throttle import download_scheduler
+from app.uploads import ACTIVE_STATUSES, upload_sessions
+from app.views import image_rows, pc_rows, task_rows
+from app.prism import prism_runtime
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Schema work happens at startup (or via python -m app.migrations), never
+    # at import, so workers and tools that import the app stay fast.
+    if settings.db_migrate_on_startup:
+        await run_in_threadpool(migrate)
+    await run_in_threadpool(recover_stale_jobs)
+    await run_in_threadpool(resume_task_watches)
+    if settings.pc_validate_connection and settings.pc_health_interval > 0:
+        health_monitor.start()
+    if settings.maintenance_interval > 0:
+        maintenance.start()
+    yield
+    if settings.maintenance_interval > 0:
+        maintenance.stop()
+    if settings.pc_validate_connection and settings.pc_health_interval > 0:
+        health_monitor.stop()
+
+
+app = FastAPI(title="Image Hub", version="0.1.0", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+IMAGE_SORTS = {"id": Image.id, "name": Image.name, "created_at": Image.created_at}
+PC_SORTS = {
+    "id": PrismCentral.id,
+    "name": PrismCentral.name,
+    "created_at": PrismCentral.created_at,
+}
+JOB_SORTS = {
+    "id": SyncJob.id,
+    "created_at": SyncJob.created_at,
+    "updated_at": SyncJob.updated_at,
+}
+UI_PAGE_SIZE = 50
+
 ASSET_DIR = "/Users/ayush.srivastava/.cursor/projects/Users-ayush-srivastava-Desktop-temp/assets"
 if os.path.isdir(ASSET_DIR):
     app.mount("/assets", StaticFiles(directory=ASSET_DIR), name="assets")
 
 
+def _upload_is_empty(file: UploadFile) -> bool:
+    file.file.seek(0, os.SEEK_END)
+    empty = file.file.tell() == 0
+    file.file.seek(0)
+    return empty
+
+
+def _create_image(
+    db: Session,
+    blob: Blob,
+    name: str,
+    version: str,
+    source: Optional[str],
+    filename: str,
+) -> Image:
+    image = Image(
+        name=name,
+        version=version,
+        source=source,
+        filename=os.path.basename(filename),
+        sha256=blob.sha256,
+        storage_uri=blob.storage_uri,
+        approved=False,
+    )
+    db.add(image)
+    db.commit()
+    db.refresh(image)
+    return image
+
+
+def _image_query(
+    db: Session,
+    name: Optional[str] = None,
+    version: Optional[str] = None,
+    approved: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+):
+    query = db.query(Image)
+    if name is not None:
+        query = query.filter(Image.name == name)
+    if version is not None:
+        query = query.filter(Image.version == version)
+    if approved is not None:
+        query = query.filter(Image.approved == approved)
+    if created_after is not None:
+        query = query.filter(Image.created_at >= created_after)
+    if created_before is not None:
+        query = query.filter(Image.created_at < created_before)
+    return query
+
+
+def _pc_query(db: Session, connected: Optional[bool] = None):
+    query = db.query(PrismCentral)
+    if connected is not None:
+        query = query.filter(PrismCentral.connected == connected)
+    return query
+
+
+def _job_query(
+    db: Session,
+    status: Optional[str] = None,
+    image_id: Optional[int] = None,
+    pc_id: Optional[int] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+):
+    return _filter_jobs(
+        db.query(SyncJob), status, image_id, pc_id, updated_after, updated_before
+    )
+
+
+def _filter_jobs(
+    query,
+    status: Optional[str] = None,
+    image_id: Optional[int] = None,
+    pc_id: Optional[int] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+):
+    if status is not None:
+        query = query.filter(SyncJob.status == status)
+    if image_id is not None:
+        query = query.filter(SyncJob.image_id == image_id)
+    if pc_id is not None:
+        query = query.filter(SyncJob.pc_id == pc_id)
+    if updated_after is not None:
+        query = query.filter(SyncJob.updated_at >= updated_after)
+    if updated_before is not None:
+        query = query.filter(SyncJob.updated_at < updated_before)
+    return query
+
+
 @app.get("/")
 def home(request: Request):
     return templates.TemplateResponse(
-        "home.html", {"request": request, "title": "Home"}
+        request, "home.html", {"request": request, "title": "Home"}
     )
 
 
@@ -48,18 +225,33 @@ def register_pc(payload: PrismCentralCreate, db: Session = Depends(get_db)):
         api_url=payload.api_url,
         username=payload.username or settings.pc_default_username,
         password=payload.password or settings.pc_default_password,
+        source_url=payload.source_url or None,
+        max_in_flight=payload.max_in_flight,
     )
-    if settings.pc_validate_connection:
-        PrismClient(pc).ping()
+    pc.health_status = "pending"
     db.add(pc)
     db.commit()
     db.refresh(pc)
+    if settings.pc_validate_connection:
+        health_monitor.check_now(pc.id)
     return pc
 
 
 @app.get("/pcs", response_model=List[PrismCentralRead])
-def list_pcs(db: Session = Depends(get_db)):
-    return db.query(PrismCentral).all()
+def list_pcs(
+    request: Request,
+    response: Response,
+    connected: Optional[bool] = None,
+    sort: str = "id",
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    pcs, next_cursor = paginate(
+        _pc_query(db, connected), PC_SORTS, PrismCentral.id, sort, limit, cursor
+    )
+    set_page_headers(request, response, next_cursor)
+    return pcs
 
 
 @app.post("/images", response_model=ImageRead)
@@ -70,83 +262,333 @@ def upload_image(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ):
-    payload = file.file.read()
-    if not payload:
+    if _upload_is_empty(file):
         raise HTTPException(status_code=400, detail="Empty file.")
 
-    image = Image(
-        name=name,
-        version=version,
-        source=source,
-        sha256="pending",
-        storage_uri="pending",
-        approved=False,
+    with metrics.timed(metrics.upload_seconds, kind="form"):
+        blob = store_stream(db, file.file)
+    return _create_image(db, blob, name, version, source, file.filename)
+
+
+@app.get("/images", response_model=List[ImageRead])
+def list_images(
+    request: Request,
+    response: Response,
+    name: Optional[str] = None,
+    version: Optional[str] = None,
+    approved: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    sort: str = "id",
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    query = _image_query(db, name, version, approved, created_after, created_before)
+    images, next_cursor = paginate(query, IMAGE_SORTS, Image.id, sort, limit, cursor)
+    set_page_headers(request, response, next_cursor)
+    return images
+
+
+def _get_upload_session(db: Session, session_id: str) -> UploadSession:
+    session = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    return session
+
+
+@app.post("/uploads", response_model=UploadSessionRead)
+def create_upload_session(payload: UploadSessionCreate, db: Session = Depends(get_db)):
+    if payload.size is not None and payload.size <= 0:
+        raise HTTPException(status_code=400, detail="Empty file.")
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        name=payload.name,
+        version=payload.version,
+        source=payload.source,
+        filename=os.path.basename(payload.filename),
+        size=payload.size,
+        sha256=payload.sha256.lower() if payload.sha256 else None,
+        received_bytes=0,
+        next_chunk=0,
+        status="open",
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow(),
     )
-    db.add(image)
+    # A declared sha256 only proves the client knows the digest, not that it
+    # holds the bytes, so it never takes a reference to an existing blob.
+    # Finalize shares the blob once the uploaded bytes hash to it.
+    db.add(session)
     db.commit()
-    db.refresh(image)
+    db.refresh(session)
+    return session
 
-    storage_uri, digest = storage_client.save(image.id, file.filename, payload)
-    image.sha256 = digest
-    image.storage_uri = storage_uri
-    db.commit()
-    db.refresh(image)
-    return image
 
+@app.get("/uploads/{session_id}", response_model=UploadSessionRead)
+def get_upload_session(session_id: str, db: Session = Depends(get_db)):
+    return _get_upload_session(db, session_id)
 
-@app.get("/images", response_model=List[ImageRead])
-def list_images(db: Session = Depends(get_db)):
-    return db.query(Image).all()
 
+def _require_upload_worker(session: UploadSession) -> None:
+    if not upload_sessions.holds(session):
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                "Upload session is held by another API worker; "
+                "route its requests there."
+            ),
+        )
 
-@app.get("/images/{image_id}/download")
-def download_image(image_id: int, db: Session = Depends(get_db)):
-    image = db.query(Image).filter(Image.id == image_id).first()
-    if not image:
-        raise HTTPException(status_code=404, detail="Image not found.")
 
-    if image.storage_uri.startswith("s3://"):
-        body, filename, content_length = storage_client.open_s3_stream(
-            image.storage_uri
+def _claim_upload_chunk(
+    db: Session,
+    session_id: str,
+    index: int,
+    offset: int,
+    expected_length: Optional[int],
+):
+    session = _get_upload_session(db, session_id)
+    if session.status not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail="Upload session is closed.")
+    if index < session.next_chunk and offset < session.received_bytes:
+        return session, None
+    if index != session.next_chunk or offset != session.received_bytes:
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                f"Expected chunk {session.next_chunk} "
+                f"at offset {session.received_bytes}."
+            ),
         )
-        return StreamingResponse(
-            body,
-            media_type="application/octet-stream",
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Length": str(content_length) if content_length else None,
-            },
+    if (
+        session.size is not None
+        and expected_length is not None
+        and offset + expected_length > session.size
+    ):
+        raise HTTPException(status_code=400, detail="Chunk exceeds declared size.")
+    _require_upload_worker(session)
+    leased_at = upload_sessions.claim(
+        db, session, "receiving", received_bytes=offset, next_chunk=index
+    )
+    if leased_at is None:
+        raise HTTPException(
+            status_code=409, detail="Another request is writing to this upload."
+        )
+    db.refresh(session)
+    return session, leased_at
+
+
+def _release_upload_chunk(
+    db: Session,
+    session: UploadSession,
+    leased_at: datetime,
+    index: int,
+    written: Optional[int],
+) -> UploadSession:
+    if written is None:
+        upload_sessions.release(db, session, leased_at)
+        return session
+    offset = session.received_bytes
+    if not upload_sessions.release(
+        db,
+        session,
+        leased_at,
+        received_bytes=offset + written,
+        next_chunk=index + 1,
+    ):
+        raise HTTPException(
+            status_code=409, detail="Upload lease lapsed; resend the chunk."
+        )
+    return session
+
+
+@app.put("/uploads/{session_id}/chunks/{index}", response_model=UploadSessionRead)
+async def put_upload_chunk(
+    session_id: str,
+    index: int,
+    offset: int,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    # The body is streamed on the event loop; database and file work run in
+    # the threadpool.
+    content_length = request.headers.get("content-length")
+    expected_length = int(content_length) if content_length else None
+    session, leased_at = await run_in_threadpool(
+        _claim_upload_chunk, db, session_id, index, offset, expected_length
+    )
+    if leased_at is None:
+        return session
+    written = None
+    try:
+        with metrics.timed(metrics.upload_seconds, kind="chunk"):
+            written = await upload_sessions.append(
+                session, request.stream(), expected_length
+            )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        session = await run_in_threadpool(
+            _release_upload_chunk, db, session, leased_at, index, written
         )
+    return session
 
-    filename = os.path.basename(image.storage_uri)
-    return FileResponse(path=image.storage_uri, filename=filename)
 
+@app.post("/uploads/{session_id}/finalize", response_model=ImageRead)
+def finalize_upload_session(session_id: str, db: Session = Depends(get_db)):
+    session = _get_upload_session(db, session_id)
+    if session.status not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail="Upload session is closed.")
+    if not session.received_bytes:
+        raise HTTPException(status_code=400, detail="Empty file.")
+    if session.size is not None and session.received_bytes != session.size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Received {session.received_bytes} of {session.size} bytes.",
+        )
+    _require_upload_worker(session)
+    leased_at = upload_sessions.claim(
+        db, session, "finalizing", received_bytes=session.received_bytes
+    )
+    if leased_at is None:
+        raise HTTPException(
+            status_code=409, detail="Another request is writing to this upload."
+        )
+    db.refresh(session)
+    try:
+        digest = upload_sessions.digest(session)
+        if session.sha256 and session.sha256 != digest:
+            raise HTTPException(status_code=400, detail="SHA256 mismatch.")
+        with metrics.timed(metrics.upload_seconds, kind="finalize"):
+            blob = store_staged_file(
+                db,
+                upload_sessions.staging_path(session.id),
+                digest,
+                session.received_bytes,
+            )
+    except BaseException:
+        upload_sessions.release(db, session, leased_at)
+        raise
+    image = _create_image(
+        db, blob, session.name, session.version, session.source, session.filename
+    )
+    upload_sessions.release(
+        db, session, leased_at, status="finalized", image_id=image.id
+    )
+    db.refresh(image)
+    upload_sessions.discard(session.id)
+    return image
 
-@app.head("/images/{image_id}/download")
-def download_image_head(image_id: int, db: Session = Depends(get_db)):
-    image = db.query(Image).filter(Image.id == image_id).first()
+
+@app.delete("/uploads/{session_id}", response_model=UploadSessionRead)
+def abort_upload_session(session_id: str, db: Session = Depends(get_db)):
+    session = _get_upload_session(db, session_id)
+    if session.status in ACTIVE_STATUSES:
+        session.status = "aborted"
+        session.updated_at = datetime.utcnow()
+        db.commit()
+        db.refresh(session)
+        upload_sessions.discard(session.id)
+    return session
+
+
+def _download_image(db: Session, image_id: int) -> Image:
+    if is_edge():
+        image = edge_replica.resolve_image(image_id)
+    else:
+        image = db.query(Image).filter(Image.id == image_id).first()
     if not image:
         raise HTTPException(status_code=404, detail="Image not found.")
+    _require_stored(image)
+    return image
+
+
+def _download_blob(db: Session, sha256: str) -> Image:
+    image = blob_image(db, sha256)
+    if not image:
+        raise HTTPException(status_code=404, detail="Blob not found.")
+    _require_stored(image)
+    return image
 
-    if image.storage_uri.startswith("s3://"):
-        filename, content_length = storage_client.head_s3_object(image.storage_uri)
-        headers = {
-            "Content-Disposition": f'attachment; filename="{filename}"',
-        }
-        if content_length is not None:
-            headers["Content-Length"] = str(content_length)
-        return PlainTextResponse("", headers=headers)
 
-    if not os.path.exists(image.storage_uri):
+def _require_stored(image: Image) -> None:
+    uri = image.storage_uri
+    if uri.startswith(("http://", "https://")):
+        # An edge's blobs live upstream; a 404 there is a 404 here, not a 500.
+        try:
+            storage_client.stat(uri)
+        except httpx.HTTPStatusError as exc:
+            if exc.response.status_code != 404:
+                raise
+            raise HTTPException(status_code=404, detail="Image file not found.")
+    elif not storage_client.is_remote(uri) and not os.path.exists(uri):
         raise HTTPException(status_code=404, detail="Image file not found.")
-    filename = os.path.basename(image.storage_uri)
-    headers = {
-        "Content-Disposition": f'attachment; filename="{filename}"',
-        "Content-Length": str(os.path.getsize(image.storage_uri)),
-    }
+
+
+def _head_response(request: Request, image: Image) -> Response:
+    filename, content_length = storage_client.stat(image.storage_uri)
+    headers = download_headers(image, filename)
+    not_modified = check_preconditions(request, image, headers)
+    if not_modified is not None:
+        return not_modified
+    if content_length is not None:
+        headers["Content-Length"] = str(content_length)
     return PlainTextResponse("", headers=headers)
 
 
+@app.get("/images/{image_id}/download")
+def download_image(image_id: int, request: Request, db: Session = Depends(get_db)):
+    return build_download_response(request, _download_image(db, image_id))
+
+
+@app.head("/images/{image_id}/download")
+def download_image_head(image_id: int, request: Request, db: Session = Depends(get_db)):
+    return _head_response(request, _download_image(db, image_id))
+
+
+@app.get("/blobs/{sha256}")
+def download_blob(sha256: str, request: Request, db: Session = Depends(get_db)):
+    return build_download_response(request, _download_blob(db, sha256))
+
+
+@app.head("/blobs/{sha256}")
+def download_blob_head(sha256: str, request: Request, db: Session = Depends(get_db)):
+    return _head_response(request, _download_blob(db, sha256))
+
+
+@app.post("/blobs/{sha256}/warm", status_code=202)
+def warm_blob(sha256: str, db: Session = Depends(get_db)):
+    return {"warming": warm_image(_download_blob(db, sha256))}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return blob_cache.stats()
+
+
+@app.get("/downloads/stats")
+def download_stats(db: Session = Depends(get_db)):
+    counts = dict(
+        db.query(SyncJob.status, func.count())
+        .filter(SyncJob.status.in_(("running", "waiting")))
+        .group_by(SyncJob.status)
+        .all()
+    )
+    stats = download_scheduler.stats()
+    stats["imports"] = {
+        "active": counts.get("running", 0),
+        "waiting": counts.get("waiting", 0),
+        "limit": settings.publish_max_active_imports,
+    }
+    return stats
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
 @app.get("/reachability")
 def reachability_check():
     return PlainTextResponse("ok")
@@ -160,77 +602,152 @@ def approve_image(image_id: int, db: Session = Depends(get_db)):
     image.approved = True
     db.commit()
     db.refresh(image)
+    warm_replicas(image_replica_targets(db, image.sha256))
     return image
 
 
+def _dispatch(db: Session, result: PublishResult) -> None:
+    job_ids = [job.id for job in result.created]
+    # Replicas start pulling from the hub while the jobs are still queued.
+    warm_replicas(job_replica_targets(db, job_ids))
+    dispatcher.dispatch(job_ids)
+
+
 @app.post("/images/{image_id}/publish", response_model=List[SyncJobRead])
-def publish_image(image_id: int, db: Session = Depends(get_db)):
-    image = db.query(Image).filter(Image.id == image_id).first()
-    if not image:
-        raise HTTPException(status_code=404, detail="Image not found.")
-    if not image.approved:
-        raise HTTPException(status_code=400, detail="Image not approved.")
-
-    pcs = db.query(PrismCentral).all()
-    if not pcs:
-        raise HTTPException(status_code=400, detail="No Prism Central instances.")
-
-    jobs: List[SyncJob] = []
-    for pc in pcs:
-        job = SyncJob(
-            image_id=image.id,
-            pc_id=pc.id,
-            status="queued",
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
-        )
-        db.add(job)
-        db.commit()
-        db.refresh(job)
-        jobs.append(job)
+def publish_image(
+    image_id: int,
+    payload: Optional[PublishRequest] = None,
+    db: Session = Depends(get_db),
+):
+    payload = payload or PublishRequest()
+    result = create_sync_jobs(
+        db, [image_id], payload.pc_ids, payload.force, payload.priority
+    )
+    _dispatch(db, result)
+    return result.jobs
 
-        if settings.celery_broker_url:
-            run_sync_job.delay(job.id)
-        else:
-            run_sync_job(job.id)
 
-    return jobs
+@app.post("/publish", response_model=List[SyncJobRead])
+def publish_images(payload: BatchPublishRequest, db: Session = Depends(get_db)):
+    if not payload.image_ids:
+        raise HTTPException(status_code=400, detail="No images selected.")
+    result = create_sync_jobs(
+        db, payload.image_ids, payload.pc_ids, payload.force, payload.priority
+    )
+    _dispatch(db, result)
+    return result.jobs
 
 
 @app.get("/sync-jobs", response_model=List[SyncJobRead])
-def list_sync_jobs(db: Session = Depends(get_db)):
-    return db.query(SyncJob).all()
+def list_sync_jobs(
+    request: Request,
+    response: Response,
+    status: Optional[str] = None,
+    image_id: Optional[int] = None,
+    pc_id: Optional[int] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    sort: str = "id",
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    query = _job_query(db, status, image_id, pc_id, updated_after, updated_before)
+    jobs, next_cursor = paginate(query, JOB_SORTS, SyncJob.id, sort, limit, cursor)
+    set_page_headers(request, response, next_cursor)
+    return jobs
+
+
+@app.get("/sync-jobs/queues")
+def sync_job_queues(db: Session = Depends(get_db)):
+    return queue_depths(db)
+
+
+@app.get("/sync-jobs/events")
+def sync_job_events(request: Request, after: int = Query(0, ge=0)):
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+    return StreamingResponse(
+        stream_job_events(after, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/ui/tasks")
-def ui_list_tasks(request: Request, db: Session = Depends(get_db)):
-    jobs = db.query(SyncJob).all()
+def ui_list_tasks(
+    request: Request,
+    status: Optional[str] = None,
+    image_id: Optional[int] = None,
+    pc_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    # Read the event cursor first so nothing committed while the page renders
+    # is missed by the live stream.
+    event_cursor = latest_event_id(db)
+    query = _filter_jobs(task_rows(db), status or None, image_id, pc_id)
+    jobs, next_cursor = paginate(
+        query, JOB_SORTS, SyncJob.id, "-updated_at", UI_PAGE_SIZE, cursor
+    )
     return templates.TemplateResponse(
+        request,
         "tasks/index.html",
-        {"request": request, "title": "Tasks", "jobs": jobs},
+        {
+            "request": request,
+            "title": "Tasks",
+            "jobs": jobs,
+            "status": status or "",
+            "event_cursor": event_cursor,
+            "live_inserts": cursor is None and image_id is None and pc_id is None,
+            "next_url": next_page_url(request, next_cursor),
+        },
     )
 
 
 @app.get("/ui/images")
-def ui_list_images(request: Request, db: Session = Depends(get_db)):
-    images = db.query(Image).all()
+def ui_list_images(
+    request: Request, cursor: Optional[str] = None, db: Session = Depends(get_db)
+):
+    images, next_cursor = paginate(
+        image_rows(db), IMAGE_SORTS, Image.id, "-created_at", UI_PAGE_SIZE, cursor
+    )
     return templates.TemplateResponse(
+        request,
         "images/index.html",
-        {"request": request, "title": "Images", "images": images},
+        {
+            "request": request,
+            "title": "Images",
+            "images": images,
+            "next_url": next_page_url(request, next_cursor),
+        },
     )
 
 
 @app.get("/ui/pcs")
-def ui_list_pcs(request: Request, db: Session = Depends(get_db)):
-    pcs = db.query(PrismCentral).all()
+def ui_list_pcs(
+    request: Request, cursor: Optional[str] = None, db: Session = Depends(get_db)
+):
+    pcs, next_cursor = paginate(
+        pc_rows(db), PC_SORTS, PrismCentral.id, "name", UI_PAGE_SIZE, cursor
+    )
     return templates.TemplateResponse(
-        "pcs/index.html", {"request": request, "title": "Prism Centrals", "pcs": pcs}
+        request,
+        "pcs/index.html",
+        {
+            "request": request,
+            "title": "Prism Centrals",
+            "pcs": pcs,
+            "next_url": next_page_url(request, next_cursor),
+        },
     )
 
 
 @app.get("/ui/pcs/new")
 def ui_new_pc(request: Request):
     return templates.TemplateResponse(
+        request,
         "pcs/new.html",
         {
             "request": request,
@@ -246,6 +763,7 @@ def ui_register_pc(
     port: str = Form(...),
     username: Optional[str] = Form(None),
     password: Optional[str] = Form(None),
+    source_url: Optional[str] = Form(None),
     db: Session = Depends(get_db),
 ):
     address = address.strip()
@@ -268,9 +786,13 @@ def ui_register_pc(
         errors.append("Username is required.")
     if not password:
         errors.append("Password is required.")
+    source_url = (source_url or "").strip().rstrip("/")
+    if source_url and not source_url.startswith(("http://", "https://")):
+        errors.append("Source URL must start with http:// or https://.")
 
     if errors:
         return templates.TemplateResponse(
+            request,
             "pcs/new.html",
             {
                 "request": request,
@@ -287,22 +809,13 @@ def ui_register_pc(
         api_url=api_url,
         username=username or settings.pc_default_username,
         password=password or settings.pc_default_password,
+        source_url=source_url or None,
     )
-    if settings.pc_validate_connection:
-        try:
-            PrismClient(pc).ping()
-        except Exception as exc:
-            return templates.TemplateResponse(
-                "pcs/new.html",
-                {
-                    "request": request,
-                    "title": "Register Prism Central",
-                    "message": f"Connection failed: {exc}",
-                },
-                status_code=400,
-            )
+    pc.health_status = "pending"
     db.add(pc)
     db.commit()
+    if settings.pc_validate_connection:
+        health_monitor.check_now(pc.id)
     return RedirectResponse(url="/ui/pcs", status_code=303)
 
 
@@ -314,13 +827,14 @@ def ui_delete_pc(pc_id: int, db: Session = Depends(get_db)):
     db.query(SyncJob).filter(SyncJob.pc_id == pc_id).delete()
     db.delete(pc)
     db.commit()
+    prism_runtime.close(pc.api_url)
     return RedirectResponse(url="/ui/pcs", status_code=303)
 
 
 @app.get("/ui/images/upload")
 def ui_upload_form(request: Request):
     return templates.TemplateResponse(
-        "images/upload.html", {"request": request, "title": "Upload Image"}
+        request, "images/upload.html", {"request": request, "title": "Upload Image"}
     )
 
 
@@ -333,9 +847,9 @@ def ui_upload_image(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ):
-    payload = file.file.read()
-    if not payload:
+    if _upload_is_empty(file):
         return templates.TemplateResponse(
+            request,
             "images/upload.html",
             {
                 "request": request,
@@ -345,22 +859,9 @@ def ui_upload_image(
             status_code=400,
         )
 
-    image = Image(
-        name=name,
-        version=version,
-        source=source,
-        sha256="pending",
-        storage_uri="pending",
-        approved=False,
-    )
-    db.add(image)
-    db.commit()
-    db.refresh(image)
-
-    storage_uri, digest = storage_client.save(image.id, file.filename, payload)
-    image.sha256 = digest
-    image.storage_uri = storage_uri
-    db.commit()
+    with metrics.timed(metrics.upload_seconds, kind="form"):
+        blob = store_stream(db, file.file)
+    _create_image(db, blob, name, version, source, file.filename)
 
     return RedirectResponse(url="/ui/images", status_code=303)
 
@@ -370,9 +871,11 @@ def ui_image_detail(image_id: int, request: Request, db: Session = Depends(get_d
     image = db.query(Image).filter(Image.id == image_id).first()
     if not image:
         raise HTTPException(status_code=404, detail="Image not found.")
+    pcs = pc_rows(db).order_by(PrismCentral.name).all()
     return templates.TemplateResponse(
+        request,
         "images/detail.html",
-        {"request": request, "title": "Image Details", "image": image},
+        {"request": request, "title": "Image Details", "image": image, "pcs": pcs},
     )
 
 
@@ -383,38 +886,25 @@ def ui_approve_image(image_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Image not found.")
     image.approved = True
     db.commit()
+    warm_replicas(image_replica_targets(db, image.sha256))
     return RedirectResponse(url=f"/ui/images/{image_id}", status_code=303)
 
 
 @app.post("/ui/images/{image_id}/publish")
-def ui_publish_image(image_id: int, db: Session = Depends(get_db)):
+def ui_publish_image(
+    image_id: int,
+    pc_ids: List[int] = Form(default=[]),
+    db: Session = Depends(get_db),
+):
     image = db.query(Image).filter(Image.id == image_id).first()
     if not image:
         raise HTTPException(status_code=404, detail="Image not found.")
-    if not image.approved:
-        return RedirectResponse(url=f"/ui/images/{image_id}", status_code=303)
-
-    pcs = db.query(PrismCentral).all()
-    if not pcs:
+    try:
+        result = create_sync_jobs(db, [image.id], pc_ids or None)
+    except HTTPException:
         return RedirectResponse(url=f"/ui/images/{image_id}", status_code=303)
 
-    for pc in pcs:
-        job = SyncJob(
-            image_id=image.id,
-            pc_id=pc.id,
-            status="queued",
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
-        )
-        db.add(job)
-        db.commit()
-        db.refresh(job)
-
-        if settings.celery_broker_url:
-            run_sync_job.delay(job.id)
-        else:
-            run_sync_job(job.id)
-
+    _dispatch(db, result)
     return RedirectResponse(url=f"/ui/images/{image_id}", status_code=303)
 
 
@@ -425,5 +915,6 @@ def ui_delete_image(image_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Image not found.")
     db.query(SyncJob).filter(SyncJob.image_id == image_id).delete()
     db.delete(image)
-    db.commit()
+    db.flush()
+    release_blob(db, image.sha256)
     return RedirectResponse(url="/ui/images", status_code=303)
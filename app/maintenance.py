@@ -0,0 +1,85 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.dispatch import recover_stale_jobs
+from app.events import prune_job_events
+from app.prism import PrismRuntime, prism_runtime
+from app.storage import storage_client
+from app.tasks import resume_task_watches
+from app.uploads import upload_sessions
+
+
+def _abort_stale_uploads() -> int:
+    return storage_client.abort_stale_uploads(settings.s3_stale_upload_age)
+
+
+def _remove_stale_staging() -> int:
+    return storage_client.remove_stale_staging(settings.s3_stale_upload_age)
+
+
+# Housekeeping that no request owns. Each task returns how many things it
+# cleaned up; new tasks are appended here.
+TASKS: List[Tuple[str, Callable[[], int]]] = [
+    ("stale_multipart_uploads", _abort_stale_uploads),
+    ("stale_staging_objects", _remove_stale_staging),
+    ("expired_upload_sessions", upload_sessions.expire),
+    ("old_job_events", prune_job_events),
+    ("stale_sync_jobs", recover_stale_jobs),
+    ("orphaned_task_watches", resume_task_watches),
+]
+
+
+class Maintenance:
+    # Sweeps run on the Prism runtime loop like the health monitor; the tasks
+    # themselves block on the database or the store, so they go to the
+    # default executor.
+    def __init__(self, runtime: PrismRuntime):
+        self.runtime = runtime
+        self.interval = settings.maintenance_interval
+        self.sweeps = 0
+        self.errors: Dict[str, str] = {}
+        self._runner: Optional[asyncio.Task] = None
+
+    def run_once(self) -> Dict[str, int]:
+        results = {}
+        for name, task in TASKS:
+            # One failing task must not stop the others.
+            try:
+                results[name] = task()
+                self.errors.pop(name, None)
+            except Exception as exc:
+                self.errors[name] = str(exc)
+        self.sweeps += 1
+        return results
+
+    def start(self) -> None:
+        async def start() -> None:
+            if self._runner is None or self._runner.done():
+                self._runner = asyncio.ensure_future(self._run())
+
+        self.runtime.submit(start())
+
+    def stop(self) -> None:
+        async def stop() -> None:
+            if self._runner is not None:
+                self._runner.cancel()
+                self._runner = None
+
+        self.runtime.submit(stop()).result()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.run_once)
+            await asyncio.sleep(self.interval)
+
+
+maintenance = Maintenance(prism_runtime)
+
+
+if __name__ == "__main__":
+    for name, count in maintenance.run_once().items():
+        print(f"{name}: {count}")
+    for name, error in maintenance.errors.items():
+        print(f"{name}: failed: {error}")
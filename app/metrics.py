@@ -0,0 +1,176 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# A registry of our own rather than the process default, so re-importing the
+# app (tests, the benchmarks) does not trip over duplicate collectors.
+registry = CollectorRegistry(auto_describe=True)
+
+FAST_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+http_request_seconds = Histogram(
+    "image_hub_http_request_seconds",
+    "HTTP request latency.",
+    ["method", "route", "status"],
+    registry=registry,
+)
+db_queries_per_request = Histogram(
+    "image_hub_db_queries_per_request",
+    "SQL statements executed while serving one request.",
+    ["route"],
+    buckets=QUERY_BUCKETS,
+    registry=registry,
+)
+upload_bytes = Counter(
+    "image_hub_upload_bytes_total", "Image bytes received.", registry=registry
+)
+upload_seconds = Histogram(
+    "image_hub_upload_seconds",
+    "Time to receive and store one upload or upload chunk.",
+    ["kind"],
+    buckets=SLOW_BUCKETS,
+    registry=registry,
+)
+hash_seconds = Histogram(
+    "image_hub_sha256_seconds",
+    "Time spent in SHA-256 per upload or chunk.",
+    buckets=FAST_BUCKETS,
+    registry=registry,
+)
+storage_write_seconds = Histogram(
+    "image_hub_storage_write_seconds",
+    "Time to write or promote a blob in storage.",
+    ["backend", "operation"],
+    buckets=SLOW_BUCKETS,
+    registry=registry,
+)
+download_bytes = Counter(
+    "image_hub_download_bytes_total",
+    "Image bytes served, by image sha256.",
+    ["image"],
+    registry=registry,
+)
+download_client_bytes = Counter(
+    "image_hub_download_client_bytes_total",
+    "Image bytes served, by pulling client (PC address).",
+    ["client"],
+    registry=registry,
+)
+download_seconds = Histogram(
+    "image_hub_download_seconds",
+    "Duration of completed downloads.",
+    buckets=SLOW_BUCKETS,
+    registry=registry,
+)
+prism_request_seconds = Histogram(
+    "image_hub_prism_request_seconds",
+    "Prism Central API latency.",
+    ["method", "endpoint", "status"],
+    buckets=FAST_BUCKETS,
+    registry=registry,
+)
+task_polls = Counter(
+    "image_hub_task_polls_total",
+    "Batched Prism Central task polls.",
+    registry=registry,
+)
+task_poll_seconds = Histogram(
+    "image_hub_task_poll_seconds",
+    "Duration of one batched task poll.",
+    buckets=FAST_BUCKETS,
+    registry=registry,
+)
+sync_job_phase_seconds = Histogram(
+    "image_hub_sync_job_phase_seconds",
+    "run_sync_job time per phase.",
+    ["phase"],
+    buckets=FAST_BUCKETS,
+    registry=registry,
+)
+
+_UUID = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+)
+_query_count: ContextVar[Optional[List[int]]] = ContextVar("query_count", default=None)
+
+
+def prism_endpoint(path: str) -> str:
+    return _UUID.sub("{uuid}", path)
+
+
+@contextmanager
+def timed(histogram, **labels) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        target = histogram.labels(**labels) if labels else histogram
+        target.observe(time.perf_counter() - started)
+
+
+def count_queries(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_):
+        counter = _query_count.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+class MetricsMiddleware:
+    # Plain ASGI so streaming responses are not buffered. Sync endpoints run
+    # in a worker thread with a copy of this context, which still shares the
+    # counter list.
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        counter = [0]
+        token = _query_count.set(counter)
+        status = [500]
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _query_count.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_request_seconds.labels(
+                scope["method"], route, str(status[0])
+            ).observe(time.perf_counter() - started)
+            db_queries_per_request.labels(route).observe(counter[0])
+
+
+def render() -> tuple:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Gunicorn/Celery workers each write their own files; merge them here.
+        merged = CollectorRegistry()
+        multiprocess.MultiProcessCollector(merged)
+        return generate_latest(merged), CONTENT_TYPE_LATEST
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,112 @@
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+from app import models  # noqa: F401  (registers the tables on Base.metadata)
+from app.db import Base, engine
+
+# Columns added after the first release, which create_all does not add to an
+# existing table.
+LEGACY_COLUMNS = {
+    "prism_centrals": (
+        "connected",
+        "last_checked_at",
+        "health_status",
+        "health_detail",
+        "hub_checked_at",
+        "source_url",
+        "direct_source",
+    ),
+    "images": ("filename",),
+    "sync_jobs": ("task_uuid",),
+}
+
+
+def _add_columns(columns: Dict[str, Tuple[str, ...]]) -> Callable[[Connection], None]:
+    def step(connection: Connection) -> None:
+        inspector = inspect(connection)
+        for table_name, column_names in columns.items():
+            table = Base.metadata.tables[table_name]
+            existing = {column["name"] for column in inspector.get_columns(table_name)}
+            for name in column_names:
+                if name in existing:
+                    continue
+                definition = CreateColumn(table.c[name]).compile(
+                    dialect=connection.dialect
+                )
+                connection.execute(
+                    text(f"ALTER TABLE {table_name} ADD COLUMN {definition}")
+                )
+
+    return step
+
+
+def _create_missing_indexes(connection: Connection) -> None:
+    # create_all skips indexes on tables that already exist.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+
+# Append only: each step runs once per database, in order, and is recorded in
+# schema_migrations.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "legacy columns", _add_columns(LEGACY_COLUMNS)),
+    (2, "indexes on existing tables", _create_missing_indexes),
+    (
+        3,
+        "sync job priority and per-PC in-flight limit",
+        _add_columns(
+            {"sync_jobs": ("priority",), "prism_centrals": ("max_in_flight",)}
+        ),
+    ),
+    (
+        4,
+        "time of the last direct object-store import",
+        _add_columns({"prism_centrals": ("direct_checked_at",)}),
+    ),
+    (5, "owner of a sync job's task watch", _add_columns({"sync_jobs": ("watcher",)})),
+    (
+        6,
+        "API worker holding an upload session's hash state",
+        _add_columns({"upload_sessions": ("worker",)}),
+    ),
+]
+
+
+def migrate(bind: Engine = engine) -> List[int]:
+    Base.metadata.create_all(bind=bind)
+    applied = []
+    with bind.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            # Serialises workers that start at the same time.
+            connection.execute(text("SELECT pg_advisory_xact_lock(724011)"))
+        connection.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations "
+                "(version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL)"
+            )
+        )
+        done = set(
+            connection.execute(text("SELECT version FROM schema_migrations")).scalars()
+        )
+        for version, name, step in MIGRATIONS:
+            if version in done:
+                continue
+            step(connection)
+            connection.execute(
+                text(
+                    "INSERT INTO schema_migrations (version, name) "
+                    "VALUES (:version, :name)"
+                ),
+                {"version": version, "name": name},
+            )
+            applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    versions = migrate()
+    print(f"Applied migrations: {versions}" if versions else "Schema is up to date.")
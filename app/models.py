@@ -1,6 +1,17 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 
 from app.db import Base
@@ -14,6 +25,7 @@ class Image(Base):
     version = Column(String(64), nullable=False)
     sha256 = Column(String(64), nullable=False)
     source = Column(String(255), nullable=True)
+    filename = Column(String(255), nullable=True)
     storage_uri = Column(Text, nullable=False)
     approved = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -22,6 +34,18 @@ class Image(Base):
         "SyncJob", back_populates="image", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (Index("ix_images_name_version", "name", "version"),)
+
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    storage_uri = Column(Text, nullable=False)
+    size = Column(BigInteger, nullable=True)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 
 class PrismCentral(Base):
     __tablename__ = "prism_centrals"
@@ -33,6 +57,13 @@ class PrismCentral(Base):
     password = Column(String(255), nullable=True)
     connected = Column(Boolean, default=False)
     last_checked_at = Column(DateTime, nullable=True)
+    health_status = Column(String(32), default="pending")
+    health_detail = Column(Text, nullable=True)
+    hub_checked_at = Column(DateTime, nullable=True)
+    source_url = Column(String(512), nullable=True)
+    direct_source = Column(Boolean, nullable=True)
+    direct_checked_at = Column(DateTime, nullable=True)
+    max_in_flight = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     sync_jobs = relationship(
@@ -51,9 +82,73 @@ class SyncJob(Base):
         Integer, ForeignKey("prism_centrals.id", ondelete="CASCADE"), nullable=False
     )
     status = Column(String(32), default="queued")
+    priority = Column(Integer, nullable=False, default=0, server_default="0")
+    task_uuid = Column(String(64), nullable=True)
+    watcher = Column(String(32), nullable=True)
     detail = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
     image = relationship("Image", back_populates="sync_jobs")
     pc = relationship("PrismCentral", back_populates="sync_jobs")
+
+    __table_args__ = (
+        Index("ix_sync_jobs_status_updated_at", "status", "updated_at"),
+        Index("ix_sync_jobs_image_id", "image_id"),
+        Index("ix_sync_jobs_pc_id", "pc_id"),
+    )
+
+
+class ImagePlacement(Base):
+    __tablename__ = "image_placements"
+
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), nullable=False)
+    pc_id = Column(
+        Integer, ForeignKey("prism_centrals.id", ondelete="CASCADE"), nullable=False
+    )
+    status = Column(String(32), default="pending", nullable=False)
+    job_id = Column(
+        Integer, ForeignKey("sync_jobs.id", ondelete="SET NULL"), nullable=True
+    )
+    image_uuid = Column(String(64), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("sha256", "pc_id", name="uq_image_placements_sha256_pc"),
+        Index("ix_image_placements_job_id", "job_id"),
+    )
+
+
+class SyncJobEvent(Base):
+    __tablename__ = "sync_job_events"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(
+        Integer, ForeignKey("sync_jobs.id", ondelete="CASCADE"), nullable=False
+    )
+    status = Column(String(32), nullable=False)
+    progress = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)
+    name = Column(String(255), nullable=False)
+    version = Column(String(64), nullable=False)
+    source = Column(String(255), nullable=True)
+    filename = Column(String(255), nullable=False)
+    size = Column(BigInteger, nullable=True)
+    sha256 = Column(String(64), nullable=True)
+    received_bytes = Column(BigInteger, default=0, nullable=False)
+    next_chunk = Column(Integer, default=0, nullable=False)
+    status = Column(String(32), default="open")
+    worker = Column(String(128), nullable=True)
+    image_id = Column(
+        Integer, ForeignKey("images.id", ondelete="SET NULL"), nullable=True
+    )
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,105 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import DateTime, and_, false, or_
+from sqlalchemy.orm import Query
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def encode_cursor(values: List[Any]) -> str:
+    encoded = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    raw = json.dumps(encoded, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if not isinstance(values, list) or len(values) != 3:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return values
+
+
+def parse_sort(sort: str, columns: Dict[str, Any]) -> Tuple[str, bool]:
+    descending = sort.startswith("-")
+    name = sort.lstrip("-")
+    if name not in columns:
+        allowed = ", ".join(sorted(columns))
+        raise HTTPException(
+            status_code=400, detail=f"Unsupported sort '{name}'. Use one of: {allowed}."
+        )
+    return name, descending
+
+
+def paginate(
+    query: Query,
+    columns: Dict[str, Any],
+    id_column,
+    sort: str,
+    limit: int,
+    cursor: Optional[str],
+) -> Tuple[list, Optional[str]]:
+    name, descending = parse_sort(sort, columns)
+    column = columns[name]
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    if cursor:
+        cursor_sort, last_value, last_id = decode_cursor(cursor)
+        if cursor_sort != sort:
+            raise HTTPException(status_code=400, detail="Cursor does not match sort.")
+        if isinstance(column.type, DateTime) and last_value is not None:
+            last_value = datetime.fromisoformat(last_value)
+        if column is id_column:
+            query = query.filter(id_column < last_id if descending else id_column > last_id)
+        else:
+            # NULL sort keys order as the largest value, as Postgres indexes
+            # them: last going up, first going down.
+            after_id = id_column < last_id if descending else id_column > last_id
+            if last_value is None:
+                after = column.isnot(None) if descending else false()
+                query = query.filter(or_(after, and_(column.is_(None), after_id)))
+            else:
+                after = column < last_value if descending else column > last_value
+                if not descending:
+                    after = or_(after, column.is_(None))
+                query = query.filter(or_(after, and_(column == last_value, after_id)))
+
+    if column is id_column:
+        order = [id_column.desc() if descending else id_column.asc()]
+    elif descending:
+        order = [column.desc().nulls_first(), id_column.desc()]
+    else:
+        order = [column.asc().nulls_last(), id_column.asc()]
+
+    rows = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([sort, getattr(last, name), last.id])
+    return rows, next_cursor
+
+
+def next_page_url(request: Request, cursor: Optional[str]) -> Optional[str]:
+    if not cursor:
+        return None
+    params = dict(request.query_params)
+    params["cursor"] = cursor
+    return str(request.url.replace_query_params(**params))
+
+
+def set_page_headers(request: Request, response: Response, cursor: Optional[str]) -> None:
+    if not cursor:
+        return
+    response.headers["X-Next-Cursor"] = cursor
+    response.headers["Link"] = f'<{next_page_url(request, cursor)}>; rel="next"'
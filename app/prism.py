@@ -1,82 +1,300 @@
+import asyncio
+import importlib.util
 import os
+import threading
 import time
 import uuid
-from typing import Optional
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
 
 import httpx
 
+from app import metrics
 from app.config import settings
 from app.models import Image, PrismCentral
 
+TERMINAL_TASK_STATES = {"SUCCEEDED", "FAILED", "CANCELED"}
+IMAGE_LIST_PAGE = 500
 
-class PrismClient:
-    def __init__(self, pc: PrismCentral):
-        self.pc = pc
 
-    def ping(self) -> None:
+class PCTarget(NamedTuple):
+    id: Optional[int]
+    api_url: str
+    username: Optional[str]
+    password: Optional[str]
+    source_url: Optional[str] = None
+
+    @classmethod
+    def from_pc(cls, pc: Union[PrismCentral, "PCTarget"]) -> "PCTarget":
+        if isinstance(pc, PCTarget):
+            return pc
+        return cls(pc.id, pc.api_url, pc.username, pc.password, pc.source_url)
+
+    @property
+    def auth(self) -> Optional[tuple]:
+        if self.username and self.password:
+            return (self.username, self.password)
+        return None
+
+
+class ImageTarget(NamedTuple):
+    id: int
+    name: str
+    filename: Optional[str]
+    storage_uri: str
+    sha256: str
+
+    @classmethod
+    def from_image(cls, image: Union[Image, "ImageTarget"]) -> "ImageTarget":
+        if isinstance(image, ImageTarget):
+            return image
+        return cls(
+            image.id, image.name, image.filename, image.storage_uri, image.sha256
+        )
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class PrismRuntime:
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._watchers: Dict[tuple, "TaskWatcher"] = {}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="prism-client", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine) -> Any:
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("PrismRuntime.run cannot be called from its own loop.")
+        return self.submit(coro).result()
+
+    def client(self, api_url: str) -> httpx.AsyncClient:
+        client = self._clients.get(api_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                verify=False,
+                timeout=settings.pc_request_timeout,
+                http2=settings.pc_http2 and _http2_available(),
+                limits=httpx.Limits(
+                    max_connections=settings.pc_max_connections,
+                    max_keepalive_connections=settings.pc_max_keepalive_connections,
+                    keepalive_expiry=settings.pc_keepalive_expiry,
+                ),
+            )
+            self._clients[api_url] = client
+        return client
+
+    def watcher(self, pc: "PCTarget") -> "TaskWatcher":
+        key = (pc.api_url, pc.username)
+        watcher = self._watchers.get(key)
+        if watcher is None:
+            watcher = TaskWatcher(AsyncPrismClient(pc, self))
+            self._watchers[key] = watcher
+        return watcher
+
+    def watch_task(
+        self,
+        pc: Union[PrismCentral, "PCTarget"],
+        task_uuid: str,
+        on_update: Optional[Callable[[dict], None]] = None,
+    ) -> Future:
+        target = PCTarget.from_pc(pc)
+
+        async def watch() -> dict:
+            return await self.watcher(target).watch(task_uuid, on_update)
+
+        return self.submit(watch())
+
+    async def _close_clients(self, api_url: Optional[str]) -> None:
+        urls = list(self._clients) if api_url is None else [api_url]
+        for key in [key for key in self._watchers if api_url in (None, key[0])]:
+            self._watchers.pop(key).cancel()
+        for url in urls:
+            client = self._clients.pop(url, None)
+            if client is not None:
+                await client.aclose()
+
+    def close(self, api_url: Optional[str] = None) -> None:
+        if self._loop is None:
+            return
+        self.run(self._close_clients(api_url))
+
+
+prism_runtime = PrismRuntime()
+
+
+def extract_task_uuid(body: dict) -> Optional[str]:
+    if not isinstance(body, dict):
+        return None
+    for key in ("task_uuid", "taskUuid"):
+        if key in body:
+            return body[key]
+    status = body.get("status")
+    if isinstance(status, dict):
+        exec_ctx = status.get("execution_context") or status.get("executionContext")
+        if isinstance(exec_ctx, dict):
+            for key in ("task_uuid", "taskUuid"):
+                if key in exec_ctx:
+                    return exec_ctx[key]
+    return None
+
+
+class AsyncPrismClient:
+    def __init__(
+        self,
+        pc: Union[PrismCentral, PCTarget],
+        runtime: Optional[PrismRuntime] = None,
+    ):
+        self.pc = PCTarget.from_pc(pc)
+        self.runtime = runtime or prism_runtime
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        client = self.runtime.client(self.pc.api_url)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await client.request(
+                method, f"{self.pc.api_url}{path}", auth=self.pc.auth, **kwargs
+            )
+            status = str(response.status_code)
+            return response
+        finally:
+            metrics.prism_request_seconds.labels(
+                method, metrics.prism_endpoint(path), status
+            ).observe(time.perf_counter() - started)
+
+    async def ping(self, check_hub_source: Optional[bool] = None) -> None:
+        if check_hub_source is None:
+            check_hub_source = settings.pc_validate_hub_source
         if not self.pc.api_url:
             raise ValueError("PC api_url is required for connectivity check.")
-        auth = None
-        if self.pc.username and self.pc.password:
-            auth = (self.pc.username, self.pc.password)
-        with httpx.Client(verify=False, timeout=20, auth=auth) as client:
-            response = client.post(
-                f"{self.pc.api_url}/api/nutanix/v3/clusters/list",
-                json={"kind": "cluster"},
+        response = await self._request(
+            "POST", "/api/nutanix/v3/clusters/list", json={"kind": "cluster"}
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f"PC connectivity check failed: {response.status_code} {response.text}"
+            )
+        if check_hub_source:
+            await self.test_hub_source_uri()
+
+    async def get_task(self, task_uuid: str) -> dict:
+        response = await self._request("GET", f"/api/nutanix/v3/tasks/{task_uuid}")
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f"PC task polling failed: {response.status_code} {response.text}"
+            )
+        body = response.json()
+        if not isinstance(body, dict):
+            raise RuntimeError(f"Unexpected task response: {body}")
+        return body
+
+    async def list_tasks(self, task_uuids: List[str]) -> Dict[str, dict]:
+        response = await self._request(
+            "POST",
+            "/api/nutanix/v3/tasks/list",
+            json={
+                "kind": "task",
+                "length": len(task_uuids),
+                "filter": ",".join(f"uuid=={task_uuid}" for task_uuid in task_uuids),
+            },
+        )
+        if response.status_code >= 400:
+            return {}
+        body = response.json()
+        entities = body.get("entities") if isinstance(body, dict) else None
+        tasks = {}
+        for entity in entities or []:
+            if not isinstance(entity, dict):
+                continue
+            task_uuid = entity.get("uuid") or entity.get("metadata", {}).get("uuid")
+            if task_uuid:
+                tasks[task_uuid] = entity
+        return tasks
+
+    async def find_image_by_checksum(self, sha256: str) -> Optional[str]:
+        offset = 0
+        while True:
+            response = await self._request(
+                "POST",
+                "/api/nutanix/v3/images/list",
+                json={"kind": "image", "length": IMAGE_LIST_PAGE, "offset": offset},
             )
             if response.status_code >= 400:
                 raise RuntimeError(
-                    f"PC connectivity check failed: {response.status_code} {response.text}"
+                    f"PC image inventory failed: {response.status_code} {response.text}"
                 )
-        if settings.pc_validate_hub_source:
-            self.test_hub_source_uri()
+            body = response.json()
+            entities = body.get("entities") if isinstance(body, dict) else None
+            for entity in entities or []:
+                if not isinstance(entity, dict) or not image_is_complete(entity):
+                    continue
+                if image_checksum(entity) == sha256.lower():
+                    return entity.get("metadata", {}).get("uuid")
+            total = (body.get("metadata") or {}).get("total_matches")
+            offset += len(entities or [])
+            if not entities or total is None or offset >= total:
+                return None
 
-    def wait_for_task(self, task_uuid: str, timeout_seconds: int = 90) -> dict:
+    async def wait_for_task(
+        self,
+        task_uuid: str,
+        timeout_seconds: Optional[float] = None,
+        on_update: Optional[Callable[[dict], None]] = None,
+    ) -> dict:
         if not self.pc.api_url:
             raise ValueError("PC api_url is required for task polling.")
-        auth = (self.pc.username, self.pc.password)
-        deadline = time.time() + timeout_seconds
-        with httpx.Client(verify=False, timeout=20, auth=auth) as client:
-            while time.time() < deadline:
-                response = client.get(
-                    f"{self.pc.api_url}/api/nutanix/v3/tasks/{task_uuid}"
-                )
-                if response.status_code >= 400:
-                    raise RuntimeError(
-                        f"PC task polling failed: {response.status_code} {response.text}"
-                    )
-                body = response.json()
-                if not isinstance(body, dict):
-                    raise RuntimeError(f"Unexpected task response: {body}")
-                state = body.get("status", {}).get("state", "").upper()
-                if state in {"SUCCEEDED", "FAILED", "CANCELED"}:
-                    return body
-                time.sleep(3)
-        raise RuntimeError("PC task polling timed out.")
+        timeout = timeout_seconds or settings.pc_task_timeout
+        watcher = self.runtime.watcher(self.pc)
+        waiter = watcher.watch(task_uuid, on_update)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError("PC task polling timed out.")
+        finally:
+            # On a timeout or cancel the task would otherwise stay polled.
+            watcher.release(task_uuid, waiter, on_update)
 
-    def _extract_task_uuid(self, body: dict) -> Optional[str]:
-        if not isinstance(body, dict):
-            return None
-        for key in ("task_uuid", "taskUuid"):
-            if key in body:
-                return body[key]
-        status = body.get("status")
-        if isinstance(status, dict):
-            exec_ctx = status.get("execution_context") or status.get("executionContext")
-            if isinstance(exec_ctx, dict):
-                for key in ("task_uuid", "taskUuid"):
-                    if key in exec_ctx:
-                        return exec_ctx[key]
-        return None
+    def _source_base(self) -> Optional[str]:
+        # PCs behind an edge replica pull from it instead of the hub.
+        base = self.pc.source_url or settings.hub_base_url
+        return base.rstrip("/") if base else None
 
-    def test_hub_source_uri(self) -> None:
-        if not settings.hub_base_url:
+    async def test_hub_source_uri(self) -> None:
+        source_base = self._source_base()
+        if not source_base:
             raise ValueError("HUB_BASE_URL is required for source reachability check.")
         if not self.pc.api_url:
             raise ValueError("PC api_url is required for source reachability check.")
 
         test_name = f"hub-reachability-{uuid.uuid4().hex[:8]}"
-        source_uri = f"{settings.hub_base_url.rstrip('/')}/reachability"
+        source_uri = f"{source_base}/reachability"
         payload = {
             "metadata": {"kind": "image"},
             "spec": {
@@ -85,76 +303,332 @@ class PrismClient:
             },
         }
 
-        auth = (self.pc.username, self.pc.password)
-        with httpx.Client(verify=False, timeout=120, auth=auth) as client:
-            response = client.post(
-                f"{self.pc.api_url}/api/nutanix/v3/images", json=payload
+        response = await self._request(
+            "POST", "/api/nutanix/v3/images", json=payload, timeout=120
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(
+                "PC hub reachability check failed: "
+                f"{response.status_code} {response.text}"
             )
-            if response.status_code >= 400:
+        body = response.json()
+        task_uuid = extract_task_uuid(body)
+        if task_uuid:
+            task = await self.wait_for_task(task_uuid, timeout_seconds=90)
+            if not isinstance(task, dict):
+                raise RuntimeError(f"Unexpected task payload: {task}")
+            state = task_state(task)
+            if state != "SUCCEEDED":
                 raise RuntimeError(
-                    "PC hub reachability check failed: "
-                    f"{response.status_code} {response.text}"
+                    f"PC hub reachability check failed: task state {state}"
                 )
-            body = response.json()
-            task_uuid = self._extract_task_uuid(body)
-            if task_uuid:
-                task = self.wait_for_task(task_uuid)
-                if not isinstance(task, dict):
-                    raise RuntimeError(
-                        f"Unexpected task payload: {task}"
-                    )
-                state = task.get("status", {}).get("state", "").upper()
-                if state != "SUCCEEDED":
-                    raise RuntimeError(
-                        "PC hub reachability check failed: "
-                        f"task state {state}"
-                    )
-
-    def import_image(self, image: Image) -> dict:
+
+    async def submit_image_import(
+        self, image: Union[Image, ImageTarget], source_uri: Optional[str] = None
+    ) -> dict:
         if not self.pc.username or not self.pc.password:
             raise ValueError("PC credentials are required for import.")
         if not self.pc.api_url:
             raise ValueError("PC api_url is required for import.")
 
-        if not settings.hub_base_url:
+        source_base = self._source_base()
+        if not source_uri and not source_base:
             raise ValueError("HUB_BASE_URL is required to publish images.")
 
-        filename = os.path.basename(image.storage_uri)
+        image = ImageTarget.from_image(image)
+        filename = image.filename or os.path.basename(image.storage_uri)
         image_type = "DISK_IMAGE"
         if filename.lower().endswith(".iso"):
             image_type = "ISO_IMAGE"
 
-        source_uri = (
-            f"{settings.hub_base_url.rstrip('/')}/images/{image.id}/download"
-        )
+        if not source_uri:
+            source_uri = f"{source_base}/images/{image.id}/download"
+        resources = {"image_type": image_type, "source_uri": source_uri}
+        if image.sha256 and image.sha256 != "pending":
+            # PC verifies the download against this and reports it back in
+            # images/list, which is what find_image_by_checksum matches on.
+            resources["checksum"] = {
+                "checksum_algorithm": "SHA_256",
+                "checksum_value": image.sha256,
+            }
         payload = {
             "metadata": {"kind": "image"},
-            "spec": {
-                "name": image.name,
-                "resources": {"image_type": image_type, "source_uri": source_uri},
-            },
+            "spec": {"name": image.name, "resources": resources},
         }
 
-        auth = (self.pc.username, self.pc.password)
-        with httpx.Client(verify=False, timeout=120, auth=auth) as client:
-            response = client.post(
-                f"{self.pc.api_url}/api/nutanix/v3/images", json=payload
+        response = await self._request(
+            "POST", "/api/nutanix/v3/images", json=payload, timeout=120
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f"PC image import failed: {response.status_code} {response.text}"
             )
-            if response.status_code >= 400:
-                raise RuntimeError(
-                    f"PC image import failed: {response.status_code} {response.text}"
-                )
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        task_uuid = extract_task_uuid(body) if isinstance(body, dict) else None
+        return {
+            "status_code": response.status_code,
+            "body": body,
+            "task_uuid": task_uuid,
+        }
+
+    async def import_image(
+        self, image: Union[Image, ImageTarget], source_uri: Optional[str] = None
+    ) -> dict:
+        result = await self.submit_image_import(image, source_uri)
+        result["task"] = None
+        if result["task_uuid"]:
+            result["task"] = await self.wait_for_task(result["task_uuid"])
+        return result
+
+
+def task_state(task: dict) -> str:
+    status = task.get("status", {})
+    if isinstance(status, str):
+        return status.upper()
+    return (status.get("state") or "").upper()
+
+
+def image_is_complete(entity: dict) -> bool:
+    # Images still downloading (or failed) show up in images/list too.
+    status = entity.get("status")
+    if not isinstance(status, dict) or not status.get("state"):
+        return True
+    return status["state"].upper() == "COMPLETE"
+
+
+def image_checksum(entity: dict) -> Optional[str]:
+    for section in ("status", "spec"):
+        resources = (entity.get(section) or {}).get("resources") or {}
+        checksum = resources.get("checksum") or {}
+        if (checksum.get("checksum_algorithm") or "").upper() == "SHA_256":
+            value = checksum.get("checksum_value")
+            if value:
+                return value.lower()
+    return None
+
+
+def task_error(task: dict) -> str:
+    # v3 tasks carry the failure reason in error_detail, sometimes only in
+    # progress_message.
+    status = task.get("status")
+    details = [task, status] if isinstance(status, dict) else [task]
+    for detail in details:
+        for key in ("error_detail", "progress_message"):
+            if detail.get(key):
+                return str(detail[key])
+    return ""
+
+
+def task_progress(task: dict) -> Optional[int]:
+    status = task.get("status")
+    if isinstance(status, dict) and "percentage_complete" in status:
+        return status["percentage_complete"]
+    return task.get("percentage_complete")
+
+
+class TaskWatcher:
+    def __init__(self, client: AsyncPrismClient):
+        self.client = client
+        self.min_interval = settings.pc_task_poll_min_interval
+        self.max_interval = settings.pc_task_poll_max_interval
+        self.interval = self.min_interval
+        self.retries = max(settings.pc_task_poll_retries, 1)
+        self.polls = 0
+        # Consecutive polls that raised, and per task, lookups that failed.
+        self.failures = 0
+        self._errors: Dict[str, int] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._listeners: Dict[str, List[Callable[[dict], None]]] = {}
+        self._last_seen: Dict[str, tuple] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._futures)
+
+    def watch(
+        self, task_uuid: str, on_update: Optional[Callable[[dict], None]] = None
+    ) -> asyncio.Future:
+        future = self._futures.get(task_uuid)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[task_uuid] = future
+        if on_update is not None:
+            self._listeners.setdefault(task_uuid, []).append(on_update)
+        self.interval = self.min_interval
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._wake.set()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.ensure_future(self._run())
+        waiter = asyncio.shield(future)
+        self._waiters.setdefault(task_uuid, []).append(waiter)
+        return waiter
+
+    def release(
+        self,
+        task_uuid: str,
+        waiter: asyncio.Future,
+        on_update: Optional[Callable[[dict], None]] = None,
+    ) -> None:
+        # A waiter stopped waiting (resolved, timed out or cancelled). Once the
+        # last one is gone, a task that has not finished is no longer polled.
+        waiters = self._waiters.get(task_uuid, [])
+        if waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        listeners = self._listeners.get(task_uuid, [])
+        if on_update in listeners:
+            listeners.remove(on_update)
+        if waiters:
+            return
+        future = self._futures.get(task_uuid)
+        self._forget(task_uuid)
+        if future is not None and not future.done():
+            future.cancel()
+
+    def cancel(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+        self._futures.clear()
+        self._waiters.clear()
+
+    async def _run(self) -> None:
+        while self._futures:
             try:
-                body = response.json()
-            except ValueError:
-                body = response.text
-            task_uuid = self._extract_task_uuid(body) if isinstance(body, dict) else None
-            task = None
-            if task_uuid:
-                task = self.wait_for_task(task_uuid)
-            return {
-                "status_code": response.status_code,
-                "body": body,
-                "task_uuid": task_uuid,
-                "task": task,
-            }
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                changed = await self._poll()
+            except Exception as exc:
+                # A PC that is briefly unreachable (a restart, a network blip)
+                # only slows polling down; its watches fail once it stays
+                # down for pc_task_poll_retries polls in a row.
+                self.failures += 1
+                if self.failures >= self.retries:
+                    self.failures = 0
+                    self._fail_all(exc)
+                    return
+                self.interval = min(self.interval * 2, self.max_interval)
+                continue
+            self.failures = 0
+            if changed:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+
+    async def _poll(self) -> bool:
+        task_uuids = [
+            task_uuid for task_uuid, future in self._futures.items() if not future.done()
+        ]
+        self.polls += 1
+        metrics.task_polls.inc()
+        with metrics.timed(metrics.task_poll_seconds):
+            return await self._poll_tasks(task_uuids)
+
+    async def _poll_tasks(self, task_uuids: List[str]) -> bool:
+        tasks = await self.client.list_tasks(task_uuids)
+        missing = [task_uuid for task_uuid in task_uuids if task_uuid not in tasks]
+        if missing:
+            results = await asyncio.gather(
+                *(self.client.get_task(task_uuid) for task_uuid in missing),
+                return_exceptions=True,
+            )
+            for task_uuid, result in zip(missing, results):
+                if not isinstance(result, BaseException):
+                    self._errors.pop(task_uuid, None)
+                    tasks[task_uuid] = result
+                    continue
+                errors = self._errors.get(task_uuid, 0) + 1
+                if errors >= self.retries:
+                    self._resolve(task_uuid, error=result)
+                else:
+                    self._errors[task_uuid] = errors
+
+        changed = False
+        for task_uuid, task in tasks.items():
+            if task_uuid not in self._futures:
+                continue
+            state = task_state(task)
+            progress = (state, task_progress(task))
+            if self._last_seen.get(task_uuid) != progress:
+                self._last_seen[task_uuid] = progress
+                changed = True
+                for listener in self._listeners.get(task_uuid, []):
+                    listener(task)
+            if state in TERMINAL_TASK_STATES:
+                self._resolve(task_uuid, task=task)
+        return changed
+
+    def _resolve(
+        self,
+        task_uuid: str,
+        task: Optional[dict] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        future = self._futures.get(task_uuid)
+        self._forget(task_uuid)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(task)
+
+    def _forget(self, task_uuid: str) -> None:
+        for state in (
+            self._futures, self._waiters, self._listeners, self._last_seen, self._errors
+        ):
+            state.pop(task_uuid, None)
+
+    def _fail_all(self, error: BaseException) -> None:
+        for task_uuid in list(self._futures):
+            self._resolve(task_uuid, error=error)
+
+
+class PrismClient:
+    def __init__(self, pc: Union[PrismCentral, PCTarget]):
+        self.pc = pc
+        self._client = AsyncPrismClient(pc)
+
+    def _run(self, coro: Coroutine) -> Any:
+        return self._client.runtime.run(coro)
+
+    def ping(self) -> None:
+        self._run(self._client.ping())
+
+    def wait_for_task(
+        self, task_uuid: str, timeout_seconds: Optional[float] = None
+    ) -> dict:
+        return self._run(self._client.wait_for_task(task_uuid, timeout_seconds))
+
+    def _extract_task_uuid(self, body: dict) -> Optional[str]:
+        return extract_task_uuid(body)
+
+    def test_hub_source_uri(self) -> None:
+        self._run(self._client.test_hub_source_uri())
+
+    def submit_image_import(
+        self, image: Image, source_uri: Optional[str] = None
+    ) -> dict:
+        return self._run(
+            self._client.submit_image_import(ImageTarget.from_image(image), source_uri)
+        )
+
+    def find_image_by_checksum(self, sha256: str) -> Optional[str]:
+        return self._run(self._client.find_image_by_checksum(sha256))
+
+    def import_image(self, image: Image, source_uri: Optional[str] = None) -> dict:
+        return self._run(
+            self._client.import_image(ImageTarget.from_image(image), source_uri)
+        )
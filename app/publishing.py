@@ -0,0 +1,183 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import and_, bindparam, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.db import insert_or_ignore
+from app.events import record_job_events
+from app.models import Image, ImagePlacement, PrismCentral, SyncJob
+from app.scheduler import requeue_stale_jobs
+
+
+class PublishResult(NamedTuple):
+    jobs: list
+    created: list
+
+
+def _target_pc_ids(db: Session, pc_ids: Optional[Sequence[int]]) -> List[int]:
+    query = db.query(PrismCentral.id)
+    if pc_ids:
+        wanted = set(pc_ids)
+        found = [row.id for row in query.filter(PrismCentral.id.in_(wanted))]
+        missing = sorted(wanted.difference(found))
+        if missing:
+            raise HTTPException(
+                status_code=404, detail=f"Prism Central not found: {missing}."
+            )
+        return sorted(found)
+    found = [row.id for row in query.order_by(PrismCentral.id)]
+    if not found:
+        raise HTTPException(status_code=400, detail="No Prism Central instances.")
+    return found
+
+
+def _approved_images(db: Session, image_ids: Sequence[int]) -> Dict[str, int]:
+    wanted = list(dict.fromkeys(image_ids))
+    rows = (
+        db.query(Image.id, Image.sha256, Image.approved)
+        .filter(Image.id.in_(wanted))
+        .all()
+    )
+    found = {row.id: row for row in rows}
+    missing = [image_id for image_id in wanted if image_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Image not found: {missing}.")
+    pending = [image_id for image_id in wanted if not found[image_id].approved]
+    if pending:
+        raise HTTPException(status_code=400, detail=f"Image not approved: {pending}.")
+    # Images with identical content share one placement per PC, so only the
+    # first image per digest gets a job.
+    by_digest: Dict[str, int] = {}
+    for image_id in wanted:
+        by_digest.setdefault(found[image_id].sha256, image_id)
+    return by_digest
+
+
+def create_sync_jobs(
+    db: Session,
+    image_ids: Sequence[int],
+    pc_ids: Optional[Sequence[int]] = None,
+    force: bool = False,
+    priority: int = 0,
+) -> PublishResult:
+    images = _approved_images(db, image_ids)
+    targets = _target_pc_ids(db, pc_ids)
+    now = datetime.utcnow()
+    placements = ImagePlacement.__table__
+    jobs = SyncJob.__table__
+
+    db.execute(
+        insert_or_ignore(placements),
+        [
+            {
+                "sha256": digest,
+                "pc_id": pc_id,
+                "status": "pending",
+                "created_at": now,
+                "updated_at": now,
+            }
+            for digest in images
+            for pc_id in targets
+        ],
+    )
+
+    # Claiming is a conditional UPDATE, so of two concurrent publishes only one
+    # moves a placement to "importing"; the other coalesces onto its job.
+    claimable = or_(
+        placements.c.status.in_(["pending", "failed"]),
+        and_(placements.c.status == "importing", placements.c.job_id.is_(None)),
+    )
+    if force:
+        claimable = or_(claimable, placements.c.status == "present")
+    in_scope = and_(
+        placements.c.sha256.in_(list(images)), placements.c.pc_id.in_(targets)
+    )
+    claimed = db.execute(
+        update(placements)
+        .where(in_scope, claimable)
+        .values(status="importing", updated_at=now)
+        .returning(placements.c.sha256, placements.c.pc_id)
+    ).all()
+
+    created = []
+    if claimed:
+        # A Core executemany with RETURNING is sent as batched multi-row
+        # INSERTs ("insertmanyvalues"); an ORM flush falls back to a statement
+        # per row on SQLite. The returned rows carry every column the API
+        # renders, so the jobs are never reloaded.
+        created = db.execute(
+            insert(jobs).returning(*jobs.c),
+            [
+                {
+                    "image_id": images[digest],
+                    "pc_id": pc_id,
+                    "status": "queued",
+                    "priority": priority,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for digest, pc_id in claimed
+            ],
+        ).all()
+        digests = {image_id: digest for digest, image_id in images.items()}
+        db.execute(
+            update(placements)
+            .where(
+                placements.c.sha256 == bindparam("b_sha256"),
+                placements.c.pc_id == bindparam("b_pc_id"),
+            )
+            .values(job_id=bindparam("b_job_id")),
+            [
+                {
+                    "b_sha256": digests[job.image_id],
+                    "b_pc_id": job.pc_id,
+                    "b_job_id": job.id,
+                }
+                for job in created
+            ],
+        )
+        record_job_events(db, [job.id for job in created], "queued")
+
+    # A job that was never dispatched, or whose worker died before submitting
+    # the import, would hold its placement at "importing" for good; it is
+    # queued again instead, and the dispatch that follows this publish starts
+    # it.
+    requeue_stale_jobs(
+        db,
+        select(placements.c.job_id).where(
+            in_scope, placements.c.status == "importing"
+        ),
+    )
+    created_ids = {job.id for job in created}
+    in_flight = [
+        job
+        for job in db.execute(
+            jobs.select()
+            .join(placements, placements.c.job_id == jobs.c.id)
+            .where(in_scope, placements.c.status == "importing")
+        ).all()
+        if job.id not in created_ids
+    ]
+    if in_flight and priority:
+        # A more urgent publish moves jobs that have not started yet up.
+        bumped = {
+            job.id: job
+            for job in db.execute(
+                update(jobs)
+                .where(
+                    jobs.c.id.in_([job.id for job in in_flight]),
+                    jobs.c.status.in_(("queued", "waiting")),
+                    jobs.c.priority < priority,
+                )
+                .values(priority=priority)
+                .returning(*jobs.c)
+            )
+        }
+        in_flight = [bumped.get(job.id, job) for job in in_flight]
+    db.commit()
+    return PublishResult(
+        jobs=sorted([*created, *in_flight], key=lambda job: job.id),
+        created=sorted(created, key=lambda job: job.id),
+    )
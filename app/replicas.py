@@ -0,0 +1,111 @@
+import asyncio
+from typing import Iterable, List, Optional, Tuple
+
+import httpx
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Blob, Image, PrismCentral, SyncJob
+from app.prism import prism_runtime
+from app.storage import storage_client
+
+
+def is_edge() -> bool:
+    return settings.hub_role.lower() == "edge"
+
+
+class EdgeReplica:
+    # An edge keeps no catalogue of its own. Image ids resolve through the
+    # upstream's HEAD response, whose ETag is the sha256, and the bytes come
+    # from the local blob cache, filled from the upstream /blobs route. Only
+    # what is keyed by sha256 is cached: an id can be deleted upstream, and
+    # it must stop resolving here at once.
+    def __init__(self, upstream_url: Optional[str]):
+        self.upstream_url = (upstream_url or "").rstrip("/")
+
+    def blob_uri(self, sha256: str) -> str:
+        if not self.upstream_url:
+            raise ValueError("EDGE_UPSTREAM_URL is required for the edge role.")
+        return f"{self.upstream_url}/blobs/{sha256}"
+
+    def resolve_image(self, image_id: int) -> Optional[Image]:
+        response = storage_client.http.head(
+            f"{self.upstream_url}/images/{image_id}/download"
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        sha256 = response.headers.get("etag", "").strip('"')
+        if not sha256:
+            return None
+        filename = None
+        disposition = response.headers.get("content-disposition", "")
+        if "filename=" in disposition:
+            filename = disposition.split("filename=", 1)[1].strip('"')
+        image = Image(
+            id=image_id,
+            sha256=sha256,
+            filename=filename,
+            storage_uri=self.blob_uri(sha256),
+        )
+        length = response.headers.get("content-length")
+        storage_client.remember_size(image.storage_uri, int(length) if length else None)
+        return image
+
+
+def blob_image(db: Session, sha256: str) -> Optional[Image]:
+    if is_edge():
+        return Image(
+            sha256=sha256, filename=sha256, storage_uri=edge_replica.blob_uri(sha256)
+        )
+    blob = db.query(Blob).filter(Blob.sha256 == sha256).first()
+    if blob is None:
+        return None
+    return Image(
+        sha256=blob.sha256, filename=blob.sha256, storage_uri=blob.storage_uri
+    )
+
+
+def image_replica_targets(db: Session, sha256: str) -> List[Tuple[str, str]]:
+    urls = (
+        db.query(PrismCentral.source_url)
+        .filter(PrismCentral.source_url.isnot(None))
+        .distinct()
+        .all()
+    )
+    return [(sha256, url) for (url,) in urls]
+
+
+def job_replica_targets(db: Session, job_ids: List[int]) -> List[Tuple[str, str]]:
+    if not job_ids:
+        return []
+    rows = (
+        db.query(Image.sha256, PrismCentral.source_url)
+        .join(SyncJob, SyncJob.image_id == Image.id)
+        .join(PrismCentral, PrismCentral.id == SyncJob.pc_id)
+        .filter(SyncJob.id.in_(job_ids), PrismCentral.source_url.isnot(None))
+        .distinct()
+        .all()
+    )
+    return [(sha256, url) for sha256, url in rows]
+
+
+def warm_replicas(targets: Iterable[Tuple[str, str]]) -> None:
+    targets = sorted(set(targets))
+    if targets:
+        prism_runtime.submit(_warm(targets))
+
+
+async def _warm(targets: List[Tuple[str, str]]) -> None:
+    # Best effort: a cold replica only costs the first pull a trip upstream.
+    async with httpx.AsyncClient(timeout=settings.pc_request_timeout) as client:
+        await asyncio.gather(
+            *(
+                client.post(f"{url.rstrip('/')}/blobs/{sha256}/warm")
+                for sha256, url in targets
+            ),
+            return_exceptions=True,
+        )
+
+
+edge_replica = EdgeReplica(settings.edge_upstream_url)
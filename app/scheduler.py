@@ -0,0 +1,190 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.events import record_job_events
+from app.models import PrismCentral, SyncJob
+
+# The queue of every PC is its queued/waiting sync jobs; the scheduler decides
+# which of them start, so the broker (or the in-process pool) only ever sees
+# jobs that can claim a slot right away.
+
+
+def active_imports(now: datetime, pc_id=None):
+    # Running jobs hold an import slot. Anything older than the task timeout
+    # belongs to a worker that died and no longer counts against the limit.
+    running = SyncJob.__table__.alias("running")
+    cutoff = now - timedelta(seconds=settings.pc_task_timeout)
+    query = (
+        select(func.count())
+        .select_from(running)
+        .where(running.c.status == "running", running.c.updated_at >= cutoff)
+    )
+    if pc_id is not None:
+        query = query.where(running.c.pc_id == pc_id)
+    return query
+
+
+def stale_jobs(now: datetime):
+    # Queued jobs nobody dispatched within sync_dispatch_timeout (the process
+    # died between commit and dispatch, or the broker lost the message), and
+    # running jobs whose worker died before submitting the import. Once a job
+    # has a task_uuid its PC is importing it; the task watch's heartbeat keeps
+    # it fresh, and resume_task_watches takes over a watch that stopped.
+    queued_cutoff = now - timedelta(seconds=settings.sync_dispatch_timeout)
+    running_cutoff = now - timedelta(seconds=settings.pc_task_timeout)
+    return or_(
+        and_(SyncJob.status == "queued", SyncJob.updated_at < queued_cutoff),
+        and_(
+            SyncJob.status == "running",
+            SyncJob.task_uuid.is_(None),
+            SyncJob.updated_at < running_cutoff,
+        ),
+    )
+
+
+def requeue_stale_jobs(db: Session, job_ids=None) -> List[int]:
+    # Stale jobs go back to their PC's queue as waiting, so the next
+    # scheduling pass starts them again. job_ids (ids or a select) narrows the
+    # sweep; the caller commits.
+    now = datetime.utcnow()
+    query = update(SyncJob).where(stale_jobs(now))
+    if job_ids is not None:
+        query = query.where(SyncJob.id.in_(job_ids))
+    requeued = list(
+        db.execute(
+            query.values(
+                status="waiting", task_uuid=None, watcher=None, updated_at=now
+            )
+            .returning(SyncJob.id)
+            .execution_options(synchronize_session=False)
+        ).scalars()
+    )
+    record_job_events(db, requeued, "waiting")
+    return requeued
+
+
+def pc_limit(max_in_flight: Optional[int]) -> int:
+    return settings.sync_pc_max_in_flight if max_in_flight is None else max_in_flight
+
+
+def _running_per_pc(db: Session, now: datetime) -> Dict[int, int]:
+    cutoff = now - timedelta(seconds=settings.pc_task_timeout)
+    return dict(
+        db.query(SyncJob.pc_id, func.count())
+        .filter(SyncJob.status == "running", SyncJob.updated_at >= cutoff)
+        .group_by(SyncJob.pc_id)
+        .all()
+    )
+
+
+def next_jobs(db: Session, new_job_ids: Iterable[int] = ()) -> List[int]:
+    # Picks the jobs to start now: higher priority first, then one job per PC
+    # per round, skipping PCs at their in-flight limit, up to the free global
+    # import slots. New jobs that do not make the cut are parked as waiting
+    # and started by a later pass when a slot frees up.
+    new_job_ids = list(new_job_ids)
+    # Jobs whose dispatch or worker was lost hold no slot; they queue again
+    # behind their PC's other work.
+    requeue_stale_jobs(db)
+    now = datetime.utcnow()
+    running = _running_per_pc(db, now)
+    free = None
+    if settings.publish_max_active_imports > 0:
+        free = settings.publish_max_active_imports - sum(running.values())
+    limits = {
+        pc_id: pc_limit(max_in_flight)
+        for pc_id, max_in_flight in db.query(
+            PrismCentral.id, PrismCentral.max_in_flight
+        )
+    }
+    pc_free = {
+        pc_id: limit - running.get(pc_id, 0)
+        for pc_id, limit in limits.items()
+        if limit > 0
+    }
+    saturated = [pc_id for pc_id, slots in pc_free.items() if slots <= 0]
+
+    selected: List[int] = []
+    if free is None or free > 0:
+        pending = SyncJob.status == "waiting"
+        if new_job_ids:
+            pending = or_(
+                pending, and_(SyncJob.id.in_(new_job_ids), SyncJob.status == "queued")
+            )
+        rank = (
+            func.row_number()
+            .over(
+                partition_by=SyncJob.pc_id,
+                order_by=(SyncJob.priority.desc(), SyncJob.id),
+            )
+            .label("rank")
+        )
+        candidates = select(SyncJob.id, SyncJob.pc_id, SyncJob.priority, rank).where(
+            pending
+        )
+        if saturated:
+            candidates = candidates.where(SyncJob.pc_id.not_in(saturated))
+        candidates = candidates.subquery()
+        query = select(candidates.c.id, candidates.c.pc_id).order_by(
+            candidates.c.priority.desc(), candidates.c.rank, candidates.c.id
+        )
+        unlimited = [pc_id for pc_id in limits if pc_id not in pc_free]
+        if pc_free and not unlimited:
+            # No PC starts more than its free slots, so deeper ranks never run.
+            query = query.where(candidates.c.rank <= max(pc_free.values()))
+        for job_id, pc_id in db.execute(query):
+            if pc_id in pc_free:
+                if pc_free[pc_id] <= 0:
+                    continue
+                pc_free[pc_id] -= 1
+            selected.append(job_id)
+            if free is not None and len(selected) >= free:
+                break
+
+    chosen = set(selected)
+    parked = [job_id for job_id in new_job_ids if job_id not in chosen]
+    if parked:
+        jobs = SyncJob.__table__
+        parked = list(
+            db.execute(
+                update(jobs)
+                .where(jobs.c.id.in_(parked), jobs.c.status == "queued")
+                .values(status="waiting", updated_at=now)
+                .returning(jobs.c.id)
+            ).scalars()
+        )
+        if parked:
+            record_job_events(db, parked, "waiting")
+    db.commit()
+    return selected
+
+
+def queue_depths(db: Session) -> List[dict]:
+    running = _running_per_pc(db, datetime.utcnow())
+    pending: Dict[int, Dict[str, int]] = {}
+    top_priority: Dict[int, int] = {}
+    for pc_id, status, count, priority in (
+        db.query(SyncJob.pc_id, SyncJob.status, func.count(), func.max(SyncJob.priority))
+        .filter(SyncJob.status.in_(("queued", "waiting")))
+        .group_by(SyncJob.pc_id, SyncJob.status)
+    ):
+        pending.setdefault(pc_id, {})[status] = count
+        top_priority[pc_id] = max(priority, top_priority.get(pc_id, priority))
+    return [
+        {
+            "pc_id": pc.id,
+            "name": pc.name,
+            "queued": pending.get(pc.id, {}).get("queued", 0),
+            "waiting": pending.get(pc.id, {}).get("waiting", 0),
+            "running": running.get(pc.id, 0),
+            "max_in_flight": pc_limit(pc.max_in_flight),
+            "top_priority": top_priority.get(pc.id),
+        }
+        for pc in db.query(
+            PrismCentral.id, PrismCentral.name, PrismCentral.max_in_flight
+        ).order_by(PrismCentral.id)
+    ]
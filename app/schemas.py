@@ -1,8 +1,8 @@
 from datetime import datetime
 
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class ImageCreate(BaseModel):
@@ -29,12 +29,21 @@ class PrismCentralCreate(BaseModel):
     api_url: str
     username: Optional[str] = None
     password: Optional[str] = None
+    source_url: Optional[str] = None
+    max_in_flight: Optional[int] = Field(None, ge=0)
 
 
 class PrismCentralRead(BaseModel):
     id: int
     name: str
     api_url: str
+    source_url: Optional[str] = None
+    direct_source: Optional[bool] = None
+    direct_checked_at: Optional[datetime] = None
+    max_in_flight: Optional[int] = None
+    connected: Optional[bool] = None
+    health_status: Optional[str] = None
+    last_checked_at: Optional[datetime] = None
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
@@ -45,8 +54,50 @@ class SyncJobRead(BaseModel):
     image_id: int
     pc_id: int
     status: str
+    priority: int = 0
+    task_uuid: Optional[str] = None
     detail: Optional[str]
     created_at: datetime
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class PublishRequest(BaseModel):
+    pc_ids: Optional[List[int]] = None
+    force: bool = False
+    # Higher runs first, e.g. urgent security images.
+    priority: int = 0
+
+
+class BatchPublishRequest(BaseModel):
+    image_ids: List[int]
+    pc_ids: Optional[List[int]] = None
+    force: bool = False
+    priority: int = 0
+
+
+class UploadSessionCreate(BaseModel):
+    name: str
+    version: str
+    filename: str
+    source: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+
+class UploadSessionRead(BaseModel):
+    id: str
+    name: str
+    version: str
+    source: Optional[str]
+    filename: str
+    size: Optional[int]
+    received_bytes: int
+    next_chunk: int
+    status: str
+    image_id: Optional[int]
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
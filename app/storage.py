@@ -1,47 +1,349 @@
 import hashlib
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import boto3
+import httpx
 
+from app import metrics
 from app.config import settings
 
+PRESIGN_MAX_EXPIRY = 7 * 24 * 3600
+
+
+class StagedBlob(NamedTuple):
+    location: Optional[str]
+    digest: str
+    size: int
+
+
+class _HashingReader:
+    def __init__(self, stream: BinaryIO, chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.hash_seconds = 0.0
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.chunk_size
+        chunk = self.stream.read(size)
+        if chunk:
+            started = time.perf_counter()
+            self.hasher.update(chunk)
+            self.hash_seconds += time.perf_counter() - started
+            self.size += len(chunk)
+        return chunk
+
 
 class StorageClient:
     def __init__(self):
         self.backend = settings.storage_backend.lower()
         self.local_path = Path(settings.local_storage_path)
-        self.local_path.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = settings.upload_chunk_size
+        self.read_size = settings.download_chunk_size
+        self.part_size = max(settings.s3_multipart_part_size, 5 * 1024 * 1024)
+        self.part_concurrency = max(settings.s3_multipart_concurrency, 1)
+        self.part_retries = max(settings.s3_multipart_max_retries, 0)
+
+        self._s3 = None
+        self._http: Optional[httpx.Client] = None
+        self._remote_sizes: Dict[str, Optional[int]] = {}
+        self._http_lock = threading.Lock()
+        self._s3_lock = threading.Lock()
+
+    @property
+    def s3(self):
+        # boto3 is slow to import and to build a client, so only S3
+        # deployments pay for it, on first use rather than at import.
+        if self.backend != "s3":
+            return None
+        with self._s3_lock:
+            if self._s3 is None:
+                import boto3
+
+                self._s3 = boto3.client(
+                    "s3",
+                    region_name=settings.s3_region,
+                    endpoint_url=settings.s3_endpoint_url,
+                    aws_access_key_id=settings.s3_access_key_id,
+                    aws_secret_access_key=settings.s3_secret_access_key,
+                )
+            return self._s3
+
+    @property
+    def http(self) -> httpx.Client:
+        # Used by edge replicas to reach their upstream hub.
+        with self._http_lock:
+            if self._http is None:
+                self._http = httpx.Client(
+                    timeout=httpx.Timeout(settings.pc_request_timeout, read=None),
+                    follow_redirects=True,
+                )
+            return self._http
+
+    def is_remote(self, uri: str) -> bool:
+        return uri.startswith(("s3://", "http://", "https://"))
 
+    def remember_size(self, uri: str, size: Optional[int]) -> None:
+        # Blobs are content-addressed, so an upstream size never changes.
+        self._remote_sizes[uri] = size
+
+    def blob_key(self, digest: str) -> str:
+        return f"blobs/{digest[:2]}/{digest}"
+
+    def blob_uri(self, digest: str) -> str:
         if self.backend == "s3":
-            self.s3 = boto3.client(
-                "s3",
-                region_name=settings.s3_region,
-                endpoint_url=settings.s3_endpoint_url,
-                aws_access_key_id=settings.s3_access_key_id,
-                aws_secret_access_key=settings.s3_secret_access_key,
+            return f"s3://{self._bucket()}/{self.blob_key(digest)}"
+        return str(self.local_path / self.blob_key(digest))
+
+    def _bucket(self) -> str:
+        if not settings.s3_bucket:
+            raise ValueError("S3_BUCKET is required when using s3 backend.")
+        return settings.s3_bucket
+
+    def stage(
+        self,
+        data: Union[bytes, BinaryIO],
+        known: Optional[Callable[[str], bool]] = None,
+    ) -> StagedBlob:
+        if isinstance(data, (bytes, bytearray)):
+            data = BytesIO(data)
+        reader = _HashingReader(data, self.chunk_size)
+        try:
+            with metrics.timed(
+                metrics.storage_write_seconds, backend=self.backend, operation="stage"
+            ):
+                return self._stage(reader, known)
+        finally:
+            metrics.upload_bytes.inc(reader.size)
+            metrics.hash_seconds.observe(reader.hash_seconds)
+
+    def _stage(
+        self, reader: _HashingReader, known: Optional[Callable[[str], bool]]
+    ) -> StagedBlob:
+        def keep() -> bool:
+            return not (known and known(reader.hasher.hexdigest()))
+
+        if self.backend == "s3":
+            staging_key = f".staging/{uuid.uuid4().hex}"
+            stored = self._s3_upload_stream(
+                self._bucket(), staging_key, reader, before_complete=keep
+            )
+            return StagedBlob(
+                staging_key if stored else None, reader.hasher.hexdigest(), reader.size
             )
-        else:
-            self.s3 = None
 
-    def save(self, image_id: int, filename: str, data: bytes) -> tuple[str, str]:
-        digest = hashlib.sha256(data).hexdigest()
-        safe_name = os.path.basename(filename)
-        key = f"{image_id}/{digest}-{safe_name}"
+        staging_dir = self.local_path / ".staging"
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        staging_path = staging_dir / uuid.uuid4().hex
+        try:
+            with staging_path.open("wb") as handle:
+                while True:
+                    chunk = reader.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    handle.write(chunk)
+            stored = keep()
+        except BaseException:
+            staging_path.unlink()
+            raise
+        if not stored:
+            staging_path.unlink()
+        return StagedBlob(
+            str(staging_path) if stored else None,
+            reader.hasher.hexdigest(),
+            reader.size,
+        )
+
+    def commit(self, staged: StagedBlob) -> str:
+        with metrics.timed(
+            metrics.storage_write_seconds, backend=self.backend, operation="commit"
+        ):
+            return self._commit(staged)
 
+    def _commit(self, staged: StagedBlob) -> str:
         if self.backend == "s3":
-            if not settings.s3_bucket:
-                raise ValueError("S3_BUCKET is required when using s3 backend.")
-            self.s3.put_object(Bucket=settings.s3_bucket, Key=key, Body=data)
-            uri = f"s3://{settings.s3_bucket}/{key}"
-            return uri, digest
+            bucket = self._bucket()
+            try:
+                self.s3.copy(
+                    {"Bucket": bucket, "Key": staged.location},
+                    bucket,
+                    self.blob_key(staged.digest),
+                )
+            finally:
+                self.s3.delete_object(Bucket=bucket, Key=staged.location)
+            return self.blob_uri(staged.digest)
+        return self._promote_local(Path(staged.location), staged.digest)
+
+    def discard(self, staged: StagedBlob) -> None:
+        if staged.location is None:
+            return
+        if self.backend == "s3":
+            self.s3.delete_object(Bucket=self._bucket(), Key=staged.location)
+        elif os.path.exists(staged.location):
+            os.unlink(staged.location)
+
+    def store_file(self, path: Path, digest: str) -> str:
+        with metrics.timed(
+            metrics.storage_write_seconds, backend=self.backend, operation="store"
+        ):
+            return self._store_file(path, digest)
+
+    def _store_file(self, path: Path, digest: str) -> str:
+        if self.backend == "s3":
+            with open(path, "rb") as handle:
+                self._s3_upload_stream(self._bucket(), self.blob_key(digest), handle)
+            os.unlink(path)
+            return self.blob_uri(digest)
+        return self._promote_local(Path(path), digest)
+
+    def delete(self, uri: str) -> None:
+        if uri.startswith("s3://"):
+            bucket, key = self.parse_s3_uri(uri)
+            self.s3.delete_object(Bucket=bucket, Key=key)
+        elif os.path.exists(uri):
+            os.unlink(uri)
 
-        path = self.local_path / key
+    def _promote_local(self, staging_path: Path, digest: str) -> str:
+        path = self.local_path / self.blob_key(digest)
         path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_bytes(data)
-        uri = str(path)
-        return uri, digest
+        os.replace(staging_path, path)
+        return str(path)
+
+    def _s3_upload_stream(
+        self,
+        bucket: str,
+        key: str,
+        stream,
+        before_complete: Optional[Callable[[], bool]] = None,
+    ) -> bool:
+        first = stream.read(self.part_size)
+        if len(first) < self.part_size:
+            if before_complete and not before_complete():
+                return False
+            self.s3.put_object(Bucket=bucket, Key=key, Body=first)
+            return True
+
+        upload_id = self.s3.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+        try:
+            futures = []
+            slots = threading.BoundedSemaphore(self.part_concurrency)
+            with ThreadPoolExecutor(max_workers=self.part_concurrency) as pool:
+                chunk = first
+                part_number = 1
+                while chunk:
+                    slots.acquire()
+                    if any(f.done() and f.exception() for f in futures):
+                        slots.release()
+                        break
+                    future = pool.submit(
+                        self._s3_upload_part, bucket, key, upload_id, part_number, chunk
+                    )
+                    future.add_done_callback(lambda _: slots.release())
+                    futures.append(future)
+                    part_number += 1
+                    chunk = stream.read(self.part_size)
+            parts = [future.result() for future in futures]
+            if before_complete and not before_complete():
+                self.s3.abort_multipart_upload(
+                    Bucket=bucket, Key=key, UploadId=upload_id
+                )
+                return False
+            self.s3.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+            return True
+        except BaseException:
+            self.s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def _s3_upload_part(
+        self, bucket: str, key: str, upload_id: str, part_number: int, body: bytes
+    ) -> dict:
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        attempt = 0
+        while True:
+            try:
+                response = self.s3.upload_part(
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=body,
+                )
+                return {"ETag": response["ETag"], "PartNumber": part_number}
+            except (BotoCoreError, ClientError):
+                if attempt >= self.part_retries:
+                    raise
+                time.sleep(min(0.5 * 2**attempt, 10))
+                attempt += 1
+
+    def abort_stale_uploads(self, max_age_seconds: int) -> int:
+        if not self.s3 or not settings.s3_bucket:
+            return 0
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+        aborted = 0
+        paginator = self.s3.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=settings.s3_bucket):
+            for upload in page.get("Uploads", []):
+                if upload["Initiated"] > cutoff:
+                    continue
+                self.s3.abort_multipart_upload(
+                    Bucket=settings.s3_bucket,
+                    Key=upload["Key"],
+                    UploadId=upload["UploadId"],
+                )
+                aborted += 1
+        return aborted
+
+    def remove_stale_staging(self, max_age_seconds: int) -> int:
+        # Staged blobs are promoted or discarded by the request that wrote
+        # them; anything older than max_age belongs to a worker that crashed
+        # in between.
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+        removed = 0
+        if self.backend == "s3":
+            if not settings.s3_bucket:
+                return 0
+            paginator = self.s3.get_paginator("list_objects_v2")
+            pages = paginator.paginate(Bucket=settings.s3_bucket, Prefix=".staging/")
+            for page in pages:
+                for item in page.get("Contents", []):
+                    if item["LastModified"] > cutoff:
+                        continue
+                    self.s3.delete_object(Bucket=settings.s3_bucket, Key=item["Key"])
+                    removed += 1
+            return removed
+        staging_dir = self.local_path / ".staging"
+        if not staging_dir.is_dir():
+            return 0
+        for path in staging_dir.iterdir():
+            modified = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+            if modified <= cutoff:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
 
     def parse_s3_uri(self, uri: str) -> tuple[str, str]:
         if not uri.startswith("s3://"):
@@ -58,6 +360,21 @@ class StorageClient:
         filename = os.path.basename(key)
         return response["Body"], filename, response.get("ContentLength")
 
+    def presign_get(self, uri: str, size: Optional[int]) -> str:
+        # PCs may come back with ranged requests late in a long pull, so the
+        # URL has to outlive the whole image at the slowest expected rate.
+        if not self.s3:
+            raise ValueError("S3 client not configured.")
+        bucket, key = self.parse_s3_uri(uri)
+        expiry = settings.s3_presign_min_expiry + (size or 0) // max(
+            settings.s3_presign_min_bandwidth, 1
+        )
+        return self.s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket, "Key": key},
+            ExpiresIn=min(expiry, PRESIGN_MAX_EXPIRY),
+        )
+
     def head_s3_object(self, uri: str) -> Tuple[str, Optional[int]]:
         if not self.s3:
             raise ValueError("S3 client not configured.")
@@ -66,5 +383,61 @@ class StorageClient:
         filename = os.path.basename(key)
         return filename, response.get("ContentLength")
 
+    def stat(self, uri: str) -> Tuple[str, Optional[int]]:
+        if uri.startswith("s3://"):
+            return self.head_s3_object(uri)
+        if uri.startswith(("http://", "https://")):
+            if uri not in self._remote_sizes:
+                response = self.http.head(uri)
+                response.raise_for_status()
+                length = response.headers.get("content-length")
+                self.remember_size(uri, int(length) if length else None)
+            return os.path.basename(uri), self._remote_sizes[uri]
+        return os.path.basename(uri), os.path.getsize(uri)
+
+    def iter_range(
+        self, uri: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        if uri.startswith("s3://"):
+            if not self.s3:
+                raise ValueError("S3 client not configured.")
+            bucket, key = self.parse_s3_uri(uri)
+            params = {"Bucket": bucket, "Key": key}
+            if start or end is not None:
+                params["Range"] = f"bytes={start}-{'' if end is None else end}"
+            body = self.s3.get_object(**params)["Body"]
+            try:
+                yield from body.iter_chunks(self.read_size)
+            finally:
+                body.close()
+            return
+
+        if uri.startswith(("http://", "https://")):
+            headers = {}
+            if start or end is not None:
+                headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+            with self.http.stream("GET", uri, headers=headers) as response:
+                if response.status_code == 404:
+                    # Gone upstream: the next stat() asks again instead of
+                    # vouching for it from the remembered size.
+                    self._remote_sizes.pop(uri, None)
+                response.raise_for_status()
+                yield from response.iter_bytes(self.read_size)
+            return
+
+        remaining = None if end is None else end - start + 1
+        with open(uri, "rb") as handle:
+            handle.seek(start)
+            while remaining is None or remaining > 0:
+                size = self.read_size
+                if remaining is not None:
+                    size = min(size, remaining)
+                chunk = handle.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
 
 storage_client = StorageClient()
@@ -1,32 +1,157 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
 import json
+from typing import Optional
+from uuid import uuid4
 
-from celery import Celery
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
+from app import metrics
 from app.config import settings
 from app.db import SessionLocal
-from app.models import Image, PrismCentral, SyncJob
-from app.prism import PrismClient
+from app.events import record_job_event, record_job_progress
+from app.models import Blob, Image, ImagePlacement, PrismCentral, SyncJob
+from app.prism import (
+    AsyncPrismClient,
+    PCTarget,
+    PrismClient,
+    TERMINAL_TASK_STATES,
+    prism_runtime,
+    task_error,
+    task_progress,
+    task_state,
+)
+from app.scheduler import active_imports, pc_limit
+from app.storage import storage_client
 
-celery_app = Celery(
-    "image_hub",
-    broker=settings.celery_broker_url,
-    backend=settings.celery_result_backend,
+# Task errors that show the PC could not reach the object store at all. Any
+# other failed import fails the job as usual; retrying it via the hub would
+# not help.
+UNREACHABLE_ERRORS = (
+    "could not resolve",
+    "name resolution",
+    "connection refused",
+    "failed to connect",
+    "could not connect",
+    "timed out",
+    "unreachable",
+    "ssl",
+    "certificate",
+    "403",
+    "forbidden",
+    "access denied",
 )
 
 
-@celery_app.task
+def _settle_placement(
+    db: Session, job_id: int, status: str, image_uuid: Optional[str] = None
+) -> None:
+    values = {"status": status, "updated_at": datetime.utcnow()}
+    if image_uuid:
+        values["image_uuid"] = image_uuid
+    db.query(ImagePlacement).filter(ImagePlacement.job_id == job_id).update(
+        values, synchronize_session=False
+    )
+
+
+def _direct_retry_due(pc: PrismCentral) -> bool:
+    # The network may have been fixed since the PC last failed to reach the
+    # store, so it is offered again once s3_direct_retry_ttl has passed.
+    if pc.direct_checked_at is None:
+        return True
+    retry_ttl = timedelta(seconds=settings.s3_direct_retry_ttl)
+    return datetime.utcnow() - pc.direct_checked_at >= retry_ttl
+
+
+def _direct_source(db: Session, image: Image, pc: PrismCentral) -> Optional[str]:
+    # PCs pull straight from the object store unless they sit behind an edge
+    # replica or recently failed to reach the store.
+    if not settings.s3_presign_imports or pc.source_url:
+        return None
+    if pc.direct_source is False and not _direct_retry_due(pc):
+        return None
+    if not image.storage_uri.startswith("s3://"):
+        return None
+    size = db.query(Blob.size).filter(Blob.sha256 == image.sha256).scalar()
+    return storage_client.presign_get(image.storage_uri, size)
+
+
+def _store_unreachable(task) -> bool:
+    error = task_error(task).lower() if isinstance(task, dict) else ""
+    return any(marker in error for marker in UNREACHABLE_ERRORS)
+
+
+def _imported_image_uuid(result: dict) -> Optional[str]:
+    body = result.get("body") if isinstance(result, dict) else None
+    if isinstance(body, dict):
+        return (body.get("metadata") or {}).get("uuid")
+    return None
+
+
+def _claim_import_slot(db: Session, job_id: int) -> bool:
+    now = datetime.utcnow()
+    job = (
+        db.query(SyncJob.pc_id, PrismCentral.max_in_flight)
+        .outerjoin(PrismCentral, PrismCentral.id == SyncJob.pc_id)
+        .filter(SyncJob.id == job_id)
+        .first()
+    )
+    if job is None:
+        return False
+    claim = update(SyncJob).where(
+        SyncJob.id == job_id, SyncJob.status.in_(("queued", "waiting"))
+    )
+    limit = settings.publish_max_active_imports
+    if limit > 0:
+        claim = claim.where(active_imports(now).scalar_subquery() < limit)
+    # The per-PC cap is checked in the same statement, so a slow PC can never
+    # hold more than its share of slots, however many workers pick its jobs.
+    limit = pc_limit(job.max_in_flight)
+    if limit > 0:
+        claim = claim.where(active_imports(now, job.pc_id).scalar_subquery() < limit)
+    result = db.execute(
+        claim.values(status="running", updated_at=now).execution_options(
+            synchronize_session=False
+        )
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def dispatch_waiting_jobs() -> None:
+    # Called whenever a slot frees up; the scheduler picks which waiting jobs
+    # take it, and the claim in run_sync_job stays the source of truth, so
+    # dispatching a job twice is harmless.
+    from app.dispatch import dispatcher
+
+    dispatcher.dispatch([])
+
+
 def run_sync_job(job_id: int):
     db: Session = SessionLocal()
+    job = None
+    pump_waiting = False
     try:
-        job = db.query(SyncJob).filter(SyncJob.id == job_id).first()
-        if not job:
+        with metrics.timed(metrics.sync_job_phase_seconds, phase="claim"):
+            claimed = _claim_import_slot(db, job_id)
+        if not claimed:
+            job = db.query(SyncJob).filter(SyncJob.id == job_id).first()
+            if job and job.status == "queued":
+                # Only N PCs pull from the hub at a time; the next finishing
+                # job dispatches this one again.
+                job.status = "waiting"
+                job.updated_at = datetime.utcnow()
+                record_job_event(db, job)
+                db.commit()
+                # A slot may have freed up between the claim and this commit.
+                pump_waiting = True
             return
 
-        job.status = "running"
-        job.updated_at = datetime.utcnow()
+        job = db.query(SyncJob).filter(SyncJob.id == job_id).first()
+        record_job_event(db, job)
         db.commit()
+        pump_waiting = True
 
         image = db.query(Image).filter(Image.id == job.image_id).first()
         pc = db.query(PrismCentral).filter(PrismCentral.id == job.pc_id).first()
@@ -34,6 +159,8 @@ def run_sync_job(job_id: int):
             job.status = "failed"
             job.detail = "Missing image or PC."
             job.updated_at = datetime.utcnow()
+            record_job_event(db, job)
+            _settle_placement(db, job.id, "failed")
             db.commit()
             return
 
@@ -43,32 +170,308 @@ def run_sync_job(job_id: int):
         job.updated_at = datetime.utcnow()
         db.commit()
 
-        result = PrismClient(pc).import_image(image)
-        job.status = "completed"
-        job.detail = json.dumps(result)
-        job.updated_at = datetime.utcnow()
-        task_state = ""
-        task = result.get("task") if isinstance(result, dict) else None
-        if isinstance(task, dict):
-            task_state = task.get("status", {}).get("state", "").upper()
-        elif task is not None:
+        target = PCTarget.from_pc(pc)
+        client = PrismClient(target)
+        existing_uuid = None
+        try:
+            with metrics.timed(metrics.sync_job_phase_seconds, phase="inventory"):
+                existing_uuid = client.find_image_by_checksum(image.sha256)
+        except Exception:
+            # An unreadable inventory only costs a redundant import.
+            pass
+        if existing_uuid:
+            job.status = "completed"
             job.detail = json.dumps(
-                {"error": "Unexpected task payload", "task": task}
+                {"skipped": "Image already present on PC.", "image_uuid": existing_uuid}
             )
-            task_state = "FAILED"
-        if task_state and task_state != "SUCCEEDED":
-            pc.connected = False
-        else:
+            job.updated_at = datetime.utcnow()
+            record_job_event(db, job)
+            _settle_placement(db, job.id, "present", existing_uuid)
             pc.connected = True
-        pc.last_checked_at = datetime.utcnow()
+            pc.last_checked_at = datetime.utcnow()
+            db.commit()
+            return
+
+        with metrics.timed(metrics.sync_job_phase_seconds, phase="submit"):
+            source_uri = _direct_source(db, image, pc)
+            result = client.submit_image_import(image, source_uri)
+        result["source"] = "object-store" if source_uri else "hub"
+        task_uuid = result.get("task_uuid")
+        if not task_uuid:
+            db.close()
+            pump_waiting = False
+            finish_sync_job(job_id, dict(result, task=None))
+            return
+
+        # The import itself can take a long time; hand the task to the per-PC
+        # watcher and release this worker instead of polling here.
+        watcher = uuid4().hex
+        result["submitted_at"] = datetime.utcnow().isoformat()
+        job.task_uuid = task_uuid
+        job.watcher = watcher
+        job.detail = json.dumps(result)
+        job.updated_at = datetime.utcnow()
         db.commit()
+        pump_waiting = False
+        prism_runtime.submit(_await_import(job_id, target, result, watcher))
     except Exception as exc:
+        if job is None:
+            raise
         job.status = "failed"
         job.detail = str(exc)
         job.updated_at = datetime.utcnow()
+        record_job_event(db, job)
+        _settle_placement(db, job_id, "failed")
         if "pc" in locals() and pc:
             pc.connected = False
             pc.last_checked_at = datetime.utcnow()
         db.commit()
     finally:
         db.close()
+        if pump_waiting:
+            dispatch_waiting_jobs()
+
+
+def resume_task_watches() -> int:
+    # A task watch runs in the process that submitted the import and holds its
+    # job through heartbeats. Once those stop (the process exited, or a Celery
+    # child was recycled) one process claims the job and watches it again; a
+    # job already past pc_task_timeout fails instead.
+    now = datetime.utcnow()
+    lapsed = now - timedelta(seconds=settings.pc_task_watch_lease)
+    watches = []
+    expired = []
+    db: Session = SessionLocal()
+    try:
+        rows = (
+            db.query(
+                SyncJob.id,
+                SyncJob.task_uuid,
+                SyncJob.detail,
+                SyncJob.created_at,
+                PrismCentral,
+            )
+            .join(PrismCentral, PrismCentral.id == SyncJob.pc_id)
+            .filter(
+                SyncJob.status == "running",
+                SyncJob.task_uuid.isnot(None),
+                SyncJob.updated_at < lapsed,
+            )
+            .all()
+        )
+        for job_id, task_uuid, detail, created_at, pc in rows:
+            target = PCTarget.from_pc(pc)
+            watcher = uuid4().hex
+            claimed = db.execute(
+                update(SyncJob)
+                .where(
+                    SyncJob.id == job_id,
+                    SyncJob.status == "running",
+                    SyncJob.task_uuid == task_uuid,
+                    SyncJob.updated_at < lapsed,
+                )
+                .values(watcher=watcher, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            if claimed.rowcount != 1:
+                continue
+            try:
+                result = json.loads(detail or "{}")
+            except ValueError:
+                result = {}
+            if not isinstance(result, dict):
+                result = {}
+            result["task_uuid"] = task_uuid
+            try:
+                submitted_at = datetime.fromisoformat(result["submitted_at"])
+            except (KeyError, TypeError, ValueError):
+                submitted_at = created_at
+            remaining = settings.pc_task_timeout - (now - submitted_at).total_seconds()
+            if remaining > 0:
+                watches.append((job_id, target, result, watcher, remaining))
+            else:
+                expired.append((job_id, result))
+    finally:
+        db.close()
+    for job_id, result in expired:
+        finish_sync_job(job_id, result, RuntimeError("PC task polling timed out."))
+    for watch in watches:
+        prism_runtime.submit(_await_import(*watch))
+    return len(watches) + len(expired)
+
+
+def renew_task_watch(job_id: int, watcher: str) -> bool:
+    # The heartbeat of a task watch. False once the job is settled or another
+    # process has claimed it.
+    db: Session = SessionLocal()
+    try:
+        renewed = db.execute(
+            update(SyncJob)
+            .where(
+                SyncJob.id == job_id,
+                SyncJob.status == "running",
+                SyncJob.watcher == watcher,
+            )
+            .values(updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return renewed.rowcount == 1
+    finally:
+        db.close()
+
+
+async def _hold_task_watch(job_id: int, watcher: str) -> None:
+    # Returns when the job is lost; a heartbeat that errors (a locked
+    # database) is simply tried again on the next beat.
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.pc_task_watch_lease / 3)
+        try:
+            held = await loop.run_in_executor(None, renew_task_watch, job_id, watcher)
+        except Exception:
+            continue
+        if not held:
+            return
+
+
+async def _await_import(
+    job_id: int,
+    target: PCTarget,
+    result: dict,
+    watcher: str,
+    timeout: Optional[float] = None,
+) -> None:
+    loop = asyncio.get_running_loop()
+    progress_writes = []
+
+    def on_update(task: dict) -> None:
+        if task_state(task) in TERMINAL_TASK_STATES:
+            return
+        progress_writes.append(
+            loop.run_in_executor(None, record_job_progress, job_id, task_progress(task))
+        )
+
+    watch = asyncio.ensure_future(
+        AsyncPrismClient(target).wait_for_task(
+            result["task_uuid"], timeout, on_update=on_update
+        )
+    )
+    lease = asyncio.ensure_future(_hold_task_watch(job_id, watcher))
+    try:
+        with metrics.timed(metrics.sync_job_phase_seconds, phase="import"):
+            await asyncio.wait((watch, lease), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        lease.cancel()
+        lost = not watch.done()
+        watch.cancel()
+    # Let progress events land before the terminal one so streams see them in order.
+    await asyncio.gather(*progress_writes, return_exceptions=True)
+    if lost:
+        # Another process watches the job now and settles it.
+        return
+    error = None
+    try:
+        result["task"] = watch.result()
+    except Exception as exc:
+        error = exc
+    await loop.run_in_executor(None, finish_sync_job, job_id, result, error)
+
+
+def _settle_job(
+    db: Session, job: SyncJob, task_uuid: Optional[str], values: dict
+) -> bool:
+    # Only the import the job is still running may settle it, so two watches
+    # of one task, or a watch racing a stale requeue, finish it once.
+    values = dict(values, watcher=None, updated_at=datetime.utcnow())
+    settled = db.execute(
+        update(SyncJob)
+        .where(
+            SyncJob.id == job.id,
+            SyncJob.status == "running",
+            SyncJob.task_uuid == task_uuid,
+        )
+        .values(**values)
+    )
+    return settled.rowcount == 1
+
+
+def finish_sync_job(
+    job_id: int, result: dict, error: Optional[BaseException] = None
+) -> None:
+    status = _settle_sync_job(job_id, result, error)
+    if status == "queued":
+        from app.dispatch import dispatcher
+
+        dispatcher.dispatch([job_id])
+    if status is not None:
+        dispatch_waiting_jobs()
+
+
+@metrics.timed(metrics.sync_job_phase_seconds, phase="finish")
+def _settle_sync_job(
+    job_id: int, result: dict, error: Optional[BaseException] = None
+) -> Optional[str]:
+    # Returns the job's new status, or None when this import no longer owns
+    # the job.
+    db: Session = SessionLocal()
+    try:
+        job = db.query(SyncJob).filter(SyncJob.id == job_id).first()
+        task_uuid = result.get("task_uuid") if isinstance(result, dict) else None
+        if not job or job.status != "running" or job.task_uuid != task_uuid:
+            # Settled already, or re-queued as stale and running another import.
+            return None
+        pc = db.query(PrismCentral).filter(PrismCentral.id == job.pc_id).first()
+        if error is not None:
+            failed = {"status": "failed", "detail": str(error)}
+            if not _settle_job(db, job, task_uuid, failed):
+                return None
+            record_job_event(db, job)
+            _settle_placement(db, job.id, "failed")
+            if pc:
+                pc.connected = False
+                pc.last_checked_at = datetime.utcnow()
+            db.commit()
+            return "failed"
+
+        detail = json.dumps(result)
+        state = ""
+        progress = None
+        task = result.get("task") if isinstance(result, dict) else None
+        if isinstance(task, dict):
+            state = task_state(task)
+            progress = task_progress(task)
+        elif task is not None:
+            detail = json.dumps({"error": "Unexpected task payload", "task": task})
+            state = "FAILED"
+        direct = isinstance(result, dict) and result.get("source") == "object-store"
+        if direct and pc and state == "FAILED" and _store_unreachable(task):
+            # The PC could not reach the object store; remember that and run
+            # the job again through the hub.
+            fallback = {"fallback": "Direct object-store pull failed; retrying via hub."}
+            queued = {"status": "queued", "task_uuid": None, "detail": json.dumps(fallback)}
+            if not _settle_job(db, job, task_uuid, queued):
+                return None
+            pc.direct_source = False
+            pc.direct_checked_at = datetime.utcnow()
+            record_job_event(db, job)
+            db.commit()
+            return "queued"
+        if not _settle_job(db, job, task_uuid, {"status": "completed", "detail": detail}):
+            return None
+        record_job_event(db, job, progress)
+        imported = not state or state == "SUCCEEDED"
+        if direct and pc and imported:
+            pc.direct_source = True
+            pc.direct_checked_at = datetime.utcnow()
+        _settle_placement(
+            db, job.id, "present" if imported else "failed", _imported_image_uuid(result)
+        )
+        if pc:
+            pc.connected = imported
+            pc.last_checked_at = datetime.utcnow()
+        db.commit()
+        return "completed"
+    finally:
+        db.close()
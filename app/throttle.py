@@ -0,0 +1,201 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+
+from app import metrics
+from app.config import settings
+
+THROUGHPUT_WINDOW_SECONDS = 10.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: int) -> float:
+        # Tokens may go negative; the deficit is how long the caller has to
+        # wait before the bytes it just took are paid for.
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class _Client:
+    def __init__(self, bandwidth: int, concurrency: int):
+        self.bucket = TokenBucket(bandwidth) if bandwidth > 0 else None
+        self.slots = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+        self.active = 0
+        self.queued = 0
+        self.bytes = 0
+
+
+class Transfer:
+    def __init__(
+        self, scheduler: "DownloadScheduler", client: _Client, key: str, image: str
+    ):
+        self.scheduler = scheduler
+        self.client = client
+        # Label children are resolved once, not per chunk.
+        self._image_bytes = metrics.download_bytes.labels(image)
+        self._client_bytes = metrics.download_client_bytes.labels(key)
+
+    async def pace(self, size: int) -> None:
+        delay = 0.0
+        if self.scheduler.bucket is not None:
+            delay = self.scheduler.bucket.reserve(size)
+        if self.client.bucket is not None:
+            delay = max(delay, self.client.bucket.reserve(size))
+        if delay:
+            await asyncio.sleep(delay)
+        self.scheduler._count(self.client, size)
+        self._image_bytes.inc(size)
+        self._client_bytes.inc(size)
+
+
+async def read_ahead(body: Iterator[bytes]) -> AsyncIterator[bytes]:
+    # The next chunk is read in a worker thread while the current one is on
+    # the socket, so storage reads overlap with sending.
+    loop = asyncio.get_running_loop()
+    done = object()
+    pending = loop.run_in_executor(None, next, body, done)
+    try:
+        while True:
+            # Shielded so a disconnect never leaves the generator mid-next().
+            chunk = await asyncio.shield(pending)
+            if chunk is done:
+                return
+            pending = loop.run_in_executor(None, next, body, done)
+            yield chunk
+    finally:
+        close = getattr(body, "close", None)
+        if close is not None:
+            if pending.done():
+                close()
+            else:
+                pending.add_done_callback(lambda _: close())
+
+
+class DownloadScheduler:
+    def __init__(
+        self,
+        max_bandwidth: int = 0,
+        client_bandwidth: int = 0,
+        max_concurrency: int = 0,
+        client_concurrency: int = 0,
+    ):
+        self.bucket = TokenBucket(max_bandwidth) if max_bandwidth > 0 else None
+        self.client_bandwidth = client_bandwidth
+        self.client_concurrency = client_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self._clients: Dict[str, _Client] = {}
+        self._window: Deque[Tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.bytes = 0
+        self.completed = 0
+
+    def _client(self, key: str) -> _Client:
+        client = self._clients.get(key)
+        if client is None:
+            client = _Client(self.client_bandwidth, self.client_concurrency)
+            self._clients[key] = client
+        return client
+
+    @asynccontextmanager
+    async def transfer(
+        self, key: str, image: str = "unknown"
+    ) -> AsyncIterator["Transfer"]:
+        client = self._client(key)
+        self.queued += 1
+        client.queued += 1
+        try:
+            if client.slots is not None:
+                await client.slots.acquire()
+            try:
+                if self._slots is not None:
+                    await self._slots.acquire()
+            except BaseException:
+                if client.slots is not None:
+                    client.slots.release()
+                raise
+        finally:
+            self.queued -= 1
+            client.queued -= 1
+
+        self.active += 1
+        client.active += 1
+        started = time.perf_counter()
+        try:
+            yield Transfer(self, client, key, image)
+            self.completed += 1
+            metrics.download_seconds.observe(time.perf_counter() - started)
+        finally:
+            self.active -= 1
+            client.active -= 1
+            if self._slots is not None:
+                self._slots.release()
+            if client.slots is not None:
+                client.slots.release()
+            if not client.active and not client.queued:
+                self._clients.pop(key, None)
+
+    async def stream(
+        self, key: str, body: Iterator[bytes], image: str = "unknown"
+    ) -> AsyncIterator[bytes]:
+        async with self.transfer(key, image) as transfer:
+            async for chunk in read_ahead(body):
+                await transfer.pace(len(chunk))
+                yield chunk
+
+    def _count(self, client: _Client, size: int) -> None:
+        now = time.monotonic()
+        client.bytes += size
+        with self._lock:
+            self.bytes += size
+            self._window.append((now, size))
+            self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        while self._window and self._window[0][0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._window.popleft()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            window_bytes = sum(size for _, size in self._window)
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "completed": self.completed,
+            "bytes": self.bytes,
+            "throughput_bytes_per_second": window_bytes / THROUGHPUT_WINDOW_SECONDS,
+            "clients": {
+                key: {
+                    "active": client.active,
+                    "queued": client.queued,
+                    "bytes": client.bytes,
+                }
+                for key, client in self._clients.items()
+            },
+        }
+
+
+download_scheduler = DownloadScheduler(
+    settings.download_max_bandwidth,
+    settings.download_client_bandwidth,
+    settings.download_max_concurrency,
+    settings.download_client_concurrency,
+)
@@ -0,0 +1,245 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Dict, Optional, Tuple
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import metrics
+from app.config import settings
+from app.db import SessionLocal
+from app.models import UploadSession
+
+# Statuses in which a session may still take chunks. "receiving" and
+# "finalizing" are short leases taken with a conditional UPDATE, so only one
+# worker (of however many serve the API) touches the staged file at a time.
+ACTIVE_STATUSES = ("open", "receiving", "finalizing")
+
+# The running sha256 cannot be saved, so a session is bound to the worker
+# holding it (upload_sessions.worker): chunks and finalize must reach that
+# worker, and the others refuse them. Another worker adopts the session, and
+# hashes the staged bytes once, only after it sat idle for
+# upload_lease_seconds (its worker may have exited).
+
+
+class UploadSessionStore:
+    def __init__(self):
+        self.staging_dir = Path(settings.local_storage_path) / ".uploads"
+        # session id -> (bytes consumed, running sha256)
+        self._hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+        self._guard = threading.Lock()
+        self._worker: Optional[Tuple[int, str]] = None
+
+    @property
+    def worker(self) -> str:
+        # Resolved in the process that uses it, so workers forked after
+        # import never share an id.
+        if self._worker is None or self._worker[0] != os.getpid():
+            worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._worker = (os.getpid(), worker)
+        return self._worker[1]
+
+    def holds(self, session: UploadSession) -> bool:
+        # Whether this worker may take the session's next chunk or finalize.
+        if session.worker in (None, self.worker):
+            return True
+        lapsed = datetime.utcnow() - timedelta(seconds=settings.upload_lease_seconds)
+        return session.updated_at < lapsed
+
+    def staging_path(self, session_id: str) -> Path:
+        return self.staging_dir / f"{session_id}.part"
+
+    def hasher(self, session: UploadSession):
+        with self._guard:
+            cached = self._hashers.get(session.id)
+        if cached is not None and cached[0] == session.received_bytes:
+            return cached[1]
+        # Only a worker adopting the session (see holds) gets here with
+        # bytes already staged; it rebuilds the state from them once.
+        hasher = hashlib.sha256()
+        path = self.staging_path(session.id)
+        remaining = session.received_bytes
+        if remaining:
+            with path.open("rb") as handle:
+                while remaining:
+                    chunk = handle.read(min(settings.upload_chunk_size, remaining))
+                    if not chunk:
+                        raise RuntimeError("Staged upload is shorter than recorded.")
+                    hasher.update(chunk)
+                    remaining -= len(chunk)
+        with self._guard:
+            self._hashers[session.id] = (session.received_bytes, hasher)
+        return hasher
+
+    def _open(self, session_id: str, offset: int) -> BinaryIO:
+        path = self.staging_path(session_id)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        path.touch(exist_ok=True)
+        handle = path.open("r+b")
+        handle.seek(offset)
+        return handle
+
+    @staticmethod
+    def _write(handle: BinaryIO, hasher, data: bytes) -> float:
+        handle.write(data)
+        started = time.perf_counter()
+        hasher.update(data)
+        return time.perf_counter() - started
+
+    async def append(
+        self,
+        session: UploadSession,
+        stream: AsyncIterator[bytes],
+        expected_length: Optional[int] = None,
+    ) -> int:
+        # Pieces are gathered into upload_chunk_size writes, and writing and
+        # hashing run in the threadpool so the event loop never waits on disk.
+        offset = session.received_bytes
+        hasher = (await run_in_threadpool(self.hasher, session)).copy()
+        handle = await run_in_threadpool(self._open, session.id, offset)
+        written = 0
+        hashing = 0.0
+        pending = bytearray()
+        try:
+            async for piece in stream:
+                pending += piece
+                if len(pending) >= settings.upload_chunk_size:
+                    data, pending = bytes(pending), bytearray()
+                    hashing += await run_in_threadpool(
+                        self._write, handle, hasher, data
+                    )
+                    written += len(data)
+            if pending:
+                hashing += await run_in_threadpool(
+                    self._write, handle, hasher, bytes(pending)
+                )
+                written += len(pending)
+            if expected_length is not None and written != expected_length:
+                raise ValueError(
+                    f"Chunk truncated: received {written} of {expected_length} bytes."
+                )
+        except BaseException:
+            handle.truncate(offset)
+            handle.close()
+            raise
+        handle.truncate(offset + written)
+        handle.close()
+        with self._guard:
+            self._hashers[session.id] = (offset + written, hasher)
+        metrics.upload_bytes.inc(written)
+        metrics.hash_seconds.observe(hashing)
+        return written
+
+    def digest(self, session: UploadSession) -> str:
+        return self.hasher(session).hexdigest()
+
+    def discard(self, session_id: str) -> None:
+        with self._guard:
+            self._hashers.pop(session_id, None)
+        path = self.staging_path(session_id)
+        if path.exists():
+            path.unlink()
+
+    def claim(
+        self, db: Session, session: UploadSession, status: str, **where
+    ) -> Optional[datetime]:
+        # Moves an open session (or one whose lease has lapsed, e.g. after a
+        # worker crash) to status and binds it to this worker. Returns the
+        # lease timestamp, which the holder passes back to release().
+        now = datetime.utcnow()
+        lapsed = now - timedelta(seconds=settings.upload_lease_seconds)
+        conditions = [
+            getattr(UploadSession, name) == value for name, value in where.items()
+        ]
+        result = db.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == session.id,
+                or_(
+                    UploadSession.status == "open",
+                    and_(
+                        UploadSession.status.in_(("receiving", "finalizing")),
+                        UploadSession.updated_at < lapsed,
+                    ),
+                ),
+                or_(
+                    UploadSession.worker.is_(None),
+                    UploadSession.worker == self.worker,
+                    UploadSession.updated_at < lapsed,
+                ),
+                *conditions,
+            )
+            .values(status=status, worker=self.worker, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return now if result.rowcount == 1 else None
+
+    def release(
+        self, db: Session, session: UploadSession, leased_at: datetime, **values
+    ) -> bool:
+        values.setdefault("status", "open")
+        result = db.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == session.id,
+                UploadSession.status.in_(("receiving", "finalizing")),
+                UploadSession.updated_at == leased_at,
+            )
+            .values(updated_at=datetime.utcnow(), **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        db.refresh(session)
+        return result.rowcount == 1
+
+    def expire(self) -> int:
+        # Sessions nobody has touched for upload_session_ttl are closed and
+        # their staged bytes removed, as are .part files left without a live
+        # session.
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.upload_session_ttl)
+        db: Session = SessionLocal()
+        try:
+            expired = list(
+                db.execute(
+                    update(UploadSession)
+                    .where(
+                        UploadSession.status.in_(ACTIVE_STATUSES),
+                        UploadSession.updated_at < cutoff,
+                    )
+                    .values(status="expired", updated_at=datetime.utcnow())
+                    .returning(UploadSession.id)
+                    .execution_options(synchronize_session=False)
+                ).scalars()
+            )
+            db.commit()
+            for session_id in expired:
+                self.discard(session_id)
+            if not self.staging_dir.is_dir():
+                return len(expired)
+            active = {
+                session_id
+                for (session_id,) in db.query(UploadSession.id).filter(
+                    UploadSession.status.in_(ACTIVE_STATUSES)
+                )
+            }
+        finally:
+            db.close()
+        removed = 0
+        for path in self.staging_dir.glob("*.part"):
+            if path.stem in active:
+                continue
+            if datetime.utcfromtimestamp(path.stat().st_mtime) < cutoff:
+                self.discard(path.stem)
+                removed += 1
+        return len(expired) + removed
+
+
+upload_sessions = UploadSessionStore()
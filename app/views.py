@@ -0,0 +1,50 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Query, Session
+
+from app.models import Image, PrismCentral, SyncJob
+
+DETAIL_PREVIEW_CHARS = 120
+
+
+def task_rows(db: Session) -> Query:
+    # One flat row per job with the names already joined in, so rendering the
+    # tasks table never touches a lazy relationship.
+    detail = func.substr(SyncJob.detail, 1, DETAIL_PREVIEW_CHARS + 1)
+    return (
+        db.query(
+            SyncJob.id,
+            SyncJob.image_id,
+            SyncJob.pc_id,
+            SyncJob.status,
+            SyncJob.updated_at,
+            Image.name.label("image_name"),
+            PrismCentral.name.label("pc_name"),
+            detail.label("detail"),
+        )
+        .outerjoin(Image, Image.id == SyncJob.image_id)
+        .outerjoin(PrismCentral, PrismCentral.id == SyncJob.pc_id)
+    )
+
+
+def image_rows(db: Session) -> Query:
+    return db.query(
+        Image.id,
+        Image.name,
+        Image.version,
+        Image.sha256,
+        Image.approved,
+        Image.created_at,
+    )
+
+
+def pc_rows(db: Session) -> Query:
+    return db.query(
+        PrismCentral.id,
+        PrismCentral.name,
+        PrismCentral.api_url,
+        PrismCentral.connected,
+        PrismCentral.health_status,
+        PrismCentral.health_detail,
+        PrismCentral.last_checked_at,
+        PrismCentral.created_at,
+    )
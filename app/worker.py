@@ -0,0 +1,23 @@
+from celery import Celery
+from celery.signals import worker_process_init
+
+from app.config import settings
+from app.tasks import resume_task_watches, run_sync_job
+
+# Start workers with: celery -A app.worker worker
+celery_app = Celery(
+    "image_hub",
+    broker=settings.celery_broker_url,
+    backend=settings.celery_result_backend,
+)
+
+# Registered under its original name so messages already queued still route.
+run_sync_job_task = celery_app.task(name="app.tasks.run_sync_job")(run_sync_job)
+
+
+@worker_process_init.connect
+def _resume_task_watches(**_) -> None:
+    # Import watches run in the child that submitted them. A child replacing
+    # a recycled one (--max-tasks-per-child) claims the jobs whose watch
+    # stopped; each job is claimed by one process only.
+    resume_task_watches()
@@ -0,0 +1,162 @@
+"""Compare SQLite engine profiles under concurrent sync-job writers and readers.
+
+Writer threads update sync jobs and append job events the way finished
+imports do, while reader threads run the /sync-jobs list query. Each profile
+runs against a fresh file database; "legacy" is the engine as it was before
+the tuned profile (rollback journal, synchronous=FULL, the driver's 5 s busy
+timeout). Run from the repository root:
+
+    python bench/db_contention.py --writers 8 --readers 8 --seconds 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench import suite  # noqa: E402
+
+PROFILES = {
+    "legacy": {
+        "SQLITE_JOURNAL_MODE": "delete",
+        "SQLITE_SYNCHRONOUS": "full",
+        "SQLITE_BUSY_TIMEOUT_MS": "5000",
+        "SQLITE_CACHE_SIZE_KB": "2000",
+        "SQLITE_MMAP_SIZE": "0",
+    },
+    "tuned": {},
+}
+
+
+def load_app(workdir: Path, env: dict):
+    # Profiles only set what they change; the rest must fall back to the
+    # defaults, not to whatever an earlier profile left in the environment.
+    for name in PROFILES["legacy"]:
+        os.environ.pop(name, None)
+    main = suite.load_app(workdir, **env)
+    main.dispatcher.dispatch = lambda job_ids: []
+    return main
+
+
+def seed(main, jobs: int) -> None:
+    from app.models import Image, PrismCentral, SyncJob
+
+    with main.engine.begin() as connection:
+        connection.execute(
+            Image.__table__.insert(),
+            [{"name": "bench", "version": "1", "sha256": "0" * 64, "storage_uri": "x"}],
+        )
+        connection.execute(
+            PrismCentral.__table__.insert(),
+            [{"name": "pc", "api_url": "https://pc"}],
+        )
+        connection.execute(
+            SyncJob.__table__.insert(),
+            [{"image_id": 1, "pc_id": 1, "status": "running"} for _ in range(jobs)],
+        )
+
+
+def run_profile(name: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        main = load_app(Path(workdir), PROFILES[name])
+        from sqlalchemy.exc import OperationalError
+
+        from app.db import SessionLocal
+        from app.models import SyncJob, SyncJobEvent
+
+        seed(main, args.jobs)
+        stop = threading.Event()
+        lock = threading.Lock()
+        writes, errors, reads = [0], [0], []
+
+        def writer(offset: int) -> None:
+            job_id = offset
+            while not stop.is_set():
+                job_id = job_id % args.jobs + 1
+                db = SessionLocal()
+                try:
+                    job = db.get(SyncJob, job_id)
+                    job.status = "completed" if job.status == "running" else "running"
+                    job.updated_at = datetime.utcnow()
+                    db.add(SyncJobEvent(job_id=job_id, status=job.status, progress=100))
+                    db.commit()
+                    with lock:
+                        writes[0] += 1
+                except OperationalError:
+                    db.rollback()
+                    with lock:
+                        errors[0] += 1
+                finally:
+                    db.close()
+                job_id += args.writers
+
+        def reader() -> None:
+            while not stop.is_set():
+                db = SessionLocal()
+                started = time.perf_counter()
+                try:
+                    db.query(SyncJob).filter(SyncJob.status == "completed").order_by(
+                        SyncJob.id.desc()
+                    ).limit(100).all()
+                    with lock:
+                        reads.append(time.perf_counter() - started)
+                except OperationalError:
+                    with lock:
+                        errors[0] += 1
+                finally:
+                    db.close()
+
+        threads = [
+            threading.Thread(target=writer, args=(index,)) for index in range(args.writers)
+        ] + [threading.Thread(target=reader) for _ in range(args.readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        main.engine.dispose()
+
+    reads.sort()
+    return {
+        "profile": name,
+        "writes_per_s": writes[0] / args.seconds,
+        "reads_per_s": len(reads) / args.seconds,
+        "read_p50_ms": statistics.median(reads) * 1000 if reads else 0.0,
+        "read_p99_ms": reads[int(len(reads) * 0.99)] * 1000 if reads else 0.0,
+        "locked_errors": errors[0],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    print(
+        f"{'profile':>8} {'writes/s':>9} {'reads/s':>9} "
+        f"{'read p50':>9} {'read p99':>9} {'locked':>7}"
+    )
+    for name in args.profiles:
+        result = run_profile(name, args)
+        print(
+            f"{result['profile']:>8} {result['writes_per_s']:>9.0f} "
+            f"{result['reads_per_s']:>9.0f} {result['read_p50_ms']:>9.1f} "
+            f"{result['read_p99_ms']:>9.1f} {result['locked_errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Measure sustained download throughput and server CPU per GB served.
+
+Starts the hub under uvicorn in a subprocess against a scratch database,
+uploads one image and pulls it with several concurrent streams over loopback.
+Server CPU time is read from /proc, so this runs on Linux. Run from the
+repository root:
+
+    python bench/download_throughput.py --backend local --size-mb 512 --clients 4
+
+The S3 backend takes its bucket and credentials from the usual S3_* variables
+(MinIO works); the blob cache is disabled so every pull reads from S3:
+
+    S3_BUCKET=images S3_ENDPOINT_URL=http://localhost:9000 \\
+        python bench/download_throughput.py --backend s3
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+MB = 1024 * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as handle:
+        fields = handle.read().rsplit(")", 1)[1].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    return (utime + stime) / os.sysconf("SC_CLK_TCK")
+
+
+def write_image(path: Path, size_mb: int) -> None:
+    block = os.urandom(MB)
+    with path.open("wb") as handle:
+        for _ in range(size_mb):
+            handle.write(block)
+
+
+async def pull(client: httpx.AsyncClient, url: str) -> int:
+    received = 0
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            received += len(chunk)
+    return received
+
+
+async def measure(base_url: str, image_path: Path, clients: int, rounds: int, pid: int):
+    timeout = httpx.Timeout(None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        with image_path.open("rb") as handle:
+            files = {"file": ("bench.raw", handle)}
+            data = {"name": "bench", "version": "1"}
+            image = (await client.post("/images", data=data, files=files)).json()
+        url = f"/images/{image['id']}/download"
+        await pull(client, url)
+
+        results = []
+        for _ in range(rounds):
+            cpu_before = server_cpu_seconds(pid)
+            started = time.perf_counter()
+            sizes = await asyncio.gather(*(pull(client, url) for _ in range(clients)))
+            elapsed = time.perf_counter() - started
+            cpu = server_cpu_seconds(pid) - cpu_before
+            gigabytes = sum(sizes) / 1024**3
+            results.append((sum(sizes) / MB / elapsed, cpu / gigabytes))
+    return results
+
+
+def run(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        image_path = workdir / "bench.raw"
+        write_image(image_path, args.size_mb)
+
+        port = free_port()
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+            STORAGE_BACKEND=args.backend,
+            LOCAL_STORAGE_PATH=str(workdir / "storage"),
+            BLOB_CACHE_MAX_BYTES="0",
+            PC_VALIDATE_CONNECTION="false",
+        )
+        if args.chunk_mb:
+            env["DOWNLOAD_CHUNK_SIZE"] = str(args.chunk_mb * MB)
+        env.pop("CELERY_BROKER_URL", None)
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+            ],
+            cwd=ROOT,
+            env=env,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    httpx.get(f"{base_url}/reachability").raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline or server.poll() is not None:
+                        raise SystemExit("Server did not start.")
+                    time.sleep(0.2)
+            results = asyncio.run(
+                measure(base_url, image_path, args.clients, args.rounds, server.pid)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{'backend':>8} {'clients':>8} {'MB/s':>10} {'CPU s/GB':>10}")
+    for throughput, cpu_per_gb in results:
+        print(
+            f"{args.backend:>8} {args.clients:>8} "
+            f"{throughput:>10.1f} {cpu_per_gb:>10.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["local", "s3"], default="local")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--chunk-mb", type=int, default=0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
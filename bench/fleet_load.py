@@ -0,0 +1,350 @@
+"""Load-test the hub with a simulated fleet of PCs pulling one image at once.
+
+For each fleet size the hub starts under uvicorn in a subprocess against a
+scratch database. The simulated PCs (tests/fake_pc.py, all behind one local
+server) are registered, and one image is published to all of them. Every PC
+downloads /images/{id}/download from its own loopback address at
+--pull-rate-mb MB/s, with retries and Range resumes after the connection
+drops the harness injects. Linux only: hub CPU, memory and file descriptors
+are read from /proc. Run from the repository root:
+
+    python bench/fleet_load.py --pcs 50 100 250 500 --image-mb 64
+
+Hub settings come from the environment or --hub-env, so configurations can
+be compared:
+
+    python bench/fleet_load.py --pcs 100 200 400 \\
+        --hub-env DOWNLOAD_MAX_CONCURRENCY=64 PUBLISH_MAX_ACTIVE_IMPORTS=128
+
+The sweep stops at the first fleet size that tips over (more than
+--max-failed of jobs failed, or p99 job time over --max-p99 seconds) and
+reports it as "tipped_at". Results are printed as a table; --output writes
+JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+ROOT = Path(__file__).resolve().parents[1]
+MB = 1024 * 1024
+PENDING = {"queued", "waiting", "running"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ProcessSampler:
+    # Samples the hub process from /proc while the fleet runs.
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.rss_max = 0
+        self.fds_max = 0
+        self.threads_max = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as handle:
+            fields = handle.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def sample(self) -> None:
+        with open(f"/proc/{self.pid}/status") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    self.rss_max = max(self.rss_max, int(line.split()[1]) * 1024)
+                elif line.startswith("Threads:"):
+                    self.threads_max = max(self.threads_max, int(line.split()[1]))
+        self.fds_max = max(self.fds_max, len(os.listdir(f"/proc/{self.pid}/fd")))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except OSError:
+                return
+
+    def __enter__(self) -> "ProcessSampler":
+        self.cpu_started = self.cpu_seconds()
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.cpu_used = self.cpu_seconds() - self.cpu_started
+
+
+def start_hub(workdir: Path, port: int, hub_env: dict, log_path: Path) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{workdir}/hub.db",
+        STORAGE_BACKEND=os.environ.get("STORAGE_BACKEND", "local"),
+        LOCAL_STORAGE_PATH=str(workdir / "storage"),
+        BLOB_CACHE_PATH=str(workdir / "cache"),
+        HUB_BASE_URL=f"http://127.0.0.1:{port}",
+        PC_VALIDATE_CONNECTION="false",
+        PC_VALIDATE_HUB_SOURCE="false",
+        PC_TASK_POLL_MAX_INTERVAL=os.environ.get("PC_TASK_POLL_MAX_INTERVAL", "2"),
+    )
+    env.pop("CELERY_BROKER_URL", None)
+    env.update(hub_env)
+    log = log_path.open("wb")
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_ready(base_url: str, server: subprocess.Popen) -> None:
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f"{base_url}/reachability").raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                raise SystemExit("Hub did not start.")
+            time.sleep(0.2)
+
+
+async def all_jobs(client: httpx.AsyncClient) -> list:
+    jobs, url = [], "/sync-jobs?limit=1000"
+    while url:
+        response = await client.get(url)
+        response.raise_for_status()
+        jobs.extend(response.json())
+        cursor = response.headers.get("x-next-cursor")
+        url = f"/sync-jobs?limit=1000&cursor={cursor}" if cursor else None
+    return jobs
+
+
+def scrape(text: str) -> dict:
+    samples = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            key = sample.name
+            if "phase" in sample.labels:
+                key = f"{key}:{sample.labels['phase']}"
+            samples[key] = samples.get(key, 0.0) + sample.value
+    return samples
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def drive(base_url: str, fleet, image_path: Path, timeout: float) -> dict:
+    limits = httpx.Limits(max_connections=50)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        gate = asyncio.Semaphore(20)
+
+        async def register(index: int, pc) -> None:
+            async with gate:
+                payload = {
+                    "name": f"pc-{index}",
+                    "api_url": pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                }
+                (await client.post("/pcs", json=payload)).raise_for_status()
+
+        await asyncio.gather(*(register(index, pc) for index, pc in enumerate(fleet.pcs)))
+        with image_path.open("rb") as handle:
+            files = {"file": ("fleet.raw", handle)}
+            data = {"name": "fleet", "version": "1"}
+            image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+
+        started = time.monotonic()
+        (await client.post(f"/images/{image['id']}/publish")).raise_for_status()
+        stats_peak = {"active": 0, "queued": 0, "imports_waiting": 0}
+        while True:
+            stats = (await client.get("/downloads/stats")).json()
+            stats_peak["active"] = max(stats_peak["active"], stats["active"])
+            stats_peak["queued"] = max(stats_peak["queued"], stats["queued"])
+            stats_peak["imports_waiting"] = max(
+                stats_peak["imports_waiting"], stats["imports"]["waiting"]
+            )
+            jobs = await all_jobs(client)
+            if not any(job["status"] in PENDING for job in jobs):
+                break
+            if time.monotonic() - started > timeout:
+                break
+            await asyncio.sleep(0.5)
+        elapsed = time.monotonic() - started
+        stats = (await client.get("/downloads/stats")).json()
+        metrics = scrape((await client.get("/metrics")).text)
+    return {"jobs": jobs, "elapsed": elapsed, "stats": stats, "peak": stats_peak, "metrics": metrics}
+
+
+def run_step(pc_count: int, args, image_path: Path) -> dict:
+    from tests.fake_pc import FakeFleet
+
+    fleet = FakeFleet(
+        pc_count,
+        latency=args.pc_latency,
+        pull=True,
+        pull_rate=args.pull_rate_mb * MB if args.pull_rate_mb else 0.0,
+        pull_interrupt=args.interrupt,
+    )
+    with tempfile.TemporaryDirectory() as workdir, fleet:
+        workdir = Path(workdir)
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = workdir / "hub.log"
+        server = start_hub(workdir, port, args.hub_env, log_path)
+        try:
+            wait_ready(base_url, server)
+            with ProcessSampler(server.pid) as sampler:
+                outcome = asyncio.run(drive(base_url, fleet, image_path, args.timeout))
+        finally:
+            server.terminate()
+            server.wait()
+        hub_log = log_path.read_text(errors="replace")
+
+    jobs = outcome["jobs"]
+    durations = [
+        (
+            datetime.fromisoformat(job["updated_at"]) - datetime.fromisoformat(job["created_at"])
+        ).total_seconds()
+        for job in jobs
+        if job["status"] == "completed"
+    ]
+    metrics = outcome["metrics"]
+
+    def phase_ms(phase: str) -> float:
+        count = metrics.get(f"image_hub_sync_job_phase_seconds_count:{phase}", 0)
+        total = metrics.get(f"image_hub_sync_job_phase_seconds_sum:{phase}", 0)
+        return total / count * 1000 if count else 0.0
+
+    egress = outcome["stats"]["bytes"]
+    elapsed = outcome["elapsed"]
+    failed = sum(job["status"] == "failed" for job in jobs)
+    unfinished = sum(job["status"] in PENDING for job in jobs)
+    return {
+        "pcs": pc_count,
+        "elapsed_s": elapsed,
+        "completed": len(durations),
+        "failed": failed,
+        "unfinished": unfinished,
+        "job_p50_s": statistics.median(durations) if durations else 0.0,
+        "job_p99_s": percentile(durations, 0.99),
+        "egress_bytes": egress,
+        "egress_mb_per_s": egress / MB / elapsed,
+        "delivered_bytes": sum(pc.pulled_bytes for pc in fleet.pcs),
+        "resumes": sum(pc.resumes for pc in fleet.pcs),
+        "peak_downloads_active": outcome["peak"]["active"],
+        "peak_downloads_queued": outcome["peak"]["queued"],
+        "peak_imports_waiting": outcome["peak"]["imports_waiting"],
+        "hub_cpu_s": sampler.cpu_used,
+        "hub_cpu_util": sampler.cpu_used / elapsed,
+        "hub_rss_max_mb": sampler.rss_max / MB,
+        "hub_fds_max": sampler.fds_max,
+        "hub_threads_max": sampler.threads_max,
+        # DB contention: SQLite lock errors in the hub log, and the mean time
+        # of the sync-job phases that are mostly database writes.
+        "db_locked_errors": hub_log.count("database is locked"),
+        "db_claim_ms": phase_ms("claim"),
+        "db_finish_ms": phase_ms("finish"),
+        "db_queries_per_request": (
+            metrics.get("image_hub_db_queries_per_request_sum", 0)
+            / max(metrics.get("image_hub_db_queries_per_request_count", 0), 1)
+        ),
+    }
+
+
+def tipped(result: dict, args) -> bool:
+    failed = (result["failed"] + result["unfinished"]) / result["pcs"]
+    return failed > args.max_failed or result["job_p99_s"] > args.max_p99
+
+
+def print_row(result: dict) -> None:
+    print(
+        f"{result['pcs']:>6} {result['completed']:>6} {result['failed']:>6} "
+        f"{result['job_p50_s']:>8.1f} {result['job_p99_s']:>8.1f} "
+        f"{result['egress_mb_per_s']:>8.1f} {result['hub_cpu_util']:>6.0%} "
+        f"{result['hub_rss_max_mb']:>8.0f} {result['hub_fds_max']:>6} "
+        f"{result['db_locked_errors']:>7}",
+        flush=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pcs", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--image-mb", type=int, default=64)
+    parser.add_argument("--pull-rate-mb", type=float, default=10.0)
+    parser.add_argument("--interrupt", type=float, default=0.0005)
+    parser.add_argument("--pc-latency", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=1800)
+    parser.add_argument("--max-failed", type=float, default=0.01)
+    parser.add_argument("--max-p99", type=float, default=600)
+    parser.add_argument("--keep-going", action="store_true")
+    parser.add_argument("--hub-env", nargs="*", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    args.hub_env = dict(item.split("=", 1) for item in args.hub_env)
+
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    results, tipped_at = [], None
+    print(
+        f"{'pcs':>6} {'done':>6} {'failed':>6} {'p50 s':>8} {'p99 s':>8} "
+        f"{'MB/s':>8} {'cpu':>6} {'rss MB':>8} {'fds':>6} {'locked':>7}"
+    )
+    with tempfile.TemporaryDirectory() as scratch:
+        image_path = Path(scratch) / "fleet.raw"
+        with image_path.open("wb") as handle:
+            block = os.urandom(MB)
+            for _ in range(args.image_mb):
+                handle.write(block)
+        for pc_count in args.pcs:
+            result = run_step(pc_count, args, image_path)
+            results.append(result)
+            print_row(result)
+            if tipped(result, args) and tipped_at is None:
+                tipped_at = pc_count
+                if not args.keep_going:
+                    break
+
+    print(f"tipped at: {tipped_at or 'not reached'}")
+    if args.output:
+        report = {
+            "args": {key: str(value) if isinstance(value, Path) else value
+                     for key, value in vars(args).items()},
+            "tipped_at": tipped_at,
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Measure sync-job throughput on a fleet of fast and slow Prism Centrals.
+
+A backlog for the slow PCs (slow API, long-running import tasks) is published
+first, then the same images go to the fast PCs. "shared" lets any PC take any
+import slot, as before per-PC limits; "per-pc" caps each PC at
+SYNC_PC_MAX_IN_FLIGHT running imports so the scheduler hands the remaining
+slots to the other PCs' queues. Run from the repository root:
+
+    python bench/mixed_fleet.py --fast 8 --slow 2 --images 12
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench.suite import asgi_client, load_app  # noqa: E402
+
+PROFILES = ("shared", "per-pc")
+
+
+async def _run(main, fleet, slow_count: int, images: int) -> dict:
+    from app.db import SessionLocal
+    from app.models import PrismCentral, SyncJob
+
+    with SessionLocal() as db:
+        db.add_all(
+            PrismCentral(name=f"pc-{index}", api_url=pc.url, username="admin", password="x")
+            for index, pc in enumerate(fleet.pcs)
+        )
+        db.commit()
+        pc_ids = [pc_id for (pc_id,) in db.query(PrismCentral.id).order_by(PrismCentral.id)]
+    slow_ids, fast_ids = pc_ids[:slow_count], pc_ids[slow_count:]
+
+    async with asgi_client(main) as client:
+        image_ids = []
+        for index in range(images):
+            files = {"file": ("bench.raw", f"image-{index}".encode())}
+            data = {"name": f"bench-{index}", "version": "1"}
+            image = (await client.post("/images", data=data, files=files)).json()
+            await client.post(f"/images/{image['id']}/approve")
+            image_ids.append(image["id"])
+        started = time.perf_counter()
+        for targets in (slow_ids, fast_ids):
+            response = await client.post(
+                "/publish", json={"image_ids": image_ids, "pc_ids": targets}
+            )
+            response.raise_for_status()
+
+    fast_done = None
+    pending = {"queued", "waiting", "running"}
+    while True:
+        with SessionLocal() as db:
+            jobs = db.query(SyncJob).all()
+        fast = [job for job in jobs if job.pc_id in fast_ids]
+        if fast_done is None and not any(job.status in pending for job in fast):
+            fast_done = time.perf_counter() - started
+        if not any(job.status in pending for job in jobs):
+            break
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    fast_seconds = sorted((job.updated_at - job.created_at).total_seconds() for job in fast)
+    job_seconds = [(job.updated_at - job.created_at).total_seconds() for job in jobs]
+    return {
+        "fast_done_s": fast_done,
+        "fast_jobs_per_s": len(fast) / fast_done,
+        "fast_job_p50_s": statistics.median(fast_seconds),
+        "job_mean_s": statistics.mean(job_seconds),
+        "total_s": elapsed,
+        "jobs_per_s": len(jobs) / elapsed,
+        "failed": sum(job.status != "completed" for job in jobs),
+    }
+
+
+def run_profile(name: str, args) -> dict:
+    from tests.fake_pc import FakeFleet
+
+    with tempfile.TemporaryDirectory() as workdir, FakeFleet(
+        args.fast + args.slow, latency=args.fast_latency
+    ) as fleet:
+        for pc in fleet.pcs[: args.slow]:
+            pc.latency = args.slow_latency
+            pc.task_polls = args.slow_polls
+        main = load_app(
+            Path(workdir),
+            PUBLISH_MAX_ACTIVE_IMPORTS=args.max_active_imports,
+            SYNC_PC_MAX_IN_FLIGHT=0 if name == "shared" else args.pc_max_in_flight,
+        )
+        result = asyncio.run(_run(main, fleet, args.slow, args.images))
+        main.dispatcher.shutdown()
+        main.engine.dispose()
+    return dict(result, profile=name)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=list(PROFILES))
+    parser.add_argument("--fast", type=int, default=8)
+    parser.add_argument("--slow", type=int, default=2)
+    parser.add_argument("--images", type=int, default=12)
+    parser.add_argument("--max-active-imports", type=int, default=8)
+    parser.add_argument("--pc-max-in-flight", type=int, default=3)
+    parser.add_argument("--fast-latency", type=float, default=0.01)
+    parser.add_argument("--slow-latency", type=float, default=0.3)
+    parser.add_argument("--slow-polls", type=int, default=8)
+    args = parser.parse_args()
+
+    print(
+        f"{'profile':>8} {'fast done':>10} {'fast jobs/s':>12} {'fast p50':>9} "
+        f"{'job mean':>9} {'total':>8} {'jobs/s':>7} {'failed':>7}"
+    )
+    for name in args.profiles:
+        result = run_profile(name, args)
+        print(
+            f"{result['profile']:>8} {result['fast_done_s']:>9.1f}s "
+            f"{result['fast_jobs_per_s']:>12.1f} {result['fast_job_p50_s']:>8.1f}s "
+            f"{result['job_mean_s']:>8.1f}s {result['total_s']:>7.1f}s {result['jobs_per_s']:>7.1f} {result['failed']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
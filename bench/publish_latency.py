@@ -0,0 +1,79 @@
+"""Measure POST /images/{id}/publish latency as the number of PCs grows.
+
+Dispatch is stubbed out so the numbers cover the request path itself: target
+lookup, the bulk job insert and the response. Each round publishes a fresh
+image, so every round inserts its jobs. Run from the repository root:
+
+    python bench/publish_latency.py --pcs 10 100 250 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench.suite import asgi_client, load_app, summarize  # noqa: E402
+
+
+async def measure(pc_count: int, rounds: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        main = load_app(Path(workdir))
+        main.dispatcher.dispatch = lambda job_ids: []
+        from app.db import SessionLocal
+        from app.models import PrismCentral
+
+        with SessionLocal() as db:
+            db.add_all(
+                PrismCentral(name=f"pc-{index}", api_url=f"https://pc-{index}")
+                for index in range(pc_count)
+            )
+            db.commit()
+
+        async with asgi_client(main) as client:
+            timings = []
+            for index in range(rounds):
+                # A new image every round: republishing one whose jobs are
+                # still importing (dispatch is stubbed) only joins them and
+                # never reaches the insert path.
+                files = {"file": ("image.qcow2", f"bench-image-{index}".encode())}
+                data = {"name": "bench", "version": str(index)}
+                image = (await client.post("/images", data=data, files=files)).json()
+                await client.post(f"/images/{image['id']}/approve")
+
+                started = time.perf_counter()
+                response = await client.post(f"/images/{image['id']}/publish")
+                timings.append(time.perf_counter() - started)
+                response.raise_for_status()
+                assert len(response.json()) == pc_count
+        main.engine.dispose()
+
+    return {
+        "pcs": pc_count,
+        **summarize(timings),
+        "per_pc_us": statistics.median(timings) / pc_count * 1e6,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pcs", type=int, nargs="+", default=[10, 50, 100, 250, 500])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    print(f"{'pcs':>6} {'median ms':>10} {'p95 ms':>10} {'us/pc':>8}")
+    for pc_count in args.pcs:
+        result = asyncio.run(measure(pc_count, args.rounds))
+        print(
+            f"{result['pcs']:>6} {result['median_ms']:>10.1f} "
+            f"{result['p95_ms']:>10.1f} {result['per_pc_us']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
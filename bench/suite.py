@@ -0,0 +1,431 @@
+"""Run the offline benchmark suite and write the results as JSON.
+
+Everything runs in-process against scratch databases: S3 is moto, and Prism
+Central is the fake from tests/fake_pc.py (one server hosting a fleet of PCs
+with configurable latency). Run from the repository root:
+
+    python bench/suite.py --output results.json
+    python bench/suite.py --only storage download --size-mb 64
+    python bench/suite.py --output new.json --compare results.json
+
+With --compare, metrics that got worse by more than --tolerance are listed
+and the exit status is 1, so CI can gate on it.
+"""
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+MB = 1024 * 1024
+SECTIONS = ("startup", "storage", "download", "list", "publish")
+# Metric name suffixes where a larger number is an improvement; every other
+# metric is a latency or a cost.
+HIGHER_IS_BETTER = ("mb_per_s", "jobs_per_s")
+
+
+def load_app(workdir: Path, **env):
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+        STORAGE_BACKEND="local",
+        LOCAL_STORAGE_PATH=str(workdir / "storage"),
+        BLOB_CACHE_PATH=str(workdir / "cache"),
+        PC_VALIDATE_CONNECTION="false",
+        PC_TASK_POLL_MIN_INTERVAL="0.05",
+        PC_TASK_POLL_MAX_INTERVAL="0.5",
+    )
+    os.environ.update({name: str(value) for name, value in env.items()})
+    os.environ.pop("CELERY_BROKER_URL", None)
+    os.environ.pop("CELERY_RESULT_BACKEND", None)
+    for module_name in list(sys.modules):
+        if module_name == "app" or module_name.startswith("app."):
+            del sys.modules[module_name]
+    main = importlib.import_module("app.main")
+    importlib.import_module("app.migrations").migrate()
+    return main
+
+
+def asgi_client(main):
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None)
+
+
+def summarize(timings: list) -> dict:
+    # Nearest-rank p95, so a short run reports its slowest sample rather than
+    # one below the median.
+    timings = sorted(timings)
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[math.ceil(len(timings) * 0.95) - 1] * 1000,
+    }
+
+
+@contextmanager
+def mock_s3():
+    import moto
+
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ.setdefault(name, "testing")
+    os.environ.pop("S3_ENDPOINT_URL", None)
+    with moto.mock_aws():
+        yield
+
+
+def bench_startup(args) -> list:
+    # Cold start in a fresh interpreter, as a uvicorn or Celery worker pays
+    # it, and the in-process reload the tests do for every case.
+    script = (
+        "import time; started = time.perf_counter(); import app.main; "
+        "print(time.perf_counter() - started)"
+    )
+    cold, reload = [], []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+            LOCAL_STORAGE_PATH=str(Path(workdir) / "storage"),
+            BLOB_CACHE_PATH=str(Path(workdir) / "cache"),
+        )
+        for _ in range(args.rounds):
+            output = subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=ROOT,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            cold.append(float(output.split()[-1]))
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            main = load_app(Path(workdir))
+            reload.append(time.perf_counter() - started)
+            main.engine.dispose()
+    return [
+        {"name": "startup.import_app_main", **summarize(cold)},
+        {"name": "startup.load_app", **summarize(reload)},
+    ]
+
+
+def bench_storage(args) -> list:
+    data = os.urandom(args.size_mb * MB)
+    started = time.perf_counter()
+    hashlib.sha256(data).hexdigest()
+    results = [
+        {
+            "name": "sha256",
+            "mb_per_s": args.size_mb / (time.perf_counter() - started),
+        }
+    ]
+    for backend in args.backends:
+        env = {"STORAGE_BACKEND": backend, "S3_BUCKET": "bench", "S3_REGION": "us-east-1"}
+        with tempfile.TemporaryDirectory() as workdir, (
+            mock_s3() if backend == "s3" else nullcontext()
+        ):
+            main = load_app(Path(workdir), **env)
+            from app import metrics
+
+            if backend == "s3":
+                main.storage_client.s3.create_bucket(Bucket="bench")
+            timings = []
+            for _ in range(args.rounds):
+                # Vary the payload so every round stores a new blob.
+                payload = os.urandom(16) + data
+                started = time.perf_counter()
+                staged = main.storage_client.stage(payload)
+                main.storage_client.commit(staged)
+                timings.append(time.perf_counter() - started)
+            hashing = metrics.registry.get_sample_value("image_hub_sha256_seconds_sum")
+            results.append(
+                {
+                    "name": f"stage_commit.{backend}",
+                    "mb_per_s": args.size_mb / statistics.median(timings),
+                    "hash_share": hashing / sum(timings),
+                    **summarize(timings),
+                }
+            )
+            main.engine.dispose()
+    return results
+
+
+async def _download(main, args) -> dict:
+    async with asgi_client(main) as client:
+        files = {"file": ("bench.raw", os.urandom(args.size_mb * MB))}
+        data = {"name": "bench", "version": "1"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        url = f"/images/{image['id']}/download"
+        timings = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            response = await client.get(url)
+            timings.append(time.perf_counter() - started)
+            response.raise_for_status()
+        ranged = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            response = await client.get(url, headers={"Range": "bytes=0-1048575"})
+            ranged.append(time.perf_counter() - started)
+    return {
+        "name": "download.local",
+        "mb_per_s": args.size_mb / statistics.median(timings),
+        **summarize(timings),
+        "range_1mb_median_ms": statistics.median(ranged) * 1000,
+    }
+
+
+def bench_download(args) -> list:
+    with tempfile.TemporaryDirectory() as workdir:
+        main = load_app(Path(workdir), BLOB_CACHE_MAX_BYTES=0)
+        result = asyncio.run(_download(main, args))
+        main.engine.dispose()
+    return [result]
+
+
+def _seed_jobs(main, rows: int, pcs: int) -> None:
+    from app.models import Image, PrismCentral, SyncJob
+
+    statuses = ("completed", "completed", "completed", "failed", "running", "queued")
+    now = datetime.utcnow()
+    with main.engine.begin() as connection:
+        connection.execute(
+            Image.__table__.insert(),
+            [
+                {
+                    "name": "bench",
+                    "version": "1",
+                    "sha256": "0" * 64,
+                    "storage_uri": "unused",
+                    "approved": True,
+                }
+            ],
+        )
+        connection.execute(
+            PrismCentral.__table__.insert(),
+            [{"name": f"pc-{index}", "api_url": f"https://pc-{index}"} for index in range(pcs)],
+        )
+        batch = []
+        for index in range(rows):
+            stamp = now - timedelta(seconds=rows - index)
+            batch.append(
+                {
+                    "image_id": 1,
+                    "pc_id": index % pcs + 1,
+                    "status": statuses[index % len(statuses)],
+                    "created_at": stamp,
+                    "updated_at": stamp,
+                }
+            )
+            if len(batch) == 10_000:
+                connection.execute(SyncJob.__table__.insert(), batch)
+                batch = []
+        if batch:
+            connection.execute(SyncJob.__table__.insert(), batch)
+
+
+async def _list(main, rows: int, rounds: int) -> list:
+    queries = {
+        "first_page": "/sync-jobs?limit=100",
+        "by_status": "/sync-jobs?status=failed&limit=100",
+        "by_pc": "/sync-jobs?pc_id=7&limit=100",
+        "by_updated_at": "/sync-jobs?sort=-updated_at&limit=100",
+        "ui_tasks": "/ui/tasks",
+    }
+    results = []
+    async with asgi_client(main) as client:
+        # The tenth page (or the last, on a small table), reached by
+        # following cursors.
+        url = "/sync-jobs?limit=100"
+        for _ in range(9):
+            cursor = (await client.get(url)).headers.get("x-next-cursor")
+            if not cursor:
+                break
+            url = f"/sync-jobs?limit=100&cursor={cursor}"
+        queries["tenth_page"] = url
+
+        for name, url in queries.items():
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                response = await client.get(url)
+                timings.append(time.perf_counter() - started)
+                response.raise_for_status()
+            results.append({"name": f"list.{name}.{rows}", **summarize(timings)})
+    return results
+
+
+def bench_list(args) -> list:
+    results = []
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as workdir:
+            main = load_app(Path(workdir))
+            _seed_jobs(main, rows, pcs=100)
+            results.extend(asyncio.run(_list(main, rows, args.rounds)))
+            main.engine.dispose()
+    return results
+
+
+async def _publish(main, fleet) -> dict:
+    from app.db import SessionLocal
+    from app.models import PrismCentral, SyncJob
+
+    with SessionLocal() as db:
+        db.add_all(
+            PrismCentral(name=f"pc-{index}", api_url=pc.url, username="admin", password="x")
+            for index, pc in enumerate(fleet.pcs)
+        )
+        db.commit()
+
+    async with asgi_client(main) as client:
+        files = {"file": ("bench.raw", b"bench-image")}
+        data = {"name": "bench", "version": "1"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+        started = time.perf_counter()
+        response = await client.post(f"/images/{image['id']}/publish")
+        accepted = time.perf_counter() - started
+        response.raise_for_status()
+
+    pending = {"queued", "waiting", "running"}
+    while True:
+        with SessionLocal() as db:
+            jobs = db.query(SyncJob).all()
+        if not any(job.status in pending for job in jobs):
+            break
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    job_seconds = sorted(
+        (job.updated_at - job.created_at).total_seconds() for job in jobs
+    )
+    return {
+        "name": f"publish.{len(fleet.pcs)}_pcs",
+        "accepted_ms": accepted * 1000,
+        "total_s": elapsed,
+        "jobs_per_s": len(jobs) / elapsed,
+        "job_p50_s": statistics.median(job_seconds),
+        "job_max_s": job_seconds[-1],
+        "failed": sum(job.status != "completed" for job in jobs),
+        "pc_requests": dict(fleet.requests()),
+    }
+
+
+def bench_publish(args) -> list:
+    from tests.fake_pc import FakeFleet
+
+    results = []
+    for pc_count in args.pcs:
+        with tempfile.TemporaryDirectory() as workdir, FakeFleet(
+            pc_count, latency=args.pc_latency, task_polls=args.task_polls
+        ) as fleet:
+            main = load_app(Path(workdir))
+            results.append(asyncio.run(_publish(main, fleet)))
+            main.dispatcher.shutdown()
+            main.engine.dispose()
+    return results
+
+
+def flatten(report: dict) -> dict:
+    metrics = {}
+    for entries in report["results"].values():
+        for entry in entries:
+            for key, value in entry.items():
+                if key != "name" and isinstance(value, (int, float)):
+                    metrics[f"{entry['name']}.{key}"] = value
+    return metrics
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    old = flatten(baseline)
+    for name, value in flatten(current).items():
+        before = old.get(name)
+        if not before or name.endswith((".failed", ".hash_share")):
+            continue
+        change = (value - before) / before
+        if name.endswith(HIGHER_IS_BETTER):
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{name}: {before:.3f} -> {value:.3f} ({change:+.0%})")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--backends", nargs="+", choices=["local", "s3"], default=["local", "s3"])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--pcs", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--pc-latency", type=float, default=0.02)
+    parser.add_argument("--task-polls", type=int, default=2)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    runners = {
+        "startup": bench_startup,
+        "storage": bench_storage,
+        "download": bench_download,
+        "list": bench_list,
+        "publish": bench_publish,
+    }
+    report = {
+        "revision": git_revision(),
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items()
+        },
+        "results": {},
+    }
+    for section in args.only:
+        print(f"running {section}...", file=sys.stderr)
+        report["results"][section] = runners[section](args)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
+
+
+@pytest.fixture
+def fake_pc():
+    from tests.fake_pc import FakePrismCentral
+
+    with FakePrismCentral() as server:
+        yield server
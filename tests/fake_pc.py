@@ -0,0 +1,287 @@
+import asyncio
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+
+def _serve(app) -> Tuple[uvicorn.Server, threading.Thread, str]:
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="error", lifespan="off")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Fake Prism Central did not start.")
+        time.sleep(0.01)
+    host, port = server.servers[0].sockets[0].getsockname()[:2]
+    return server, thread, f"http://{host}:{port}"
+
+
+class FakePrismCentral:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        task_polls: int = 0,
+        pull: bool = False,
+        pull_rate: float = 0.0,
+        pull_retries: int = 5,
+        pull_interrupt: float = 0.0,
+        source_address: Optional[str] = None,
+    ):
+        self.latency = latency
+        self.task_polls = task_polls
+        # With pull on, an import really downloads source_uri (at pull_rate
+        # bytes/s if set) and its task runs until the bytes are in. A
+        # connection drops with probability pull_interrupt per chunk and the
+        # pull resumes with a Range request, up to pull_retries times.
+        self.pull = pull
+        self.pull_rate = pull_rate
+        self.pull_retries = pull_retries
+        self.pull_interrupt = pull_interrupt
+        self.source_address = source_address
+        self.pulled_bytes = 0
+        self.resumes = 0
+        self.task_state = "SUCCEEDED"
+        # Imports whose source_uri starts with one of these fail, as if the PC
+        # could not reach that host.
+        self.unreachable_sources: tuple = ()
+        # The next N requests to a route get a 503, as while a PC restarts.
+        self.unavailable: Counter = Counter()
+        self.tasks: Dict[str, dict] = {}
+        self.images: Dict[str, dict] = {}
+        self.image_states: Dict[str, str] = {}
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests: Counter = Counter()
+        self.url: Optional[str] = None
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        api = "/api/nutanix/v3"
+        self.app = Starlette(
+            routes=[
+                Route(f"{api}/clusters/list", self.list_clusters, methods=["POST"]),
+                Route(f"{api}/images", self.create_image, methods=["POST"]),
+                Route(f"{api}/images/list", self.list_images, methods=["POST"]),
+                Route(f"{api}/tasks/list", self.list_tasks, methods=["POST"]),
+                Route(f"{api}/tasks/{{task_uuid}}", self.get_task, methods=["GET"]),
+            ]
+        )
+
+    async def _observe(self, request: Request, name: str) -> None:
+        self.connections.add(request.client.port)
+        self.requests[name] += 1
+        if self.latency:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.latency)
+            finally:
+                self.in_flight -= 1
+
+    async def list_clusters(self, request: Request):
+        await self._observe(request, "clusters/list")
+        return JSONResponse({"entities": [{"metadata": {"uuid": "cluster-1"}}]})
+
+    async def create_image(self, request: Request):
+        await self._observe(request, "images")
+        spec = (await request.json())["spec"]
+        image_uuid = str(uuid.uuid4())
+        task_uuid = str(uuid.uuid4())
+        self.images[image_uuid] = spec
+        self.image_states[image_uuid] = "PENDING"
+        source_uri = spec.get("resources", {}).get("source_uri", "")
+        unreachable = source_uri.startswith(self.unreachable_sources)
+        self.tasks[task_uuid] = {
+            "polls_left": self.task_polls,
+            "image_uuid": image_uuid,
+            "state": "FAILED" if unreachable else None,
+            "error": f"Could not connect to {source_uri}: Connection refused"
+            if unreachable
+            else None,
+        }
+        if self.pull and self.tasks[task_uuid]["state"] is None:
+            task = self.tasks[task_uuid]
+            task["pull"] = asyncio.ensure_future(self._pull(task, source_uri))
+        return JSONResponse(
+            {
+                "metadata": {"uuid": image_uuid},
+                "status": {"execution_context": {"task_uuid": task_uuid}},
+            },
+            status_code=202,
+        )
+
+    async def list_images(self, request: Request):
+        await self._observe(request, "images/list")
+        payload = await request.json()
+        offset, length = payload.get("offset", 0), payload.get("length", 20)
+        entities = [
+            {
+                "metadata": {"uuid": image_uuid},
+                "spec": spec,
+                "status": {"state": self.image_states[image_uuid]},
+            }
+            for image_uuid, spec in self.images.items()
+        ]
+        return JSONResponse(
+            {
+                "entities": entities[offset : offset + length],
+                "metadata": {"total_matches": len(entities)},
+            }
+        )
+
+    async def _pull(self, task: dict, source_uri: str) -> None:
+        task.update(received=0, total=None)
+        transport = httpx.AsyncHTTPTransport(local_address=self.source_address)
+        async with httpx.AsyncClient(transport=transport, timeout=30) as client:
+            failures = 0
+            while failures <= self.pull_retries:
+                received = task["received"]
+                try:
+                    await self._pull_once(client, task, source_uri)
+                    return
+                except (httpx.HTTPError, ConnectionError):
+                    # Only attempts that made no progress use up a retry.
+                    failures = failures + 1 if task["received"] == received else 1
+                    self.resumes += 1
+                    await asyncio.sleep(min(0.05 * 2**failures, 2))
+        task["state"] = "FAILED"
+
+    async def _pull_once(self, client: httpx.AsyncClient, task: dict, source_uri: str) -> None:
+        if task["total"] and task["received"] >= task["total"]:
+            return
+        headers = {"Range": f"bytes={task['received']}-"} if task["received"] else {}
+        async with client.stream("GET", source_uri, headers=headers) as response:
+            response.raise_for_status()
+            if response.status_code == 200:
+                task["received"] = 0
+                task["total"] = int(response.headers.get("content-length", 0))
+            started, received = time.monotonic(), 0
+            async for chunk in response.aiter_bytes():
+                task["received"] += len(chunk)
+                self.pulled_bytes += len(chunk)
+                received += len(chunk)
+                if self.pull_interrupt and random.random() < self.pull_interrupt:
+                    raise ConnectionError("simulated connection drop")
+                if self.pull_rate:
+                    delay = received / self.pull_rate - (time.monotonic() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+        if task["total"] and task["received"] < task["total"]:
+            raise ConnectionError("short read")
+
+    def task_body(self, task_uuid: str) -> dict:
+        task = self.tasks[task_uuid]
+        state, percentage = task["state"] or self.task_state, 100
+        pull = task.get("pull")
+        if pull is not None and not pull.done() and task["state"] is None:
+            total = task.get("total") or 0
+            state = "RUNNING"
+            percentage = int(task["received"] * 100 / total) if total else 0
+        elif task["polls_left"] > 0:
+            task["polls_left"] -= 1
+            state, percentage = "RUNNING", 50
+        elif state == "SUCCEEDED":
+            self.image_states[task["image_uuid"]] = "COMPLETE"
+        status = {"state": state, "percentage_complete": percentage}
+        if state == "FAILED" and task.get("error"):
+            status["error_detail"] = task["error"]
+        return {"metadata": {"uuid": task_uuid}, "status": status}
+
+    def _outage(self, name: str) -> Optional[JSONResponse]:
+        if self.unavailable[name] <= 0:
+            return None
+        self.unavailable[name] -= 1
+        return JSONResponse({"message": "service unavailable"}, status_code=503)
+
+    async def get_task(self, request: Request):
+        await self._observe(request, "tasks")
+        outage = self._outage("tasks")
+        if outage is not None:
+            return outage
+        task_uuid = request.path_params["task_uuid"]
+        if task_uuid not in self.tasks:
+            return JSONResponse({"message": "not found"}, status_code=404)
+        return JSONResponse(self.task_body(task_uuid))
+
+    async def list_tasks(self, request: Request):
+        await self._observe(request, "tasks/list")
+        outage = self._outage("tasks/list")
+        if outage is not None:
+            return outage
+        payload = await request.json()
+        wanted = [
+            clause.split("==", 1)[1]
+            for clause in (payload.get("filter") or "").split(",")
+            if clause.startswith("uuid==")
+        ]
+        entities = [
+            self.task_body(task_uuid) for task_uuid in wanted if task_uuid in self.tasks
+        ]
+        return JSONResponse({"entities": entities})
+
+    def start(self) -> "FakePrismCentral":
+        self._server, self._thread, self.url = _serve(self.app)
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+
+    def __enter__(self) -> "FakePrismCentral":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class FakeFleet:
+    # Many independent fake PCs behind one server, each under its own path
+    # prefix, so a benchmark can register hundreds of PCs (separate inventories,
+    # connection pools and task watchers) without hundreds of threads.
+    def __init__(self, count: int, **options):
+        # Each PC pulls from its own loopback address (127.0.x.y), so the hub
+        # sees, schedules and counts them as separate clients.
+        self.pcs: List[FakePrismCentral] = [
+            FakePrismCentral(
+                source_address=f"127.0.{index // 250}.{index % 250 + 2}", **options
+            )
+            for index in range(count)
+        ]
+        self.app = Starlette(
+            routes=[Mount(f"/pc-{index}", app=pc.app) for index, pc in enumerate(self.pcs)]
+        )
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def requests(self) -> Counter:
+        return sum((pc.requests for pc in self.pcs), Counter())
+
+    def start(self) -> "FakeFleet":
+        self._server, self._thread, url = _serve(self.app)
+        for index, pc in enumerate(self.pcs):
+            pc.url = f"{url}/pc-{index}"
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+
+    def __enter__(self) -> "FakeFleet":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -1,15 +1,25 @@
+import asyncio
+import hashlib
 import importlib
+import json
 import os
+import socket
+import subprocess
 import sys
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
 
 import httpx
 import pytest
+import uvicorn
 
 
-def load_app(tmp_path: Path):
+def load_app(tmp_path: Path, storage_backend: str = "local"):
     os.environ["DATABASE_URL"] = f"sqlite:///{tmp_path}/test.db"
-    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["STORAGE_BACKEND"] = storage_backend
     os.environ["LOCAL_STORAGE_PATH"] = str(tmp_path / "storage")
     os.environ["PC_VALIDATE_CONNECTION"] = "false"
     os.environ.pop("CELERY_BROKER_URL", None)
@@ -22,6 +32,8 @@ def load_app(tmp_path: Path):
             del sys.modules[module_name]
 
     main = importlib.import_module("app.main")
+    # ASGITransport does not run the lifespan that migrates on startup.
+    importlib.import_module("app.migrations").migrate()
     return main.app
 
 
@@ -30,6 +42,65 @@ def create_client(app):
     return httpx.AsyncClient(transport=transport, base_url="http://test")
 
 
+@contextmanager
+def serve_in_thread(app):
+    config = uvicorn.Config(
+        app, host="127.0.0.1", port=0, log_level="error", lifespan="off"
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "Server did not start."
+        time.sleep(0.01)
+    host, port = server.servers[0].sockets[0].getsockname()[:2]
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+@contextmanager
+def serve_edge(tmp_path: Path, upstream_url: str):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path}/edge.db",
+        LOCAL_STORAGE_PATH=str(tmp_path / "edge-storage"),
+        BLOB_CACHE_PATH=str(tmp_path / "edge-cache"),
+        HUB_ROLE="edge",
+        EDGE_UPSTREAM_URL=upstream_url,
+        PC_VALIDATE_CONNECTION="false",
+    )
+    edge = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "error",
+        ],
+        cwd=Path(__file__).resolve().parents[1],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                httpx.get(f"{url}/reachability").raise_for_status()
+                break
+            except httpx.HTTPError:
+                assert edge.poll() is None, "Edge replica exited."
+                assert time.monotonic() < deadline, "Edge replica did not start."
+                time.sleep(0.1)
+        yield url
+    finally:
+        edge.terminate()
+        edge.wait(timeout=10)
+
+
 @pytest.mark.asyncio
 async def test_register_and_list_pcs(tmp_path):
     app = load_app(tmp_path)
@@ -74,3 +145,1592 @@ async def test_image_upload_approve_publish(tmp_path):
         jobs = response.json()
         assert len(jobs) == 1
         assert jobs[0]["status"] == "queued"
+
+
+@pytest.mark.asyncio
+async def test_large_upload_streams_with_flat_memory(tmp_path):
+    import tracemalloc
+
+    app = load_app(tmp_path)
+
+    size = 64 * 1024 * 1024
+    source = tmp_path / "large.qcow2"
+    expected = hashlib.sha256()
+    block = os.urandom(1024 * 1024)
+    with source.open("wb") as handle:
+        for _ in range(size // len(block)):
+            handle.write(block)
+            expected.update(block)
+
+    # tracemalloc's peak covers only this upload, unlike ru_maxrss, which is a
+    # lifetime peak that an earlier test may already have raised.
+    tracemalloc.start()
+    try:
+        async with create_client(app) as client:
+            with source.open("rb") as handle:
+                files = {"file": ("large.qcow2", handle)}
+                data = {"name": "large", "version": "1.0"}
+                response = await client.post("/images", data=data, files=files)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert response.status_code == 200
+    image = response.json()
+    assert image["sha256"] == expected.hexdigest()
+    assert os.path.getsize(image["storage_uri"]) == size
+    assert peak < size // 4
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_session(tmp_path):
+    app = load_app(tmp_path)
+    from app.uploads import upload_sessions
+
+    chunks = [os.urandom(300_000), os.urandom(300_000), os.urandom(1234)]
+    blob = b"".join(chunks)
+    async with create_client(app) as client:
+        response = await client.post(
+            "/uploads",
+            json={
+                "name": "rocky",
+                "version": "9",
+                "filename": "rocky.qcow2",
+                "size": len(blob),
+                "sha256": hashlib.sha256(blob).hexdigest(),
+            },
+        )
+        assert response.status_code == 200
+        session_id = response.json()["id"]
+
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/0", params={"offset": 0}, content=chunks[0]
+        )
+        assert response.json()["received_bytes"] == len(chunks[0])
+
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/2", params={"offset": 600_000}, content=chunks[2]
+        )
+        assert response.status_code == 409
+
+        offset = len(chunks[0])
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/1", params={"offset": offset}, content=chunks[1]
+        )
+        assert response.json()["next_chunk"] == 2
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/1", params={"offset": offset}, content=chunks[1]
+        )
+        assert response.status_code == 200
+        assert response.json()["received_bytes"] == 600_000
+
+        # Simulate a restarted worker that lost the in-memory hash state.
+        upload_sessions._hashers.clear()
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/2", params={"offset": 600_000}, content=chunks[2]
+        )
+        assert response.status_code == 200
+
+        response = await client.get(f"/uploads/{session_id}")
+        assert response.json()["received_bytes"] == len(blob)
+
+        response = await client.post(f"/uploads/{session_id}/finalize")
+        assert response.status_code == 200
+        image = response.json()
+        assert image["sha256"] == hashlib.sha256(blob).hexdigest()
+        assert image["approved"] is False
+        with open(image["storage_uri"], "rb") as handle:
+            assert handle.read() == blob
+
+        response = await client.get("/images")
+        assert [item["id"] for item in response.json()] == [image["id"]]
+
+        response = await client.post(f"/uploads/{session_id}/finalize")
+        assert response.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_upload_chunks_stay_consistent_across_workers(tmp_path, monkeypatch):
+    app = load_app(tmp_path)
+    from app import main
+    from app.maintenance import maintenance
+    from app.uploads import UploadSessionStore
+
+    # Two API workers, each with its own in-memory hash state.
+    owner, other = main.upload_sessions, UploadSessionStore()
+    chunks = [os.urandom(100_000), os.urandom(100_000), os.urandom(5_000)]
+    blob = b"".join(chunks)
+    async with create_client(app) as client:
+        payload = {"name": "alma", "version": "9", "filename": "alma.qcow2"}
+        session_id = (await client.post("/uploads", json=payload)).json()["id"]
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/0", params={"offset": 0}, content=chunks[0]
+        )
+        assert response.status_code == 200
+        offset = len(chunks[0])
+
+        # The session is bound to the worker holding its running hash.
+        monkeypatch.setattr(main, "upload_sessions", other)
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/1", params={"offset": offset}, content=chunks[1]
+        )
+        assert response.status_code == 409
+        assert "another API worker" in response.json()["detail"]
+        assert (await client.post(f"/uploads/{session_id}/finalize")).status_code == 409
+        # A resent chunk the session already holds is still acknowledged.
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/0", params={"offset": 0}, content=chunks[0]
+        )
+        assert response.status_code == 200
+
+        monkeypatch.setattr(main, "upload_sessions", owner)
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/1", params={"offset": offset}, content=chunks[1]
+        )
+        assert response.status_code == 200
+        offset += len(chunks[1])
+
+        # Once the session sits idle for the lease (its worker may be gone),
+        # another worker adopts it and hashes the staged bytes once.
+        monkeypatch.setattr(main, "upload_sessions", other)
+        reads = []
+        real_open = Path.open
+
+        def counting_open(path, mode="r", *args, **kwargs):
+            if path.suffix == ".part" and mode == "rb":
+                reads.append(path)
+            return real_open(path, mode, *args, **kwargs)
+
+        with monkeypatch.context() as patch:
+            patch.setattr(main.settings, "upload_lease_seconds", 0)
+            patch.setattr(Path, "open", counting_open)
+            response = await client.put(
+                f"/uploads/{session_id}/chunks/2",
+                params={"offset": offset},
+                content=chunks[2],
+            )
+        assert response.status_code == 200
+        assert len(reads) == 1
+        offset += len(chunks[2])
+
+        # A chunk in flight on another worker holds the session.
+        from app.db import SessionLocal
+        from app.models import UploadSession
+
+        with SessionLocal() as db:
+            session = db.get(UploadSession, session_id)
+            assert main.upload_sessions.claim(db, session, "receiving") is not None
+        response = await client.put(
+            f"/uploads/{session_id}/chunks/3", params={"offset": offset}, content=b"x"
+        )
+        assert response.status_code == 409
+        assert "Another request" in response.json()["detail"]
+        with SessionLocal() as db:
+            db.get(UploadSession, session_id).status = "open"
+            db.commit()
+
+        response = await client.post(f"/uploads/{session_id}/finalize")
+        assert response.status_code == 200
+        assert response.json()["sha256"] == hashlib.sha256(blob).hexdigest()
+
+        # Abandoned sessions expire and their staged bytes are removed.
+        stale_id = (await client.post("/uploads", json=payload)).json()["id"]
+        await client.put(
+            f"/uploads/{stale_id}/chunks/0", params={"offset": 0}, content=chunks[0]
+        )
+        assert main.upload_sessions.staging_path(stale_id).exists()
+        monkeypatch.setattr(main.settings, "upload_session_ttl", 0)
+        assert maintenance.run_once()["expired_upload_sessions"] == 1
+        assert not main.upload_sessions.staging_path(stale_id).exists()
+        response = await client.get(f"/uploads/{stale_id}")
+        assert response.json()["status"] == "expired"
+
+
+@pytest.mark.asyncio
+async def test_download_ranges_and_conditional_requests(tmp_path):
+    app = load_app(tmp_path)
+    blob = bytes(range(256)) * 40
+    async with create_client(app) as client:
+        files = {"file": ("disk.raw", blob)}
+        data = {"name": "disk", "version": "1"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        url = f"/images/{image['id']}/download"
+        etag = f'"{image["sha256"]}"'
+
+        response = await client.get(url)
+        assert response.status_code == 200
+        assert response.content == blob
+        assert response.headers["etag"] == etag
+        assert response.headers["accept-ranges"] == "bytes"
+
+        response = await client.head(url)
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["content-length"] == str(len(blob))
+        assert response.headers["etag"] == etag
+
+        response = await client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        response = await client.get(url, headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206
+        assert response.content == blob[100:200]
+        assert response.headers["content-range"] == f"bytes 100-199/{len(blob)}"
+
+        response = await client.get(url, headers={"Range": "bytes=-10"})
+        assert response.content == blob[-10:]
+
+        response = await client.get(
+            url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'}
+        )
+        assert response.status_code == 200
+        assert response.content == blob
+
+        response = await client.get(url, headers={"Range": "bytes=0-4,20-29"})
+        assert response.status_code == 206
+        content_type = response.headers["content-type"]
+        assert content_type.startswith("multipart/byteranges")
+        assert int(response.headers["content-length"]) == len(response.content)
+        boundary = content_type.split("boundary=")[1]
+        parts = response.content.split(f"--{boundary}".encode())[1:-1]
+        bodies = [part.split(b"\r\n\r\n", 1)[1][:-2] for part in parts]
+        assert bodies == [blob[0:5], blob[20:30]]
+
+        response = await client.get(url, headers={"Range": f"bytes={len(blob)}-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(blob)}"
+
+
+@pytest.mark.asyncio
+async def test_local_download_uses_zero_copy_send_when_offered(tmp_path, monkeypatch):
+    monkeypatch.setenv("DOWNLOAD_CHUNK_SIZE", "4096")
+    app = load_app(tmp_path)
+    blob = os.urandom(10_000)
+    async with create_client(app) as client:
+        files = {"file": ("disk.raw", blob)}
+        data = {"name": "disk", "version": "1"}
+        image = (await client.post("/images", data=data, files=files)).json()
+
+    messages = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            message = dict(message, file=message["file"].fileno())
+            message["body"] = os.pread(message["file"], message["count"], message["offset"])
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": f"/images/{image['id']}/download",
+        "raw_path": f"/images/{image['id']}/download".encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"test"), (b"range", b"bytes=1000-")],
+        "client": ("10.0.0.5", 5000),
+        "server": ("test", 80),
+        "extensions": {"http.response.zerocopysend": {}},
+    }
+    await app(scope, receive, send)
+
+    assert messages[0]["status"] == 206
+    sent = [m for m in messages if m["type"] == "http.response.zerocopysend"]
+    assert [(m["offset"], m["count"]) for m in sent] == [
+        (1000, 4096),
+        (5096, 4096),
+        (9192, 808),
+    ]
+    assert b"".join(m["body"] for m in sent) == blob[1000:]
+    assert messages[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+
+@pytest.mark.asyncio
+async def test_identical_uploads_share_one_blob(tmp_path):
+    app = load_app(tmp_path)
+    blob = os.urandom(50_000)
+    digest = hashlib.sha256(blob).hexdigest()
+    async with create_client(app) as client:
+        images = []
+        for name in ("ubuntu", "ubuntu-lts", "golden"):
+            files = {"file": (f"{name}.qcow2", blob)}
+            response = await client.post(
+                "/images", data={"name": name, "version": "1"}, files=files
+            )
+            images.append(response.json())
+
+        # Knowing the digest is not enough to claim the blob; the bytes still
+        # have to arrive, and then finalize shares the stored copy.
+        response = await client.post(
+            "/uploads",
+            json={"name": "again", "version": "2", "filename": "x.qcow2", "sha256": digest},
+        )
+        session = response.json()
+        assert session["status"] == "open"
+        assert session["image_id"] is None
+        response = await client.post(f"/uploads/{session['id']}/finalize")
+        assert response.status_code == 400
+        await client.put(
+            f"/uploads/{session['id']}/chunks/0", params={"offset": 0}, content=blob
+        )
+        response = await client.post(f"/uploads/{session['id']}/finalize")
+        shared = response.json()
+        assert shared["storage_uri"] == images[0]["storage_uri"]
+        session = (await client.get(f"/uploads/{session['id']}")).json()
+        assert session["status"] == "finalized"
+        assert session["image_id"] == shared["id"]
+
+        uris = {image["storage_uri"] for image in images}
+        assert len(uris) == 1
+        blob_path = uris.pop()
+        stored = [
+            path for path in (tmp_path / "storage" / "blobs").rglob("*") if path.is_file()
+        ]
+        assert [str(path) for path in stored] == [blob_path]
+
+        response = await client.get(f"/images/{images[1]['id']}/download")
+        assert 'filename="ubuntu-lts.qcow2"' in response.headers["content-disposition"]
+
+        for image in images:
+            await client.post(f"/ui/images/{image['id']}/delete")
+            assert os.path.exists(blob_path)
+        await client.post(f"/ui/images/{shared['id']}/delete")
+        assert not os.path.exists(blob_path)
+
+
+@pytest.mark.asyncio
+async def test_list_endpoints_paginate_and_filter(tmp_path):
+    app = load_app(tmp_path)
+    from datetime import datetime, timedelta
+
+    from app.db import SessionLocal
+    from app.models import Image, PrismCentral, SyncJob
+
+    base = datetime(2026, 1, 1)
+    with SessionLocal() as db:
+        pcs = [PrismCentral(name=f"pc-{i}", api_url=f"https://pc-{i}") for i in range(3)]
+        image = Image(name="ubuntu", version="1.0", sha256="0" * 64, storage_uri="x")
+        db.add_all(pcs + [image])
+        db.flush()
+        for index in range(25):
+            db.add(
+                SyncJob(
+                    image_id=image.id,
+                    pc_id=pcs[index % 3].id,
+                    status="failed" if index % 5 == 0 else "completed",
+                    updated_at=base + timedelta(minutes=index // 2),
+                )
+            )
+        db.commit()
+        first_pc_id = pcs[0].id
+
+    async with create_client(app) as client:
+        seen = []
+        params = {"limit": 10, "sort": "-updated_at"}
+        while True:
+            response = await client.get("/sync-jobs", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 10
+            seen.extend(page)
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+            assert 'rel="next"' in response.headers["link"]
+            params["cursor"] = cursor
+        assert len(seen) == 25
+        assert len({job["id"] for job in seen}) == 25
+        keys = [(job["updated_at"], job["id"]) for job in seen]
+        assert keys == sorted(keys, reverse=True)
+
+        response = await client.get(
+            "/sync-jobs", params={"status": "failed", "pc_id": first_pc_id}
+        )
+        assert [job["id"] % 5 for job in response.json()] == [1, 1]
+
+        response = await client.get(
+            "/sync-jobs",
+            params={
+                "updated_after": (base + timedelta(minutes=10)).isoformat(),
+                "updated_before": (base + timedelta(minutes=11)).isoformat(),
+            },
+        )
+        assert len(response.json()) == 2
+
+        response = await client.get("/pcs", params={"limit": 2, "sort": "-name"})
+        assert [pc["name"] for pc in response.json()] == ["pc-2", "pc-1"]
+        cursor = response.headers["x-next-cursor"]
+        response = await client.get("/pcs", params={"limit": 2, "cursor": cursor})
+        assert response.status_code == 400
+        response = await client.get(
+            "/pcs", params={"limit": 2, "sort": "-name", "cursor": cursor}
+        )
+        assert [pc["name"] for pc in response.json()] == ["pc-0"]
+        assert "x-next-cursor" not in response.headers
+
+        assert (await client.get("/images", params={"sort": "size"})).status_code == 400
+        assert (await client.get("/images", params={"cursor": "!!"})).status_code == 400
+        assert len((await client.get("/images", params={"name": "ubuntu"})).json()) == 1
+
+        response = await client.get("/ui/tasks", params={"status": "completed"})
+        assert response.status_code == 200
+        assert response.text.count('<span class="badge success">') == 20
+        assert "Next</a>" not in response.text
+
+
+def test_pagination_keeps_rows_with_null_sort_keys(tmp_path):
+    load_app(tmp_path)
+    from datetime import datetime, timedelta
+
+    from app.db import SessionLocal
+    from app.models import Image, PrismCentral, SyncJob
+    from app.pagination import paginate
+
+    base = datetime(2026, 1, 1)
+    columns = {"updated_at": SyncJob.updated_at}
+    dated = [job_id for job_id in range(1, 10) if job_id % 3]
+    undated = [3, 6, 9]
+    with SessionLocal() as db:
+        pc = PrismCentral(name="pc", api_url="https://pc")
+        image = Image(name="ubuntu", version="1.0", sha256="0" * 64, storage_uri="x")
+        db.add_all([pc, image])
+        db.flush()
+        for _ in range(9):
+            db.add(SyncJob(image_id=image.id, pc_id=pc.id, status="completed"))
+        db.flush()
+        # A nullable sort column: the cursor may end on a NULL key.
+        for job in db.query(SyncJob):
+            job.updated_at = None if job.id in undated else base + timedelta(minutes=job.id)
+        db.commit()
+
+        for sort, expected in (
+            ("updated_at", dated + undated),
+            ("-updated_at", undated[::-1] + dated[::-1]),
+        ):
+            seen, cursor = [], None
+            while True:
+                rows, cursor = paginate(
+                    db.query(SyncJob), columns, SyncJob.id, sort, 2, cursor
+                )
+                seen.extend(row.id for row in rows)
+                if not cursor:
+                    break
+            assert seen == expected
+
+
+@pytest.mark.asyncio
+async def test_ui_list_views_use_constant_queries(tmp_path):
+    app = load_app(tmp_path)
+    from sqlalchemy import event
+
+    from app.db import SessionLocal, engine
+    from app.models import Image, PrismCentral, SyncJob
+
+    def seed(count: int) -> None:
+        with SessionLocal() as db:
+            for index in range(count):
+                pc = PrismCentral(name=f"pc-{index}", api_url=f"https://pc-{index}")
+                image = Image(
+                    name=f"image-{index}", version="1", sha256="0" * 64, storage_uri="x"
+                )
+                db.add_all([pc, image])
+                db.flush()
+                db.add(
+                    SyncJob(
+                        image_id=image.id, pc_id=pc.id, status="failed", detail="x" * 5000
+                    )
+                )
+            db.commit()
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async def query_counts(client) -> dict:
+        counts = {}
+        for path in ("/ui/tasks", "/ui/images", "/ui/pcs"):
+            statements.clear()
+            response = await client.get(path)
+            assert response.status_code == 200
+            counts[path] = len(statements)
+        return counts
+
+    async with create_client(app) as client:
+        seed(2)
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            small = await query_counts(client)
+            event.remove(engine, "before_cursor_execute", count)
+            seed(30)
+            event.listen(engine, "before_cursor_execute", count)
+            large = await query_counts(client)
+            response = await client.get("/ui/tasks")
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+    assert small == large
+    assert all(value <= 2 for value in large.values())
+    assert "image-29" in response.text and "pc-29" in response.text
+    assert "x" * 121 not in response.text
+    assert "x" * 120 + "..." in response.text
+
+
+@pytest.mark.asyncio
+async def test_publish_bulk_inserts_jobs_for_selected_pcs(tmp_path, monkeypatch):
+    app = load_app(tmp_path)
+    from sqlalchemy import event
+
+    from app import main
+    from app.db import engine
+
+    dispatched = []
+    monkeypatch.setattr(main.dispatcher, "dispatch", dispatched.append)
+    inserts = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO sync_job"):
+            inserts.append(statement.split("(", 1)[0].split()[-1])
+
+    async with create_client(app) as client:
+        pc_ids = []
+        for index in range(5):
+            pc = {"name": f"pc-{index}", "api_url": f"https://pc-{index}"}
+            pc_ids.append((await client.post("/pcs", json=pc)).json()["id"])
+        image_ids = []
+        for index in range(3):
+            files = {"file": ("image.qcow2", f"image-{index}".encode())}
+            data = {"name": "ubuntu", "version": str(index)}
+            response = await client.post("/images", data=data, files=files)
+            image_ids.append(response.json()["id"])
+        for image_id in image_ids[:2]:
+            await client.post(f"/images/{image_id}/approve")
+
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            response = await client.post(
+                f"/images/{image_ids[0]}/publish", json={"pc_ids": pc_ids[1::2]}
+            )
+            assert response.status_code == 200
+            assert [job["pc_id"] for job in response.json()] == pc_ids[1::2]
+            assert inserts == ["sync_jobs", "sync_job_events"]
+
+            inserts.clear()
+            response = await client.post("/publish", json={"image_ids": image_ids[:2]})
+            assert response.status_code == 200
+            jobs = response.json()
+            assert len(jobs) == 10
+            assert {job["status"] for job in jobs} == {"queued"}
+            assert inserts == ["sync_jobs", "sync_job_events"]
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        first_ids = dispatched[0]
+        assert dispatched[-1] == [
+            job["id"] for job in jobs if job["id"] not in first_ids
+        ]
+
+        # Jobs still in flight are shared, not duplicated.
+        responses = await asyncio.gather(
+            client.post("/publish", json={"image_ids": image_ids[:2]}),
+            client.post(f"/images/{image_ids[0]}/publish"),
+        )
+        assert responses[0].json() == jobs
+        assert len(responses[1].json()) == 5
+
+        response = await client.post(
+            f"/images/{image_ids[0]}/publish", json={"pc_ids": [999]}
+        )
+        assert response.status_code == 404
+        response = await client.post("/publish", json={"image_ids": image_ids})
+        assert response.status_code == 400
+        assert len((await client.get("/sync-jobs")).json()) == 10
+
+
+async def _wait_for_jobs(client, count: int, timeout: float = 10.0) -> list:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        jobs = (await client.get("/sync-jobs")).json()
+        if len(jobs) == count and all(
+            job["status"] in {"completed", "failed"} for job in jobs
+        ):
+            return jobs
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"Sync jobs did not finish in time: {jobs}")
+
+
+@pytest.mark.asyncio
+async def test_publish_fans_out_concurrently(tmp_path, fake_pc):
+    app = load_app(tmp_path)
+    fake_pc.latency = 0.3
+    async with create_client(app) as client:
+        for index in range(6):
+            await client.post(
+                "/pcs",
+                json={
+                    "name": f"pc-{index}",
+                    "api_url": fake_pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                },
+            )
+        files = {"file": ("image.qcow2", b"fake-image-bytes")}
+        data = {"name": "ubuntu", "version": "1.0"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+
+        started = time.monotonic()
+        response = await client.post(f"/images/{image['id']}/publish")
+        returned = time.monotonic() - started
+        assert [job["status"] for job in response.json()] == ["queued"] * 6
+
+        jobs = await _wait_for_jobs(client, 6)
+        finished = time.monotonic() - started
+
+    assert [job["status"] for job in jobs] == ["completed"] * 6
+    assert fake_pc.requests["images"] == 6
+    assert returned < 0.3
+    # One import is a create call plus a task poll, roughly 0.6 s end to end.
+    assert finished < 6 * 0.6 / 2
+
+
+@pytest.mark.asyncio
+async def test_inline_jobs_release_workers_while_tasks_run(
+    tmp_path, fake_pc, monkeypatch
+):
+    monkeypatch.setenv("PUBLISH_PARALLELISM", "1")
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    monkeypatch.setenv("PC_TASK_POLL_MAX_INTERVAL", "0.2")
+    app = load_app(tmp_path)
+    fake_pc.task_polls = 10**6
+    async with create_client(app) as client:
+        for index in range(4):
+            await client.post(
+                "/pcs",
+                json={
+                    "name": f"pc-{index}",
+                    "api_url": fake_pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                },
+            )
+        files = {"file": ("image.qcow2", b"fake-image-bytes")}
+        data = {"name": "ubuntu", "version": "1.0"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+        await client.post(f"/images/{image['id']}/publish")
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            jobs = (await client.get("/sync-jobs")).json()
+            if all(job["task_uuid"] for job in jobs):
+                break
+            await asyncio.sleep(0.05)
+        # A single worker slot submitted every import while all tasks are
+        # still running on the PC side.
+        assert all(job["task_uuid"] for job in jobs)
+        assert {job["status"] for job in jobs} == {"running"}
+
+        fake_pc.task_polls = 0
+        for task in fake_pc.tasks.values():
+            task["polls_left"] = 0
+        jobs = await _wait_for_jobs(client, 4)
+    assert [job["status"] for job in jobs] == ["completed"] * 4
+    assert fake_pc.requests["tasks"] == 0
+
+
+@pytest.mark.asyncio
+async def test_job_events_stream_transitions_and_progress(
+    tmp_path, fake_pc, monkeypatch
+):
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    monkeypatch.setenv("PC_TASK_POLL_MAX_INTERVAL", "0.2")
+    app = load_app(tmp_path)
+    from app.events import fetch_job_events, stream_job_events
+
+    fake_pc.task_polls = 2
+    async with create_client(app) as client:
+        for index in range(2):
+            await client.post(
+                "/pcs",
+                json={
+                    "name": f"pc-{index}",
+                    "api_url": fake_pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                },
+            )
+        files = {"file": ("image.qcow2", b"fake-image-bytes")}
+        data = {"name": "ubuntu", "version": "1.0"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+        await client.post(f"/images/{image['id']}/publish")
+
+        events, finished = [], set()
+
+        async def disconnected() -> bool:
+            return len(finished) == 2
+
+        async def consume() -> None:
+            # A long poll interval proves in-process commits wake the stream.
+            async for chunk in stream_job_events(0, disconnected, poll_interval=30):
+                if not chunk.startswith("id: "):
+                    continue
+                event = json.loads(chunk.split("data: ", 1)[1])
+                events.append(event)
+                if event["status"] in {"completed", "failed"}:
+                    finished.add(event["job_id"])
+
+        await asyncio.wait_for(consume(), 10)
+
+    for job_id in finished:
+        statuses = [event["status"] for event in events if event["job_id"] == job_id]
+        assert statuses[:2] == ["queued", "running"]
+        assert statuses[-1] == "completed"
+    assert any(event["progress"] == 50 for event in events)
+    assert all(event["image_name"] == "ubuntu" for event in events)
+
+    resumed = fetch_job_events(events[2]["id"])
+    assert [event["id"] for event in resumed] == [event["id"] for event in events[3:]]
+
+
+def test_maintenance_prunes_events_of_long_finished_jobs(tmp_path, monkeypatch):
+    from datetime import datetime, timedelta
+
+    load_app(tmp_path)
+    from app.config import settings
+    from app.db import SessionLocal
+    from app.events import record_job_events
+    from app.maintenance import maintenance
+    from app.models import Image, PrismCentral, SyncJob, SyncJobEvent
+
+    old = datetime.utcnow() - timedelta(days=45)
+    with SessionLocal() as db:
+        db.add(Image(name="ubuntu", version="1", sha256="0" * 64, storage_uri="x"))
+        db.add(PrismCentral(name="pc", api_url="https://pc"))
+        db.flush()
+        jobs = [
+            SyncJob(image_id=1, pc_id=1, status=status, updated_at=updated_at)
+            for status, updated_at in [
+                ("completed", old),
+                ("failed", old),
+                ("completed", datetime.utcnow()),
+                ("waiting", old),
+            ]
+        ]
+        db.add_all(jobs)
+        db.flush()
+        job_ids = [job.id for job in jobs]
+        record_job_events(db, job_ids, "queued")
+        record_job_events(db, job_ids, "running")
+        db.commit()
+
+    monkeypatch.setattr(settings, "job_events_retention_days", 0)
+    assert maintenance.run_once()["old_job_events"] == 0
+
+    monkeypatch.setattr(settings, "job_events_retention_days", 30)
+    assert maintenance.run_once()["old_job_events"] == 4
+    with SessionLocal() as db:
+        kept = sorted(job_id for (job_id,) in db.query(SyncJobEvent.job_id))
+    assert kept == sorted(job_ids[2:] * 2)
+
+
+@pytest.mark.asyncio
+async def test_publish_skips_pcs_that_already_hold_the_image(
+    tmp_path, fake_pc, monkeypatch
+):
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    app = load_app(tmp_path)
+    async with create_client(app) as client:
+        pc_ids = []
+        for index in range(2):
+            pc = {
+                "name": f"pc-{index}",
+                "api_url": fake_pc.url,
+                "username": "admin",
+                "password": "secret",
+            }
+            pc_ids.append((await client.post("/pcs", json=pc)).json()["id"])
+        files = {"file": ("image.qcow2", b"fake-image-bytes")}
+        data = {"name": "ubuntu", "version": "1.0"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+
+        url = f"/images/{image['id']}/publish"
+        await client.post(url, json={"pc_ids": pc_ids[:1]})
+        await _wait_for_jobs(client, 1)
+        assert fake_pc.requests["images"] == 1
+        spec = next(iter(fake_pc.images.values()))
+        assert spec["resources"]["checksum"] == {
+            "checksum_algorithm": "SHA_256",
+            "checksum_value": image["sha256"],
+        }
+
+        # pc-0 is skipped from its placement record; pc-1 shares the fake PC's
+        # inventory, so its job finds the image by checksum instead of importing.
+        jobs = (await client.post(url)).json()
+        assert [job["pc_id"] for job in jobs] == pc_ids[1:]
+        jobs = await _wait_for_jobs(client, 2)
+        assert [job["status"] for job in jobs] == ["completed"] * 2
+        assert "already present" in jobs[1]["detail"]
+        assert fake_pc.requests["images"] == 1
+
+        assert (await client.post(url)).json() == []
+        forced = (await client.post(url, json={"force": True})).json()
+        assert len(forced) == 2
+        await _wait_for_jobs(client, 4)
+        assert fake_pc.requests["images"] == 1
+
+
+@pytest.mark.asyncio
+async def test_orphaned_sync_jobs_are_queued_again(tmp_path, fake_pc, monkeypatch):
+    from datetime import datetime, timedelta
+
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    app = load_app(tmp_path)
+    from app import main
+    from app.db import SessionLocal
+    from app.dispatch import recover_stale_jobs
+    from app.models import ImagePlacement, SyncJob
+
+    async with create_client(app) as client:
+        pc_ids = []
+        for index in range(2):
+            pc = {
+                "name": f"pc-{index}",
+                "api_url": fake_pc.url,
+                "username": "admin",
+                "password": "secret",
+            }
+            pc_ids.append((await client.post("/pcs", json=pc)).json()["id"])
+        files = {"file": ("image.qcow2", b"fake-image-bytes")}
+        data = {"name": "ubuntu", "version": "1.0"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+
+        # The process dies between committing the jobs and dispatching them.
+        main.dispatcher.dispatch = lambda job_ids: []
+        url = f"/images/{image['id']}/publish"
+        jobs = (await client.post(url)).json()
+        # One was never dispatched, the other's worker died mid-import.
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        with SessionLocal() as db:
+            for job, status in zip(jobs, ("queued", "running")):
+                db.query(SyncJob).filter(SyncJob.id == job["id"]).update(
+                    {"status": status, "updated_at": long_ago}
+                )
+            db.commit()
+
+        # Republishing, even with force, queues the job holding the placement
+        # again; startup and maintenance recover the rest.
+        forced = await client.post(url, json={"force": True, "pc_ids": pc_ids[:1]})
+        assert [job["id"] for job in forced.json()] == [jobs[0]["id"]]
+        assert forced.json()[0]["status"] == "waiting"
+        assert recover_stale_jobs() == 1
+
+        del main.dispatcher.dispatch
+        main.dispatcher.dispatch([])
+        jobs = await _wait_for_jobs(client, 2)
+        assert [job["status"] for job in jobs] == ["completed"] * 2
+        with SessionLocal() as db:
+            statuses = [status for (status,) in db.query(ImagePlacement.status)]
+        assert statuses == ["present"] * 2
+
+
+@pytest.mark.asyncio
+async def test_long_imports_are_not_taken_for_stale_jobs(
+    tmp_path, fake_pc, monkeypatch
+):
+    from datetime import datetime, timedelta
+
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    app = load_app(tmp_path)
+    from app.db import SessionLocal
+    from app.dispatch import recover_stale_jobs
+    from app.events import record_job_progress
+    from app.models import SyncJob
+
+    fake_pc.task_polls = 10**6
+    async with create_client(app) as client:
+        pc = {
+            "name": "pc-a",
+            "api_url": fake_pc.url,
+            "username": "admin",
+            "password": "secret",
+        }
+        await client.post("/pcs", json=pc)
+        files = {"file": ("image.qcow2", b"fake-image-bytes")}
+        data = {"name": "ubuntu", "version": "1.0"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+        await client.post(f"/images/{image['id']}/publish")
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and not fake_pc.requests["tasks/list"]:
+            await asyncio.sleep(0.05)
+
+        # The PC has been pulling for longer than PC_TASK_TIMEOUT.
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        with SessionLocal() as db:
+            job = db.query(SyncJob).one()
+            job.updated_at = long_ago
+            db.commit()
+            job_id, task_uuid = job.id, job.task_uuid
+        assert await asyncio.to_thread(recover_stale_jobs) == 0
+        await asyncio.to_thread(record_job_progress, job_id, 60)
+        with SessionLocal() as db:
+            job = db.query(SyncJob).one()
+            assert (job.status, job.task_uuid) == ("running", task_uuid)
+            assert job.updated_at > long_ago
+
+        for task in fake_pc.tasks.values():
+            task["polls_left"] = 0
+        jobs = await _wait_for_jobs(client, 1)
+        assert jobs[0]["status"] == "completed"
+        assert fake_pc.requests["images"] == 1
+
+
+@pytest.mark.asyncio
+async def test_running_imports_are_watched_again_after_a_restart(
+    tmp_path, fake_pc, monkeypatch
+):
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    monkeypatch.setenv("PC_TASK_WATCH_LEASE", "0.3")
+    app = load_app(tmp_path)
+    from app.db import SessionLocal
+    from app.models import SyncJob, SyncJobEvent
+    from app.prism import prism_runtime
+    from app.tasks import resume_task_watches
+
+    fake_pc.task_polls = 10**6
+    async with create_client(app) as client:
+        pc = {
+            "name": "pc-a",
+            "api_url": fake_pc.url,
+            "username": "admin",
+            "password": "secret",
+        }
+        await client.post("/pcs", json=pc)
+        files = {"file": ("image.qcow2", b"fake-image-bytes")}
+        data = {"name": "ubuntu", "version": "1.0"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+        await client.post(f"/images/{image['id']}/publish")
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and not fake_pc.requests["tasks/list"]:
+            await asyncio.sleep(0.05)
+        # A live watch keeps its job through heartbeats; nobody else takes it.
+        await asyncio.sleep(0.6)
+        assert await asyncio.to_thread(resume_task_watches) == 0
+
+        # The process watching the import goes away; the PC keeps importing.
+        await asyncio.to_thread(prism_runtime.close, fake_pc.url)
+        with SessionLocal() as db:
+            job = db.query(SyncJob).one()
+            assert job.status == "running"
+            assert job.task_uuid in fake_pc.tasks
+        await asyncio.sleep(0.6)
+
+        # One process (an API worker or a Celery child) claims the job.
+        assert await asyncio.to_thread(resume_task_watches) == 1
+        assert await asyncio.to_thread(resume_task_watches) == 0
+        for task in fake_pc.tasks.values():
+            task["polls_left"] = 0
+        jobs = await _wait_for_jobs(client, 1)
+        assert jobs[0]["status"] == "completed"
+        with SessionLocal() as db:
+            finished = db.query(SyncJobEvent).filter(SyncJobEvent.status == "completed")
+            assert finished.count() == 1
+
+
+@pytest.mark.asyncio
+async def test_pc_health_is_probed_in_background_and_cached(
+    tmp_path, fake_pc, monkeypatch
+):
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    app = load_app(tmp_path)
+    from app import main
+
+    monkeypatch.setattr(main.settings, "pc_validate_connection", True)
+    monkeypatch.setattr(main.settings, "pc_validate_hub_source", True)
+    monitor = main.health_monitor
+    monitor.concurrency = 2
+    fake_pc.latency = 0.2
+
+    async def wait_for_probes(count: int) -> list:
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            pcs = (await client.get("/pcs")).json()
+            if monitor.probes >= count and all(
+                pc["health_status"] != "pending" for pc in pcs
+            ):
+                return pcs
+            await asyncio.sleep(0.05)
+        raise AssertionError("Health probes did not finish in time.")
+
+    async with create_client(app) as client:
+        for index in range(4):
+            started = time.monotonic()
+            response = await client.post(
+                "/pcs",
+                json={
+                    "name": f"pc-{index}",
+                    "api_url": fake_pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                },
+            )
+            assert time.monotonic() - started < fake_pc.latency
+            assert response.json()["health_status"] == "pending"
+
+        pcs = await wait_for_probes(4)
+        assert {pc["health_status"] for pc in pcs} == {"healthy"}
+        assert all(pc["connected"] for pc in pcs)
+        assert fake_pc.requests["images"] == 4
+        assert fake_pc.max_in_flight <= 2
+
+        # Fresh results are reused, and the hub probe waits out its own TTL.
+        assert monitor._due_probes(set(), periodic=True) == []
+        for pc in pcs:
+            monitor.check_now(pc["id"])
+        await wait_for_probes(8)
+        assert fake_pc.requests["images"] == 4
+        assert fake_pc.requests["clusters/list"] == 8
+
+
+@pytest.mark.asyncio
+async def test_publish_paces_imports_and_reports_download_stats(
+    tmp_path, fake_pc, monkeypatch
+):
+    monkeypatch.setenv("PUBLISH_MAX_ACTIVE_IMPORTS", "2")
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    monkeypatch.setenv("PC_TASK_POLL_MAX_INTERVAL", "0.2")
+    app = load_app(tmp_path)
+    fake_pc.task_polls = 10**6
+    async with create_client(app) as client:
+        for index in range(5):
+            await client.post(
+                "/pcs",
+                json={
+                    "name": f"pc-{index}",
+                    "api_url": fake_pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                },
+            )
+        files = {"file": ("image.qcow2", b"fake-image-bytes")}
+        data = {"name": "ubuntu", "version": "1.0"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.post(f"/images/{image['id']}/approve")
+        await client.post(f"/images/{image['id']}/publish")
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = (await client.get("/downloads/stats")).json()
+            if fake_pc.requests["images"] == 2 and stats["imports"]["waiting"] == 3:
+                break
+            await asyncio.sleep(0.05)
+        assert stats["imports"] == {"active": 2, "waiting": 3, "limit": 2}
+        assert fake_pc.requests["images"] == 2
+
+        download = await client.get(f"/images/{image['id']}/download")
+        assert download.content == b"fake-image-bytes"
+        stats = (await client.get("/downloads/stats")).json()
+        assert stats["bytes"] == len(b"fake-image-bytes")
+        assert stats["completed"] == 1
+
+        # Each finished import hands its slot to the next waiting job.
+        fake_pc.task_polls = 0
+        for task in fake_pc.tasks.values():
+            task["polls_left"] = 0
+        jobs = await _wait_for_jobs(client, 5)
+    assert [job["status"] for job in jobs] == ["completed"] * 5
+    # The fake PCs share one inventory, so the paced jobs find the image there.
+    assert sum("already present" in job["detail"] for job in jobs) == 3
+
+
+@pytest.mark.asyncio
+async def test_edge_replica_serves_pcs_from_its_cache(tmp_path, fake_pc, monkeypatch):
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    app = load_app(tmp_path)
+    from app import main
+
+    blob = os.urandom(1024 * 1024)
+    with serve_in_thread(app) as hub_url, serve_edge(tmp_path, hub_url) as edge_url:
+        monkeypatch.setattr(main.settings, "hub_base_url", hub_url)
+        async with httpx.AsyncClient(base_url=hub_url) as hub, httpx.AsyncClient(
+            base_url=edge_url
+        ) as edge:
+            await hub.post(
+                "/pcs",
+                json={
+                    "name": "remote-site",
+                    "api_url": fake_pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                    "source_url": edge_url,
+                },
+            )
+            files = {"file": ("disk.raw", blob)}
+            data = {"name": "disk", "version": "1"}
+            image = (await hub.post("/images", data=data, files=files)).json()
+
+            # Approval pre-warms the replica before any PC asks for the image.
+            await hub.post(f"/images/{image['id']}/approve")
+            deadline = time.monotonic() + 10
+            while (await edge.get("/cache/stats")).json()["entries"] != 1:
+                assert time.monotonic() < deadline, "Replica was not warmed."
+                await asyncio.sleep(0.05)
+
+            await hub.post(f"/images/{image['id']}/publish")
+            await _wait_for_jobs(hub, 1)
+            spec = next(iter(fake_pc.images.values()))
+            source_uri = spec["resources"]["source_uri"]
+            assert source_uri == f"{edge_url}/images/{image['id']}/download"
+
+            # Three PCs at the remote site pull from the replica.
+            for _ in range(3):
+                response = await edge.get(source_uri)
+                assert response.content == blob
+                assert response.headers["etag"] == f'"{image["sha256"]}"'
+            response = await edge.get(source_uri, headers={"Range": "bytes=10-19"})
+            assert response.content == blob[10:20]
+
+            edge_stats = (await edge.get("/downloads/stats")).json()
+            hub_stats = (await hub.get("/downloads/stats")).json()
+
+    assert edge_stats["bytes"] == 3 * len(blob) + 10
+    # The WAN link carried the image once, for the warm-up fill.
+    assert hub_stats["bytes"] == len(blob)
+
+
+@pytest.mark.asyncio
+async def test_edge_replica_reports_upstream_misses_as_not_found(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setenv("HUB_ROLE", "edge")
+    monkeypatch.setenv("EDGE_UPSTREAM_URL", "http://hub")
+    monkeypatch.setenv("BLOB_CACHE_PATH", str(tmp_path / "cache"))
+    app = load_app(tmp_path)
+    from app.storage import storage_client
+
+    blob = b"edge-blob-bytes"
+    sha256 = hashlib.sha256(blob).hexdigest()
+    images = {1: sha256}
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        kind, key = request.url.path.split("/")[1:3]
+        digest = images.get(int(key)) if kind == "images" else key
+        if digest != sha256:
+            return httpx.Response(404)
+        headers = {"etag": f'"{sha256}"', "content-length": str(len(blob))}
+        content = b"" if request.method == "HEAD" else blob
+        return httpx.Response(200, headers=headers, content=content)
+
+    monkeypatch.setattr(
+        storage_client, "_http", httpx.Client(transport=httpx.MockTransport(upstream))
+    )
+    missing = "f" * 64
+    async with create_client(app) as client:
+        assert (await client.get(f"/blobs/{missing}")).status_code == 404
+        assert (await client.head(f"/blobs/{missing}")).status_code == 404
+        assert (await client.post(f"/blobs/{missing}/warm")).status_code == 404
+
+        response = await client.get("/images/1/download")
+        assert response.content == blob
+
+        # Deleted upstream: the id stops resolving on the next request.
+        del images[1]
+        assert (await client.get("/images/1/download")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_metrics_cover_uploads_downloads_and_sync_jobs(
+    tmp_path, fake_pc, monkeypatch
+):
+    from prometheus_client.parser import text_string_to_metric_families
+
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    app = load_app(tmp_path)
+    fake_pc.task_polls = 1
+    blob = b"metrics-image-bytes" * 100
+    async with create_client(app) as client:
+        await client.post(
+            "/pcs",
+            json={
+                "name": "pc-0",
+                "api_url": fake_pc.url,
+                "username": "admin",
+                "password": "secret",
+            },
+        )
+        files = {"file": ("disk.raw", blob)}
+        data = {"name": "disk", "version": "1"}
+        image = (await client.post("/images", data=data, files=files)).json()
+        await client.get(f"/images/{image['id']}/download")
+        await client.post(f"/images/{image['id']}/approve")
+        await client.post(f"/images/{image['id']}/publish")
+        await _wait_for_jobs(client, 1)
+
+        response = await client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+
+    samples = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            key = (sample.name, tuple(sorted(sample.labels.items())))
+            samples[key] = sample.value
+
+    def value(name: str, **labels) -> float:
+        return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+    assert value("image_hub_upload_bytes_total") == len(blob)
+    assert value("image_hub_sha256_seconds_count") == 1
+    assert value(
+        "image_hub_storage_write_seconds_count", backend="local", operation="stage"
+    ) == 1
+    assert value("image_hub_download_bytes_total", image=image["sha256"]) == len(blob)
+    assert value("image_hub_download_client_bytes_total", client="127.0.0.1") == len(
+        blob
+    )
+    assert value(
+        "image_hub_prism_request_seconds_count",
+        method="POST",
+        endpoint="/api/nutanix/v3/images",
+        status="202",
+    ) == 1
+    assert value("image_hub_task_polls_total") >= 1
+    for phase in ("claim", "inventory", "submit", "import", "finish"):
+        assert value("image_hub_sync_job_phase_seconds_count", phase=phase) == 1
+    assert value(
+        "image_hub_http_request_seconds_count",
+        method="POST",
+        route="/images/{image_id}/publish",
+        status="200",
+    ) == 1
+    # Listing PCs for the publish, the bulk inserts and the commit all count.
+    assert value(
+        "image_hub_db_queries_per_request_sum", route="/images/{image_id}/publish"
+    ) > 1
+
+
+@pytest.mark.asyncio
+async def test_s3_imports_use_presigned_urls_and_fall_back_to_the_hub(
+    tmp_path, fake_pc, monkeypatch
+):
+    moto = pytest.importorskip("moto")
+    from tests.fake_pc import FakePrismCentral
+
+    env = {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "S3_BUCKET": "images",
+        "S3_REGION": "us-east-1",
+        "S3_PRESIGN_IMPORTS": "true",
+        "S3_PRESIGN_MIN_EXPIRY": "600",
+        "S3_PRESIGN_MIN_BANDWIDTH": "1000",
+        "PC_TASK_POLL_MIN_INTERVAL": "0.05",
+    }
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("S3_ENDPOINT_URL", raising=False)
+
+    with moto.mock_aws(), FakePrismCentral() as walled_pc:
+        app = load_app(tmp_path, storage_backend="s3")
+        from app import main
+
+        main.storage_client.s3.create_bucket(Bucket="images")
+        hub_source = main.settings.hub_base_url
+        # This PC cannot reach the object store, only the hub.
+        walled_pc.unreachable_sources = ("https://images.s3",)
+        async with create_client(app) as client:
+            pcs = {}
+            for name, server in (("direct", fake_pc), ("walled", walled_pc)):
+                pc = {
+                    "name": name,
+                    "api_url": server.url,
+                    "username": "admin",
+                    "password": "secret",
+                }
+                pcs[name] = (await client.post("/pcs", json=pc)).json()["id"]
+            files = {"file": ("disk.raw", b"x" * 5000)}
+            data = {"name": "disk", "version": "1"}
+            image = (await client.post("/images", data=data, files=files)).json()
+            await client.post(f"/images/{image['id']}/approve")
+            await client.post(f"/images/{image['id']}/publish")
+
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                jobs = (await client.get("/sync-jobs")).json()
+                if all(job["status"] == "completed" for job in jobs):
+                    break
+                await asyncio.sleep(0.05)
+            assert [job["status"] for job in jobs] == ["completed"] * 2
+            listed = {pc["name"]: pc for pc in (await client.get("/pcs")).json()}
+
+            # An import that fails for another reason is not retried and keeps
+            # the PC on direct pulls; the walled PC is offered the store again
+            # once its retry TTL has passed.
+            fake_pc.task_state = "FAILED"
+            walled_pc.unreachable_sources = ()
+            monkeypatch.setattr(main.settings, "s3_direct_retry_ttl", 0)
+            files = {"file": ("disk2.raw", b"y" * 5000)}
+            data = {"name": "disk", "version": "2"}
+            second = (await client.post("/images", data=data, files=files)).json()
+            await client.post(f"/images/{second['id']}/approve")
+            await client.post(f"/images/{second['id']}/publish")
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                retried = (
+                    await client.get("/sync-jobs", params={"image_id": second["id"]})
+                ).json()
+                if all(job["status"] in {"completed", "failed"} for job in retried):
+                    break
+                await asyncio.sleep(0.05)
+            assert [job["status"] for job in retried] == ["completed"] * 2
+            # No hub retry: the direct PC's task simply failed.
+            task = json.loads(retried[0]["detail"])["task"]
+            assert task["status"]["state"] == "FAILED"
+            relisted = {pc["name"]: pc for pc in (await client.get("/pcs")).json()}
+
+    assert relisted["direct"]["direct_source"] is True
+    assert relisted["walled"]["direct_source"] is True
+    assert len(fake_pc.images) == 2
+    assert walled_pc.images.popitem()[1]["resources"]["source_uri"].startswith(
+        "https://images.s3"
+    )
+
+    [direct, _] = fake_pc.images.values()
+    source = direct["resources"]["source_uri"]
+    assert source.startswith("https://images.s3")
+    # Sized to the image: the 600 s floor plus 5000 bytes at 1000 B/s.
+    expires = int(parse_qs(urlsplit(source).query)["Expires"][0])
+    assert 0 < expires - time.time() <= 605
+    assert listed["direct"]["direct_source"] is True
+
+    attempts = [spec["resources"]["source_uri"] for spec in walled_pc.images.values()]
+    assert attempts[0].startswith("https://images.s3")
+    assert attempts[1] == f"{hub_source}/images/{image['id']}/download"
+    assert listed["walled"]["direct_source"] is False
+    assert listed["walled"]["direct_checked_at"] is not None
+
+
+@pytest.mark.asyncio
+async def test_fleet_pcs_pull_images_and_resume_dropped_downloads(tmp_path, monkeypatch):
+    from tests.fake_pc import FakeFleet
+
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    monkeypatch.setenv("PC_TASK_POLL_MAX_INTERVAL", "0.2")
+    app = load_app(tmp_path)
+    from app import main
+
+    blob = os.urandom(1024 * 1024)
+    fleet = FakeFleet(3, pull=True, pull_interrupt=0.1)
+    with fleet, serve_in_thread(app) as hub_url:
+        monkeypatch.setattr(main.settings, "hub_base_url", hub_url)
+        async with httpx.AsyncClient(base_url=hub_url) as hub:
+            for index, pc in enumerate(fleet.pcs):
+                pc_payload = {
+                    "name": f"pc-{index}",
+                    "api_url": pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                }
+                await hub.post("/pcs", json=pc_payload)
+            files = {"file": ("disk.raw", blob)}
+            data = {"name": "disk", "version": "1"}
+            image = (await hub.post("/images", data=data, files=files)).json()
+            await hub.post(f"/images/{image['id']}/approve")
+            await hub.post(f"/images/{image['id']}/publish")
+            jobs = await _wait_for_jobs(hub, 3)
+            stats = (await hub.get("/downloads/stats")).json()
+
+    assert [job["status"] for job in jobs] == ["completed"] * 3
+    # Every PC got the whole image, resuming with Range requests after drops.
+    assert sum(pc.resumes for pc in fleet.pcs) > 0
+    assert all(pc.pulled_bytes >= len(blob) for pc in fleet.pcs)
+    # Bytes in flight when a connection drops were sent but never landed.
+    assert stats["bytes"] >= sum(pc.pulled_bytes for pc in fleet.pcs)
+    assert stats["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_keeps_a_slow_pc_from_holding_every_slot(tmp_path, monkeypatch):
+    from tests.fake_pc import FakeFleet
+
+    monkeypatch.setenv("PUBLISH_MAX_ACTIVE_IMPORTS", "3")
+    monkeypatch.setenv("SYNC_PC_MAX_IN_FLIGHT", "2")
+    monkeypatch.setenv("PC_TASK_POLL_MIN_INTERVAL", "0.05")
+    monkeypatch.setenv("PC_TASK_POLL_MAX_INTERVAL", "0.2")
+    app = load_app(tmp_path)
+    fleet = FakeFleet(2)
+    slow, fast = fleet.pcs
+    slow.task_polls = 10**6
+
+    def created(pc):
+        return [spec["name"] for spec in pc.images.values()]
+
+    with fleet:
+        async with create_client(app) as client:
+            pc_ids = []
+            for index, pc in enumerate(fleet.pcs):
+                payload = {
+                    "name": f"pc-{index}",
+                    "api_url": pc.url,
+                    "username": "admin",
+                    "password": "secret",
+                }
+                if pc is slow:
+                    payload["max_in_flight"] = 1
+                pc_ids.append((await client.post("/pcs", json=payload)).json()["id"])
+            image_ids = []
+            for name in ("base-1", "base-2", "base-3", "security-fix"):
+                files = {"file": ("image.qcow2", name.encode())}
+                data = {"name": name, "version": "1"}
+                image = (await client.post("/images", data=data, files=files)).json()
+                await client.post(f"/images/{image['id']}/approve")
+                image_ids.append(image["id"])
+
+            # The slow PC's backlog goes in first but only takes its one slot,
+            # so the fast PC's jobs run past it.
+            await client.post("/publish", json={"image_ids": image_ids[:3]})
+            await client.post(
+                f"/images/{image_ids[3]}/publish",
+                json={"pc_ids": [pc_ids[0]], "priority": 10},
+            )
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                jobs = (await client.get("/sync-jobs", params={"pc_id": pc_ids[1]})).json()
+                if [job["status"] for job in jobs] == ["completed"] * 3:
+                    break
+                await asyncio.sleep(0.05)
+            assert [job["status"] for job in jobs] == ["completed"] * 3
+            assert created(slow) == ["base-1"]
+
+            queues = (await client.get("/sync-jobs/queues")).json()
+            assert queues[0] == {
+                "pc_id": pc_ids[0],
+                "name": "pc-0",
+                "queued": 0,
+                "waiting": 3,
+                "running": 1,
+                "max_in_flight": 1,
+                "top_priority": 10,
+            }
+            assert queues[1]["running"] == queues[1]["waiting"] == 0
+            assert queues[1]["max_in_flight"] == 2
+
+            # The urgent image jumps the slow PC's queue once its slot frees.
+            slow.task_polls = 0
+            for task in slow.tasks.values():
+                task["polls_left"] = 0
+            jobs = await _wait_for_jobs(client, 7)
+    assert [job["status"] for job in jobs] == ["completed"] * 7
+    assert created(slow) == ["base-1", "security-fix", "base-2", "base-3"]
+    assert fast.max_in_flight <= 2
+
+
+def test_scheduler_requeues_stale_jobs_instead_of_counting_them(tmp_path):
+    from datetime import datetime, timedelta
+
+    load_app(tmp_path)
+    from app.db import SessionLocal
+    from app.models import Image, PrismCentral, SyncJob
+    from app.scheduler import next_jobs, queue_depths
+
+    long_ago = datetime.utcnow() - timedelta(hours=2)
+    with SessionLocal() as db:
+        db.add(Image(name="ubuntu", version="1", sha256="0" * 64, storage_uri="x"))
+        db.add(PrismCentral(name="pc", api_url="https://pc", max_in_flight=1))
+        db.flush()
+        # A worker died mid-import, a dispatch was lost, and a new job arrives.
+        jobs = [
+            SyncJob(image_id=1, pc_id=1, status="running", updated_at=long_ago),
+            SyncJob(image_id=1, pc_id=1, status="queued", updated_at=long_ago),
+            SyncJob(image_id=1, pc_id=1, status="queued"),
+        ]
+        db.add_all(jobs)
+        db.commit()
+        job_ids = [job.id for job in jobs]
+
+        assert next_jobs(db, job_ids[2:]) == job_ids[:1]
+        statuses = [status for (status,) in db.query(SyncJob.status).order_by(SyncJob.id)]
+        assert statuses == ["waiting"] * 3
+        [queue] = queue_depths(db)
+    assert (queue["running"], queue["waiting"]) == (0, 3)
+
+
+def test_migrations_upgrade_a_legacy_database_once(tmp_path):
+    import sqlite3
+
+    legacy = sqlite3.connect(tmp_path / "test.db")
+    legacy.executescript(
+        """
+        CREATE TABLE prism_centrals (
+            id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL,
+            api_url VARCHAR(512) NOT NULL, username VARCHAR(255),
+            password VARCHAR(255), created_at DATETIME
+        );
+        INSERT INTO prism_centrals (name, api_url) VALUES ('old-pc', 'https://old-pc');
+        """
+    )
+    legacy.close()
+
+    load_app(tmp_path)
+    from sqlalchemy import inspect, text
+
+    from app.db import engine
+    from app.migrations import MIGRATIONS, migrate
+
+    columns = {column["name"] for column in inspect(engine).get_columns("prism_centrals")}
+    assert {
+        "connected", "source_url", "direct_source", "direct_checked_at", "max_in_flight"
+    } <= columns
+    with engine.connect() as connection:
+        versions = connection.execute(text("SELECT version FROM schema_migrations")).scalars()
+        assert sorted(versions) == [version for version, _, _ in MIGRATIONS]
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 30000
+        name = connection.execute(text("SELECT name FROM prism_centrals")).scalar()
+    assert name == "old-pc"
+    # A second run (another worker starting up) has nothing to do.
+    assert migrate() == []
+
+
+def test_importing_the_app_has_no_side_effects(tmp_path):
+    # A fresh interpreter, as a uvicorn or Celery worker starts: importing
+    # app.main must not touch the database or the store, or load boto3/Celery.
+    script = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "import app.main\n"
+        "elapsed = time.perf_counter() - started\n"
+        "heavy = [m for m in ('boto3', 'botocore', 'celery') if m in sys.modules]\n"
+        "print(json.dumps({'seconds': elapsed, 'heavy': heavy}))\n"
+    )
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path}/hub.db",
+        STORAGE_BACKEND="s3",
+        S3_BUCKET="images",
+        LOCAL_STORAGE_PATH=str(tmp_path / "storage"),
+        BLOB_CACHE_PATH=str(tmp_path / "cache"),
+        CELERY_BROKER_URL="redis://localhost:1/0",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).resolve().parents[1],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(result.stdout.splitlines()[-1])
+
+    assert report["heavy"] == []
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,32 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_benchmark_suite_writes_comparable_json(tmp_path):
+    output = tmp_path / "results.json"
+    command = [
+        sys.executable, "bench/suite.py", "--output", str(output),
+        "--size-mb", "1", "--rounds", "1", "--backends", "local",
+        "--rows", "300", "--pcs", "3", "--pc-latency", "0", "--task-polls", "0",
+    ]
+    subprocess.run(command, cwd=ROOT, check=True, capture_output=True, timeout=120)
+
+    report = json.loads(output.read_text())
+    assert set(report["results"]) == {"startup", "storage", "download", "list", "publish"}
+    [publish] = report["results"]["publish"]
+    assert publish["name"] == "publish.3_pcs"
+    assert publish["failed"] == 0
+    assert publish["pc_requests"]["images"] == 3
+
+    # A run compared against itself has no regressions.
+    compared = subprocess.run(
+        command[:2] + ["--only", "storage", "--size-mb", "1", "--rounds", "1",
+                       "--backends", "local", "--compare", str(output),
+                       "--tolerance", "100"],
+        cwd=ROOT, capture_output=True, timeout=120,
+    )
+    assert compared.returncode == 0, compared.stderr
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.cache import STALE_PARTIAL_AGE, BlobCache
+
+
+def _source(data: bytes, calls: list, gate: threading.Event = None):
+    def fetch():
+        calls.append(1)
+        for offset in range(0, len(data), 1000):
+            if gate is not None:
+                gate.wait()
+            yield data[offset : offset + 1000]
+
+    return fetch
+
+
+def test_concurrent_misses_coalesce_into_one_fetch(tmp_path):
+    cache = BlobCache(str(tmp_path / "cache"), 10_000_000, 4096)
+    data = bytes(range(256)) * 100
+    calls = []
+    gate = threading.Event()
+    fetch = _source(data, calls, gate)
+
+    # Every request arrives while the fill is still held at the gate.
+    streams = [cache.iter_range("abc", fetch) for _ in range(4)]
+    streams.append(cache.iter_range("abc", fetch, 20_000, 20_099))
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        readers = [pool.submit(b"".join, stream) for stream in streams[:4]]
+        ranged = pool.submit(b"".join, streams[4])
+        gate.set()
+        results = [reader.result() for reader in readers]
+
+    assert results == [data] * 4
+    assert ranged.result() == data[20_000:20_100]
+    assert calls == [1]
+    assert b"".join(cache.iter_range("abc", fetch, 10, 19)) == data[10:20]
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["hits"] == 1
+    assert stats["bytes"] == len(data)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = BlobCache(str(tmp_path / "cache"), 2500, 4096)
+    blobs = {key: bytes([index]) * 1000 for index, key in enumerate("abc")}
+    calls = []
+    for key in ("a", "b"):
+        assert b"".join(cache.iter_range(key, _source(blobs[key], calls))) == blobs[key]
+    b"".join(cache.iter_range("a", _source(blobs["a"], calls)))
+    b"".join(cache.iter_range("c", _source(blobs["c"], calls)))
+
+    assert cache.contains("a") and cache.contains("c")
+    assert not cache.contains("b")
+    assert cache.stats()["evictions"] == 1
+    assert not (tmp_path / "cache" / "b").exists()
+
+    reloaded = BlobCache(str(tmp_path / "cache"), 2500, 4096)
+    assert reloaded.stats()["entries"] == 2
+
+
+def test_workers_share_the_cache_directory(tmp_path):
+    # Two workers (processes) with their own index over one directory.
+    first = BlobCache(str(tmp_path / "cache"), 10_000, 4096)
+    data = b"x" * 1000
+    calls = []
+    assert b"".join(first.iter_range("a", _source(data, calls))) == data
+    second = BlobCache(str(tmp_path / "cache"), 10_000, 4096)
+    assert second.contains("a")
+
+    # The first worker evicts the blob; the second refills it on its next hit.
+    os.unlink(tmp_path / "cache" / "a")
+    assert b"".join(second.iter_range("a", _source(data, calls))) == data
+    assert calls == [1, 1]
+    assert second.stats()["misses"] == 1
+    assert second.stats()["entries"] == 1
+
+    # A worker starting up leaves other workers' fills alone.
+    live = tmp_path / "cache" / "b.4242.partial"
+    live.write_bytes(b"partial")
+    abandoned = tmp_path / "cache" / "c.4243.partial"
+    abandoned.write_bytes(b"partial")
+    old = time.time() - 2 * STALE_PARTIAL_AGE
+    os.utime(abandoned, (old, old))
+    assert BlobCache(str(tmp_path / "cache"), 10_000, 4096).stats()["entries"] == 1
+    assert live.exists()
+    assert not abandoned.exists()
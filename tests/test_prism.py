@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import httpx
+
+from app.config import settings
+from app.prism import (
+    AsyncPrismClient,
+    ImageTarget,
+    PCTarget,
+    PrismClient,
+    prism_runtime,
+)
+
+
+def _target(fake_pc) -> PCTarget:
+    return PCTarget(1, fake_pc.url, "admin", "secret")
+
+
+def _image(image_id: int) -> ImageTarget:
+    return ImageTarget(image_id, f"image-{image_id}", "disk.qcow2", "unused", "0" * 64)
+
+
+def test_sync_facade_reuses_pooled_connections(fake_pc, monkeypatch):
+    monkeypatch.setattr(settings, "pc_validate_hub_source", True)
+    client = PrismClient(_target(fake_pc))
+    for _ in range(20):
+        client.ping()
+    pooled = len(fake_pc.connections)
+
+    fake_pc.connections.clear()
+    for _ in range(20):
+        with httpx.Client(verify=False, timeout=20) as fresh:
+            fresh.post(f"{fake_pc.url}/api/nutanix/v3/clusters/list", json={})
+
+    assert fake_pc.requests["clusters/list"] == 40
+    assert fake_pc.requests["images"] == 20
+    assert pooled == 1
+    assert len(fake_pc.connections) == 20
+    prism_runtime.close(fake_pc.url)
+
+
+def test_async_client_fans_out_within_pool_limits(fake_pc, monkeypatch):
+    monkeypatch.setattr(settings, "pc_validate_hub_source", False)
+    fake_pc.latency = 0.05
+    client = AsyncPrismClient(_target(fake_pc))
+
+    async def burst():
+        await asyncio.gather(*(client.ping() for _ in range(50)))
+
+    started = time.monotonic()
+    prism_runtime.run(burst())
+    elapsed = time.monotonic() - started
+
+    assert fake_pc.requests["clusters/list"] == 50
+    assert len(fake_pc.connections) <= settings.pc_max_connections
+    # Fifty 50 ms requests over ten pooled connections take about 0.25 s.
+    assert elapsed < 50 * 0.05 / 2
+    prism_runtime.close(fake_pc.url)
+
+
+def test_task_watcher_batches_polls_per_pc(fake_pc, monkeypatch):
+    monkeypatch.setattr(settings, "pc_task_poll_min_interval", 0.05)
+    fake_pc.task_polls = 2
+    target = _target(fake_pc)
+    client = AsyncPrismClient(target)
+
+    async def import_all():
+        submissions = await asyncio.gather(
+            *(client.submit_image_import(_image(index)) for index in range(10))
+        )
+        return await asyncio.gather(
+            *(client.wait_for_task(item["task_uuid"]) for item in submissions)
+        )
+
+    tasks = prism_runtime.run(import_all())
+
+    assert [task["status"]["state"] for task in tasks] == ["SUCCEEDED"] * 10
+    assert fake_pc.requests["tasks"] == 0
+    assert fake_pc.requests["tasks/list"] <= 4
+    assert prism_runtime.watcher(target).pending == 0
+    prism_runtime.close(fake_pc.url)
+
+
+def test_task_watcher_backs_off_while_tasks_are_unchanged(fake_pc, monkeypatch):
+    monkeypatch.setattr(settings, "pc_task_poll_min_interval", 0.05)
+    monkeypatch.setattr(settings, "pc_task_poll_max_interval", 0.2)
+    fake_pc.task_polls = 10**6
+    target = _target(fake_pc)
+    client = AsyncPrismClient(target)
+
+    async def watch_briefly():
+        submission = await client.submit_image_import(_image(1))
+        watcher = prism_runtime.watcher(target)
+        watcher.watch(submission["task_uuid"])
+        await asyncio.sleep(1.0)
+        return watcher
+
+    watcher = prism_runtime.run(watch_briefly())
+    # Constant 50 ms polling would make about 20 calls in a second.
+    assert fake_pc.requests["tasks/list"] <= 9
+    assert watcher.interval == 0.2
+    prism_runtime.close(fake_pc.url)
+
+
+def test_task_watcher_rides_out_a_pc_outage(fake_pc, monkeypatch):
+    monkeypatch.setattr(settings, "pc_task_poll_min_interval", 0.05)
+    monkeypatch.setattr(settings, "pc_task_poll_max_interval", 0.2)
+    fake_pc.task_polls = 1
+    target = _target(fake_pc)
+    client = AsyncPrismClient(target)
+    watcher = prism_runtime.watcher(target)
+    list_tasks = watcher.client.list_tasks
+    outages = [httpx.ConnectError("PC restarting")] * 2
+
+    async def flaky_list_tasks(task_uuids):
+        if outages:
+            raise outages.pop()
+        return await list_tasks(task_uuids)
+
+    monkeypatch.setattr(watcher.client, "list_tasks", flaky_list_tasks)
+
+    async def import_one():
+        submission = await client.submit_image_import(_image(1))
+        # Then the PC answers the next batch polls with 503.
+        fake_pc.unavailable["tasks/list"] = 2
+        return await client.wait_for_task(submission["task_uuid"])
+
+    task = prism_runtime.run(import_one())
+
+    assert task["status"]["state"] == "SUCCEEDED"
+    assert fake_pc.unavailable["tasks/list"] == 0
+    assert watcher.failures == 0
+    assert watcher.pending == 0
+    prism_runtime.close(fake_pc.url)
+
+
+def test_task_watcher_stops_polling_tasks_nobody_waits_for(fake_pc, monkeypatch):
+    monkeypatch.setattr(settings, "pc_task_poll_min_interval", 0.05)
+    fake_pc.task_polls = 10**6
+    target = _target(fake_pc)
+    client = AsyncPrismClient(target)
+    watcher = prism_runtime.watcher(target)
+
+    async def give_up():
+        first, second = await asyncio.gather(
+            *(client.submit_image_import(_image(index)) for index in range(2))
+        )
+        try:
+            await client.wait_for_task(first["task_uuid"], timeout_seconds=0.2)
+        except RuntimeError:
+            pass
+        timed_out = watcher.pending
+        waiting = asyncio.ensure_future(client.wait_for_task(second["task_uuid"]))
+        await asyncio.sleep(0.1)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return timed_out
+
+    assert prism_runtime.run(give_up()) == 0
+    assert watcher.pending == 0
+    prism_runtime.close(fake_pc.url)
@@ -0,0 +1,149 @@
+import hashlib
+import os
+
+import pytest
+
+moto = pytest.importorskip("moto")
+from botocore.exceptions import ClientError  # noqa: E402
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+@pytest.fixture
+def s3_storage(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    from app.config import settings
+    from app.storage import StorageClient
+
+    monkeypatch.setattr(settings, "storage_backend", "s3")
+    monkeypatch.setattr(settings, "local_storage_path", str(tmp_path / "storage"))
+    monkeypatch.setattr(settings, "s3_bucket", "images")
+    monkeypatch.setattr(settings, "s3_region", "us-east-1")
+    monkeypatch.setattr(settings, "s3_endpoint_url", None)
+    monkeypatch.setattr(settings, "s3_multipart_part_size", PART_SIZE)
+    monkeypatch.setattr(settings, "s3_multipart_concurrency", 3)
+
+    with moto.mock_aws():
+        client = StorageClient()
+        client.s3.create_bucket(Bucket="images")
+        yield client
+
+
+def _payload(size: int) -> bytes:
+    return os.urandom(size)
+
+
+def _save(storage, data: bytes):
+    staged = storage.stage(data)
+    return storage.commit(staged), staged.digest
+
+
+def test_s3_save_uses_multipart_for_large_streams(s3_storage, tmp_path):
+    data = _payload(PART_SIZE * 2 + 1234)
+    calls = []
+    upload_part = s3_storage.s3.upload_part
+
+    def counting_upload_part(**kwargs):
+        calls.append(kwargs["PartNumber"])
+        return upload_part(**kwargs)
+
+    s3_storage.s3.upload_part = counting_upload_part
+    uri, digest = _save(s3_storage, data)
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert sorted(calls) == [1, 2, 3]
+    bucket, key = s3_storage.parse_s3_uri(uri)
+    body = s3_storage.s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    assert body == data
+    listing = s3_storage.s3.list_objects_v2(Bucket="images")
+    assert [item["Key"] for item in listing["Contents"]] == [key]
+
+
+def test_s3_multipart_retries_failed_parts(s3_storage, monkeypatch):
+    monkeypatch.setattr("app.storage.time.sleep", lambda _: None)
+    data = _payload(PART_SIZE * 2)
+    failures = {1: 1, 2: 2}
+    upload_part = s3_storage.s3.upload_part
+
+    def flaky_upload_part(**kwargs):
+        number = kwargs["PartNumber"]
+        if failures.get(number):
+            failures[number] -= 1
+            raise ClientError({"Error": {"Code": "SlowDown"}}, "UploadPart")
+        return upload_part(**kwargs)
+
+    s3_storage.s3.upload_part = flaky_upload_part
+    uri, digest = _save(s3_storage, data)
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert failures == {1: 0, 2: 0}
+
+
+def test_s3_multipart_aborts_on_persistent_failure(s3_storage, monkeypatch):
+    monkeypatch.setattr("app.storage.time.sleep", lambda _: None)
+    data = _payload(PART_SIZE * 2)
+
+    def failing_upload_part(**kwargs):
+        raise ClientError({"Error": {"Code": "InternalError"}}, "UploadPart")
+
+    s3_storage.s3.upload_part = failing_upload_part
+    with pytest.raises(ClientError):
+        _save(s3_storage, data)
+
+    uploads = s3_storage.s3.list_multipart_uploads(Bucket="images")
+    assert not uploads.get("Uploads")
+    assert not s3_storage.s3.list_objects_v2(Bucket="images").get("Contents")
+
+
+def test_s3_iter_range_uses_ranged_get(s3_storage):
+    data = _payload(4096)
+    uri, _ = _save(s3_storage, data)
+    ranges = []
+    get_object = s3_storage.s3.get_object
+
+    def recording_get_object(**kwargs):
+        ranges.append(kwargs.get("Range"))
+        return get_object(**kwargs)
+
+    s3_storage.s3.get_object = recording_get_object
+    assert b"".join(s3_storage.iter_range(uri, 100, 199)) == data[100:200]
+    assert b"".join(s3_storage.iter_range(uri)) == data
+    assert ranges == ["bytes=100-199", None]
+    assert s3_storage.stat(uri) == (s3_storage.parse_s3_uri(uri)[1].split("/")[-1], 4096)
+
+
+def test_s3_stage_skips_known_blobs_before_completing(s3_storage):
+    data = _payload(PART_SIZE + 10)
+    staged = s3_storage.stage(data, known=lambda digest: True)
+
+    assert staged.location is None
+    assert staged.digest == hashlib.sha256(data).hexdigest()
+    assert not s3_storage.s3.list_objects_v2(Bucket="images").get("Contents")
+    uploads = s3_storage.s3.list_multipart_uploads(Bucket="images")
+    assert not uploads.get("Uploads")
+
+
+def test_maintenance_removes_stale_uploads_and_staging_objects(s3_storage, monkeypatch):
+    from app import maintenance
+    from app.config import settings
+
+    monkeypatch.setattr(maintenance, "storage_client", s3_storage)
+    s3_storage.s3.create_multipart_upload(Bucket="images", Key=".staging/crashed")
+    uri, _ = _save(s3_storage, _payload(1024))
+    s3_storage.s3.put_object(Bucket="images", Key=".staging/orphan", Body=b"x")
+    assert s3_storage.remove_stale_staging(3600) == 0
+    # moto reports every upload as initiated in 2010.
+    assert s3_storage.abort_stale_uploads(100 * 365 * 24 * 3600) == 0
+
+    monkeypatch.setattr(settings, "s3_stale_upload_age", 3600)
+    assert maintenance.maintenance.run_once()["stale_multipart_uploads"] == 1
+    assert not s3_storage.s3.list_multipart_uploads(Bucket="images").get("Uploads")
+
+    monkeypatch.setattr(settings, "s3_stale_upload_age", 0)
+    assert maintenance.maintenance.run_once()["stale_staging_objects"] == 1
+    listing = s3_storage.s3.list_objects_v2(Bucket="images")
+    _, key = s3_storage.parse_s3_uri(uri)
+    assert [item["Key"] for item in listing["Contents"]] == [key]
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+
+from app.throttle import DownloadScheduler, TokenBucket
+
+
+async def _drain(scheduler: DownloadScheduler, key: str, chunks: list) -> float:
+    started = time.monotonic()
+    async for _ in scheduler.stream(key, iter(chunks)):
+        pass
+    return time.monotonic() - started
+
+
+def test_token_bucket_allows_burst_then_paces():
+    bucket = TokenBucket(rate=1000, burst=1000)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(500) == pytest.approx(0.5, abs=0.05)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_bandwidth_per_client():
+    scheduler = DownloadScheduler(client_bandwidth=20_000)
+    chunks = [b"x" * 5_000] * 6
+
+    elapsed = await asyncio.gather(
+        _drain(scheduler, "pc-a", chunks), _drain(scheduler, "pc-b", chunks)
+    )
+
+    # Each client spends its 20 kB burst, then waits out the other 10 kB; the
+    # two clients do not share a bucket.
+    assert all(0.4 < seconds < 0.9 for seconds in elapsed)
+    stats = scheduler.stats()
+    assert stats["bytes"] == 60_000
+    assert stats["completed"] == 2
+    assert stats["active"] == 0
+    assert stats["clients"] == {}
+    assert stats["throughput_bytes_per_second"] == 60_000 / 10
+
+
+@pytest.mark.asyncio
+async def test_scheduler_queues_transfers_over_the_concurrency_limit():
+    scheduler = DownloadScheduler(max_concurrency=2, client_concurrency=1)
+    release = asyncio.Event()
+    seen = []
+
+    async def pull(key: str) -> None:
+        stream = scheduler.stream(key, iter([b"a", b"b"]))
+        seen.append((key, await stream.__anext__()))
+        await release.wait()
+        async for _ in stream:
+            pass
+
+    pulls = [asyncio.ensure_future(pull(key)) for key in ("pc-a", "pc-a", "pc-b", "pc-c")]
+    await asyncio.sleep(0.1)
+    stats = scheduler.stats()
+    assert stats["active"] == 2
+    assert stats["queued"] == 2
+    assert stats["clients"]["pc-a"] == {"active": 1, "queued": 1, "bytes": 1}
+
+    release.set()
+    await asyncio.gather(*pulls)
+    assert len(seen) == 4
+    assert scheduler.stats()["completed"] == 4